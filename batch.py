@@ -0,0 +1,94 @@
+import argparse
+import hashlib
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from main import run_target
+from scheduler.stages import configure_stage_limits
+from tracing import tracer
+
+CONFIG_SUFFIX = "_config.json"
+PREBUILD_SUFFIX = "_prebuild.sh"
+
+
+def find_prebuild_script(json_file_path):
+    """
+    Return the prebuild script of a configuration, found by the naming convention of the examples:
+    `targets/libpng_config.json` is built by `targets/libpng_prebuild.sh`.
+    """
+    if not json_file_path.endswith(CONFIG_SUFFIX):
+        raise RuntimeError(f"Cannot derive the prebuild script of {json_file_path}: expected a name ending "
+                           f"with {CONFIG_SUFFIX}")
+    return json_file_path[:-len(CONFIG_SUFFIX)] + PREBUILD_SUFFIX
+
+
+def get_checkpoint_path(checkpoint_dir, json_file_path):
+    """
+    Return the checkpoint file of a target. The name carries a hash of the absolute path of the configuration, so
+    that targets whose configurations have the same name in different directories do not share a checkpoint.
+    """
+    name = os.path.splitext(os.path.basename(json_file_path))[0]
+    path_hash = hashlib.sha256(os.path.abspath(json_file_path).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(checkpoint_dir, f"{name}_{path_hash}.json")
+
+
+def run_batch(json_file_paths, checkpoint_dir, fresh=False):
+    """
+    Process several targets at the same time. Each target runs its own refinement loop; the prebuilds, compiles and
+    fuzzer runs of all targets share the stage limits set by `configure_stage_limits`, and the LLM requests share
+    the limit of the LLM client.
+    Args:
+        json_file_paths (list): Paths to the configuration files.
+        checkpoint_dir (str): Directory of the per-target checkpoints, so that a killed batch can resume.
+        fresh (bool): Ignore existing checkpoints and start every target from scratch.
+    Returns:
+        dict: `{json_file_path: success}`.
+    """
+    def run_one(json_file_path):
+        checkpoint_path = get_checkpoint_path(checkpoint_dir, json_file_path)
+        if fresh and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        try:
+            return run_target(json_file_path, find_prebuild_script(json_file_path), checkpoint_path,
+                              concurrent_targets=len(json_file_paths))
+        except Exception as e:
+            print(f"Error: {json_file_path} failed: {type(e).__name__}: {e}")
+            return False
+
+    with ThreadPoolExecutor(max_workers=len(json_file_paths)) as executor:
+        results = list(executor.map(run_one, json_file_paths))
+    return dict(zip(json_file_paths, results))
+
+
+if __name__ == "__main__":
+    cpu_count = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Generate fuzz drivers for several targets at the same time.")
+    parser.add_argument("configs", nargs="+", help="configuration files, e.g. targets/*_config.json")
+    parser.add_argument("--prebuild-jobs", type=int, default=cpu_count, help="concurrent prebuilds")
+    parser.add_argument("--llm-jobs", type=int, default=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+                        help="concurrent LLM requests")
+    parser.add_argument("--compile-jobs", type=int, default=cpu_count, help="concurrent syntax checks and builds")
+    parser.add_argument("--fuzz-jobs", type=int, default=cpu_count,
+                        help="concurrent fuzzer runs, `fuzz_jobs: auto` splits the cores between them")
+    parser.add_argument("--checkpoint-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                 "outputs", "checkpoints"),
+                        help="directory of the per-target checkpoints")
+    parser.add_argument("--fresh", action="store_true", help="ignore existing checkpoints")
+    arguments = parser.parse_args()
+
+    # read when the LLM client is created, on the first request
+    os.environ["LLM_MAX_CONCURRENCY"] = str(arguments.llm_jobs)
+    configure_stage_limits({
+        "prebuild": arguments.prebuild_jobs,
+        "compile": arguments.compile_jobs,
+        "fuzz": arguments.fuzz_jobs,
+    })
+    results = run_batch(arguments.configs, arguments.checkpoint_dir, arguments.fresh)
+    print(f"Run report written to {tracer.write_report(label='batch')}")
+
+    print("Batch summary:")
+    for json_file_path, success in results.items():
+        print(f"  {json_file_path}: {'valid driver' if success else 'failed'}")
+    if not all(results.values()):
+        sys.exit(1)
@@ -0,0 +1,376 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+current_file_path = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(current_file_path)
+RECORDINGS_DIR = current_file_path + "/recordings"
+DEFAULT_RESULTS_DIR = REPO_ROOT + "/outputs/benchmarks"
+CONFIG_SUFFIX = "_config.json"
+
+# A benchmark is a regression when its median grows by more than this fraction compared to the baseline
+DEFAULT_THRESHOLD = 0.10
+
+# Runs a single target in a fresh process and writes its trace report, see `run_end_to_end`
+RUN_TARGET_CODE = (
+    "import sys, main\n"
+    "from tracing import tracer\n"
+    "success = main.run_target(*sys.argv[1:5])\n"
+    "tracer.write_report(label='benchmark')\n"
+    "sys.exit(0 if success else 1)\n"
+)
+
+
+def measure(function, repeat, warmup=1):
+    """
+    Time a function.
+    Args:
+        function (callable): Called without arguments.
+        repeat (int): Number of timed calls.
+        warmup (int): Number of untimed calls before, to fill caches that every real run would have filled.
+    Returns:
+        dict: `min`, `median`, `mean` and `max` of the wall time in seconds, and `repeat`.
+    """
+    for _ in range(warmup):
+        function()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {"repeat": repeat, "min": min(times), "median": statistics.median(times), "mean": statistics.mean(times),
+            "max": max(times)}
+
+
+def load_recorded_drivers():
+    """Return the LLM responses of every bundled recording, used as fixed inputs whether or not they are keyed."""
+    responses = []
+    for recording_path in sorted(glob.glob(os.path.join(RECORDINGS_DIR, "*.json"))):
+        with open(recording_path, "r") as file:
+            responses += [entry["response"] for entry in json.load(file)["responses"]]
+    return responses
+
+
+def make_coverage_export(path, num_files=60, functions_per_file=40, seed=0):
+    """
+    Write a deterministic synthetic `llvm-cov export` JSON with function regions, roughly the size of the export
+    of a driver linked against one of the bundled libraries.
+    """
+    rng = random.Random(seed)
+    files = []
+    functions = []
+    for file_number in range(num_files):
+        filename = f"/src/lib/file{file_number}.c"
+        counts = {}
+        for metric in ("lines", "functions", "regions", "branches"):
+            count = rng.randint(50, 2000)
+            covered = rng.randint(0, count)
+            counts[metric] = {"count": count, "covered": covered, "percent": 100.0 * covered / count}
+        files.append({"filename": filename, "summary": counts})
+        for function_number in range(functions_per_file):
+            regions = []
+            line = function_number * 50 + 1
+            for _ in range(rng.randint(2, 30)):
+                # line_start, col_start, line_end, col_end, execution_count, file_id, expanded_file_id, kind
+                regions.append([line, 1, line + rng.randint(0, 6), 2, rng.choice([0, 0, 1, 17]), 0, 0, 0])
+                line += 7
+            functions.append({"name": f"function_{file_number}_{function_number}", "count": rng.choice([0, 3]),
+                              "filenames": [filename], "regions": regions})
+    totals = {metric: {"count": sum(f["summary"][metric]["count"] for f in files),
+                       "covered": sum(f["summary"][metric]["covered"] for f in files)}
+              for metric in ("lines", "functions", "regions", "branches")}
+    for value in totals.values():
+        value["percent"] = 100.0 * value["covered"] / value["count"]
+    with open(path, "w") as file:
+        json.dump({"data": [{"files": files, "functions": functions, "totals": totals}],
+                   "type": "llvm.coverage.json.export", "version": "2.0.1"}, file)
+
+
+def make_compiler_log(num_errors=150, seed=0):
+    """Return a deterministic synthetic clang error log with cascading and repeated errors."""
+    rng = random.Random(seed)
+    symbols = [f"png_symbol_{number}" for number in range(25)]
+    lines = []
+    for number in range(num_errors):
+        line = rng.randint(1, 400)
+        symbol = rng.choice(symbols)
+        lines.append(f"driver.c:{line}:5: error: use of undeclared identifier '{symbol}'")
+        lines.append(f"  {line} |     {symbol}(ptr, {number});")
+        lines.append("      |     ^")
+        if number % 7 == 0:
+            lines.append(f"driver.c:{line}:12: error: expected ';' after expression")
+    lines.append(f"{num_errors} errors generated.")
+    return "\n".join(lines)
+
+
+def make_interfaces(count=300, seed=0):
+    """Return deterministic synthetic interfaces in the format of `extract_interface_info`."""
+    rng = random.Random(seed)
+    types = ["png_structp", "png_infop", "int", "size_t", "const char *", "png_bytep", "double"]
+    return [{
+        "function_name": f"png_function_{number}",
+        "parameters": [{"type": rng.choice(types), "name": f"arg{k}"} for k in range(rng.randint(0, 6))],
+        "seen_line": [rng.randint(1, 5000) for _ in range(rng.randint(1, 12))],
+    } for number in range(count)]
+
+
+def run_micro_benchmarks(repeat, work_dir):
+    """
+    Run the micro-benchmarks of the pipeline stages that do not need the LLM or the compiler. Stages whose optional
+    dependencies (libclang, an unpacked target) are missing are reported as skipped.
+    Returns:
+        dict: `{name: timings}` as returned by `measure`, or `{name: {"skipped": reason}}`.
+    """
+    from candidate_generator.candidate_gen import CandidateGenerator, StreamingCodeExtractor
+    from candidate_generator.fingerprint import fingerprint_driver
+    from prompt_generator.prompt_gen import generate_compiler_error_prompt, generate_gpt_prompt, \
+        scan_static_or_macro_functions
+    from refiner.cov_digest import summarize_uncovered
+    from refiner.cov_extractor import extract_coverage_percentage
+    from refiner.cov_model import parse_coverage_export
+    from refiner.err_extractor import summarize_compiler_errors
+
+    results = {}
+    model_code_path = REPO_ROOT + "/prompt_generator/model.c"
+
+    # extractor: one full libclang parse of every unpacked target file
+    try:
+        from extractor.extractor import extract_translation_unit_info
+    except ImportError as e:
+        extract_translation_unit_info = None
+        results["extractor.extract_translation_unit_info"] = {"skipped": f"libclang is not available: {e}"}
+    for config_path in sorted(glob.glob(REPO_ROOT + "/targets/*" + CONFIG_SUFFIX)):
+        with open(config_path, "r") as file:
+            config = json.load(file)
+        target_file = os.path.join(REPO_ROOT, config["target_file"])
+        name = f"extractor.extract_translation_unit_info[{config['target_name']}]"
+        if extract_translation_unit_info is None:
+            continue
+        if not os.path.exists(target_file):
+            results[name] = {"skipped": f"{config['target_file']} does not exist, run the prebuild first"}
+            continue
+        results[name] = measure(lambda: extract_translation_unit_info(target_file), repeat)
+
+    # the same lexer scan the prompt generator falls back to when libclang is missing
+    source_paths = [path for path in glob.glob(REPO_ROOT + "/targets/*/*.c")][:3]
+    if source_paths:
+        sources = []
+        for source_path in source_paths:
+            with open(source_path, "r", errors="replace") as file:
+                sources.append(file.read())
+        results["prompt_gen.scan_static_or_macro_functions"] = measure(
+            lambda: [scan_static_or_macro_functions(source) for source in sources], repeat)
+
+    # prompt generator
+    interfaces = make_interfaces()
+    results["prompt_gen.generate_gpt_prompt"] = measure(
+        lambda: generate_gpt_prompt(interfaces, "libpng", "pngread", model_code_path), repeat)
+    results["prompt_gen.generate_gpt_prompt[token_budget]"] = measure(
+        lambda: generate_gpt_prompt(interfaces, "libpng", "pngread", model_code_path, token_budget=3000), repeat)
+    compiler_log = make_compiler_log()
+    error_log_path = os.path.join(work_dir, "error_log.txt")
+    with open(error_log_path, "w") as file:
+        file.write(compiler_log)
+    drivers = load_recorded_drivers()
+    results["prompt_gen.generate_compiler_error_prompt"] = measure(
+        lambda: generate_compiler_error_prompt(drivers[0], "libpng", "pngread", error_log_path,
+                                               model_code_path), repeat)
+
+    # candidate generator
+    generator = CandidateGenerator()
+    results["candidate_gen.generate_driver"] = measure(
+        lambda: [generator.generate_driver(response, {"required_headers": []}) for response in drivers], repeat)
+
+    def stream_all():
+        for response in drivers:
+            extractor = StreamingCodeExtractor()
+            for start in range(0, len(response), 16):
+                if extractor.feed(response[start:start + 16]):
+                    break
+    results["candidate_gen.StreamingCodeExtractor"] = measure(stream_all, repeat)
+    results["fingerprint.fingerprint_driver"] = measure(lambda: [fingerprint_driver(code) for code in drivers], repeat)
+
+    # refiner
+    export_path = os.path.join(work_dir, "coverage_functions.json")
+    make_coverage_export(export_path)
+    results["cov_model.parse_coverage_export"] = measure(lambda: parse_coverage_export(export_path), repeat)
+    results["cov_extractor.extract_coverage_percentage"] = measure(
+        lambda: extract_coverage_percentage(export_path), repeat)
+    results["cov_digest.summarize_uncovered"] = measure(
+        lambda: summarize_uncovered(export_path, drivers[-1]), repeat)
+    results["err_extractor.summarize_compiler_errors"] = measure(
+        lambda: summarize_compiler_errors(compiler_log), repeat)
+    return results
+
+
+def run_end_to_end(config_paths, repeat, work_dir):
+    """
+    Measure the time to a valid driver of each target, with the LLM replaced by the target's recording in
+    `benchmarks/recordings`. Every repetition runs `main.run_target` in a fresh process with its own output
+    directory, validation store, response cache and driver object cache, so no state is carried over between
+    repetitions or from earlier runs. The prebuild and the instrumented libraries are built (and cached) before
+    the timed runs.
+    Returns:
+        dict: `{name: result}`, where a result has the timings of `measure`-like `min`/`median`/`mean`/`max`, the
+        `successes`, the `iterations` of each repetition and the per-stage wall time of the last one, or
+        `{"skipped": reason}`.
+    """
+    from llm_model.replay import ReplayBackend
+    from prebuild.prebuild_cache import run_prebuild
+    from validator.incremental_build import prepare_incremental_build
+
+    results = {}
+    for config_path in config_paths:
+        prefix = os.path.basename(config_path)[:-len(CONFIG_SUFFIX)]
+        name = f"end_to_end[{prefix}]"
+        recording_path = os.path.join(RECORDINGS_DIR, prefix + ".json")
+        prebuild_path = config_path[:-len(CONFIG_SUFFIX)] + "_prebuild.sh"
+        with open(config_path, "r") as file:
+            config = json.load(file)
+        missing = [tool for tool in (config["compile_command"][0], "llvm-profdata", "llvm-cov")
+                   if shutil.which(tool) is None]
+        if not os.path.exists(recording_path):
+            results[name] = {"skipped": f"no recording at {recording_path}"}
+            continue
+        try:
+            ReplayBackend(recording_path)
+        except RuntimeError as e:
+            results[name] = {"skipped": str(e)}
+            continue
+        if missing:
+            results[name] = {"skipped": f"missing tools: {', '.join(missing)}"}
+            continue
+        if not run_prebuild(prebuild_path):
+            results[name] = {"skipped": f"prebuild {prebuild_path} failed"}
+            continue
+        if config.get("incremental_build", True):
+            compile_commands_path = config.get("compile_commands_path")
+            prepare_incremental_build(config["compile_command"],
+                                      os.path.dirname(os.path.join(REPO_ROOT, config["target_file"])),
+                                      compile_commands_path and os.path.join(REPO_ROOT, compile_commands_path))
+
+        times = []
+        successes = 0
+        iterations = []
+        stages = {}
+        for repetition in range(repeat):
+            run_dir = tempfile.mkdtemp(prefix=f"{prefix}_{repetition}_", dir=work_dir)
+            checkpoint_path = os.path.join(run_dir, "checkpoint.json")
+            env = dict(os.environ,
+                       LLM_REPLAY_PATH=recording_path,
+                       VALIDATION_STORE_PATH=os.path.join(run_dir, "results.sqlite3"),
+                       LLM_CACHE_PATH=os.path.join(run_dir, "responses.sqlite3"),
+                       TRACE_DIR=os.path.join(run_dir, "traces"),
+                       OBJECT_CACHE_DIR=os.path.join(run_dir, "objects"))
+            start = time.perf_counter()
+            process = subprocess.run([sys.executable, "-c", RUN_TARGET_CODE, config_path, prebuild_path,
+                                      checkpoint_path, os.path.join(run_dir, "outputs")],
+                                     cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL)
+            times.append(time.perf_counter() - start)
+            successes += process.returncode == 0
+            if os.path.exists(checkpoint_path):
+                with open(checkpoint_path, "r") as file:
+                    iterations.append(json.load(file)["iteration"])
+            for report_path in glob.glob(os.path.join(run_dir, "traces", "*[0-9].json")):
+                with open(report_path, "r") as file:
+                    stages = {stage: stats["wall"] for stage, stats in json.load(file)["summary"].items()}
+        results[name] = {"repeat": repeat, "min": min(times), "median": statistics.median(times),
+                         "mean": statistics.mean(times), "max": max(times), "successes": successes,
+                         "iterations": iterations, "stages": stages}
+    return results
+
+
+def compare_results(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare the medians of two benchmark results.
+    Returns:
+        list: `(name, baseline_median, median, change)` for every benchmark measured in both, where `change` is the
+        relative change of the median (positive is slower).
+    """
+    comparison = []
+    for name, result in results["benchmarks"].items():
+        previous = baseline["benchmarks"].get(name)
+        if "median" not in result or not previous or "median" not in previous:
+            continue
+        change = (result["median"] - previous["median"]) / previous["median"] if previous["median"] else 0.0
+        comparison.append((name, previous["median"], result["median"], change))
+    return comparison
+
+
+def get_environment():
+    """Describe the machine and the revision the benchmarks ran on."""
+    try:
+        revision = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True,
+                                  check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = "unknown"
+    return {"revision": revision, "python": platform.python_version(), "platform": platform.platform(),
+            "cpu_count": os.cpu_count()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the offline benchmarks of the pipeline.")
+    parser.add_argument("--micro", action="store_true", help="only run the micro-benchmarks")
+    parser.add_argument("--e2e", action="store_true", help="only run the end-to-end benchmarks")
+    parser.add_argument("--targets", nargs="*", default=None,
+                        help="configurations of the end-to-end benchmarks (default: targets/*_config.json)")
+    parser.add_argument("--repeat", type=int, default=None,
+                        help="repetitions per benchmark (default: 20 for micro-benchmarks, 1 end-to-end)")
+    parser.add_argument("--output", default=None, help="result file (default: outputs/benchmarks/<time>.json)")
+    parser.add_argument("--compare", default=None, help="earlier result file to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="relative slowdown of the median reported as a regression")
+    arguments = parser.parse_args()
+
+    sys.path.insert(0, REPO_ROOT)
+    run_micro = arguments.micro or not arguments.e2e
+    run_e2e = arguments.e2e or not arguments.micro
+    benchmarks = {}
+    work_dir = tempfile.mkdtemp(prefix="benchmarks_")
+    try:
+        if run_micro:
+            benchmarks.update(run_micro_benchmarks(arguments.repeat or 20, work_dir))
+        if run_e2e:
+            config_paths = arguments.targets or sorted(glob.glob(REPO_ROOT + "/targets/*" + CONFIG_SUFFIX))
+            benchmarks.update(run_end_to_end([os.path.abspath(path) for path in config_paths],
+                                             arguments.repeat or 1, work_dir))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {"created": time.strftime("%Y-%m-%d %H:%M:%S"), "environment": get_environment(),
+               "benchmarks": benchmarks}
+    output_path = arguments.output or os.path.join(DEFAULT_RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "w") as file:
+        json.dump(results, file, indent=2)
+
+    for name, result in benchmarks.items():
+        if "skipped" in result:
+            print(f"{name:<55} skipped: {result['skipped']}")
+        else:
+            print(f"{name:<55} median {result['median'] * 1000:10.3f} ms  (min {result['min'] * 1000:.3f} ms, "
+                  f"{result['repeat']} runs)")
+    print(f"Results written to {output_path}")
+
+    if arguments.compare:
+        with open(arguments.compare, "r") as file:
+            baseline = json.load(file)
+        regressions = 0
+        print(f"Compared to {arguments.compare} ({baseline['environment']['revision'][:12]}):")
+        for name, previous, current, change in compare_results(results, baseline, arguments.threshold):
+            marker = ""
+            if change > arguments.threshold:
+                marker = "  REGRESSION"
+                regressions += 1
+            print(f"{name:<55} {previous * 1000:10.3f} ms -> {current * 1000:10.3f} ms  {change:+7.1%}{marker}")
+        if regressions:
+            sys.exit(1)
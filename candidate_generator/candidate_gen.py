@@ -2,7 +2,12 @@
 from typing import Dict, List, Optional
 import re
 import logging
-import os
+
+
+CODE_FENCE = "```"
+# Info strings of the code blocks that hold the driver
+CODE_LANGUAGES = ("c", "cpp", "c++")
+C_BLOCK_PATTERN = re.compile(r"```(?:c|cpp|c\+\+)[ \t]*\n([\s\S]*?)\s*```", re.IGNORECASE)
 
 
 class CandidateGenerator:
@@ -38,12 +43,6 @@ class CandidateGenerator:
             # 格式化代码
             code = self._format_code(code)
 
-            # 将代码写入文件
-            output_path = '../outputs/temp/candidate_fuzz_drivers/raw.c'
-            os.makedirs(os.path.dirname(output_path), exist_ok=True)
-            with open(output_path, 'w') as file:
-                file.write(code)
-
             return code
 
         except Exception as e:
@@ -51,9 +50,11 @@ class CandidateGenerator:
             return None
 
     def _extract_code(self, llm_response: str) -> Optional[str]:
-        """提取LLM响应中的代码部分"""
-        code_pattern = r"```(?:cpp|c|C)?\s*([\s\S]*?)\s*```"
-        matches = re.findall(code_pattern, llm_response)
+        """提取LLM响应中的代码部分，优先选择第一个 c/cpp 代码块"""
+        matches = C_BLOCK_PATTERN.findall(llm_response)
+        if not matches:
+            code_pattern = r"```(?:cpp|c|C)?\s*([\s\S]*?)\s*```"
+            matches = re.findall(code_pattern, llm_response)
         return matches[0] if matches else llm_response
 
     def _add_headers(self, code: str, api_info: Dict) -> str:
@@ -203,6 +204,60 @@ static void cleanup() {
         return re.sub(fuzzer_pattern, f'\\1\n{insert_code}', code)
 
 
+class StreamingCodeExtractor:
+    """
+    Incremental counterpart of `CandidateGenerator._extract_code` for streamed LLM responses.
+
+    Chunks are fed as they arrive; `feed` reports when the first fenced `c`/`cpp` code block has closed, which is
+    the block `CandidateGenerator` picks, so the request can be aborted instead of waiting for the explanation that
+    usually follows the code. Blocks in other languages (e.g. a build command) do not stop the stream. The chunks
+    are kept in a list, and each call only scans the new text plus the unfinished end of the previous ones (a fence
+    split across chunks, or an opening fence whose info string is incomplete).
+    """
+
+    def __init__(self):
+        self.block_end = None  # index just after the closing fence of the first c/cpp code block
+        self._chunks = []
+        self._pending = ""     # text not fully scanned yet
+        self._offset = 0       # index of `_pending` in the whole response
+        self._language = None  # info string of the open code block, None outside a block
+
+    def _consume(self, length):
+        self._offset += length
+        self._pending = self._pending[length:]
+
+    def feed(self, chunk: str) -> bool:
+        """Append a chunk of the response. Return True once the first c/cpp code block is complete."""
+        if self.block_end is not None:
+            return True
+        self._chunks.append(chunk)
+        self._pending += chunk
+        while True:
+            index = self._pending.find(CODE_FENCE)
+            if index < 0:
+                self._consume(max(0, len(self._pending) - len(CODE_FENCE) + 1))
+                return False
+            if self._language is None:
+                # opening fence, its info string ends at the end of the line
+                newline = self._pending.find("\n", index + len(CODE_FENCE))
+                if newline < 0:
+                    self._consume(index)
+                    return False
+                self._language = self._pending[index + len(CODE_FENCE):newline].strip().lower()
+                self._consume(newline + 1)
+            elif self._language in CODE_LANGUAGES:
+                self.block_end = self._offset + index + len(CODE_FENCE)
+                return True
+            else:
+                self._language = None
+                self._consume(index + len(CODE_FENCE))
+
+    @property
+    def response(self) -> str:
+        """The response up to and including the first complete c/cpp code block, or everything received so far."""
+        text = "".join(self._chunks)
+        return text[:self.block_end] if self.block_end is not None else text
+
 
 if __name__ == "__main__":
     # Example usage
@@ -0,0 +1,98 @@
+import hashlib
+import re
+
+# libclang is optional here, without it the drivers are tokenized by the regular expression below
+try:
+    from clang.cindex import Index, TokenKind, TranslationUnit
+except ImportError:
+    Index = None
+
+# Fallback lexer: comments are matched so they can be dropped, everything else is a token
+TOKEN_PATTERN = re.compile(r"""
+    (?P<comment>/\*.*?\*/|//(?:[^\n\\]|\\.)*)
+    |(?P<string>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+    |(?P<number>\.?\d(?:[eEpP][+-]|[\w.])*)
+    |(?P<identifier>[A-Za-z_]\w*)
+    |(?P<punctuation>\.\.\.|<<=|>>=|->|\+\+|--|<<|>>|<=|>=|==|!=|&&|\|\||[-+*/%&|^!=<>]=|\#\#|\S)
+""", re.DOTALL | re.VERBOSE)
+
+
+def lex_with_clang(code: str):
+    """
+    Tokenize C source code with the clang lexer.
+    Returns:
+        list: `(spelling, line, offset)` triples without comments, or None if libclang is not available.
+    """
+    if Index is None:
+        return None
+    try:
+        index = Index.create()
+    except Exception:
+        return None
+    # the lexer works on the raw buffer, headers are never read
+    translation_unit = index.parse("driver.c", args=["-nostdinc"], unsaved_files=[("driver.c", code)],
+                                   options=TranslationUnit.PARSE_INCOMPLETE
+                                   | TranslationUnit.PARSE_SKIP_FUNCTION_BODIES)
+    return [(token.spelling, token.location.line, token.location.offset)
+            for token in translation_unit.cursor.get_tokens() if token.kind != TokenKind.COMMENT]
+
+
+def lex_with_pattern(code: str) -> list:
+    """
+    Tokenize C source code with `TOKEN_PATTERN`, the fallback when libclang is not available.
+    Returns:
+        list: `(spelling, line, offset)` triples without comments.
+    """
+    tokens = []
+    line = 1
+    position = 0
+    for token in TOKEN_PATTERN.finditer(code):
+        line += code.count("\n", position, token.start())
+        position = token.start()
+        if token.lastgroup != "comment":
+            tokens.append((token.group(), line, token.start()))
+    return tokens
+
+
+def normalize_driver(code: str) -> str:
+    """
+    Normalize driver code so that drivers differing only in whitespace or comments become identical: the tokens are
+    joined by single spaces. Preprocessor directives end at a line break, so a directive still ends with a newline.
+    The only whitespace that changes the meaning of a directive is kept: a `(` directly after the name of a
+    `#define` starts the parameters of a function-like macro, `#define X (a)` defines `X` as `(a)`.
+    """
+    # join continued lines first, so every directive is on a single line for both lexers
+    code = code.replace("\\\n", "")
+    tokens = lex_with_clang(code)
+    if tokens is None:
+        tokens = lex_with_pattern(code)
+
+    normalized = []
+    directive = []        # tokens of the current directive
+    directive_line = None
+    previous_line = None
+    previous_end = None
+    for spelling, line, offset in tokens:
+        if directive_line is not None and line != directive_line:
+            normalized.append("\n")
+            directive_line = None
+        if spelling == "#" and line != previous_line:
+            directive_line = line
+            directive = []
+        if directive_line is not None:
+            directive.append(spelling)
+        if directive_line is not None and directive[:2] == ["#", "define"] and len(directive) == 4 \
+                and spelling == "(" and offset == previous_end:
+            normalized[-1] += spelling
+        else:
+            normalized.append(spelling)
+        previous_line = line
+        previous_end = offset + len(spelling)
+    return " ".join(normalized).replace(" \n ", "\n")
+
+
+def fingerprint_driver(code: str) -> str:
+    """
+    Return the fingerprint of a driver: the SHA-256 hash of its normalized code.
+    """
+    return hashlib.sha256(normalize_driver(code).encode("utf-8")).hexdigest()
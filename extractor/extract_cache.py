@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+from functools import lru_cache
+
+from clang.cindex import _CXString, conf
+
+from extractor.extractor import extract_translation_unit_info
+
+current_file_path = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_DIR = current_file_path + "/../outputs/cache/extract"
+
+
+@lru_cache(maxsize=None)
+def get_libclang_version():
+    """
+    Return the version string of the loaded libclang, e.g. `clang version 14.0.0`. The Python bindings do not
+    declare `clang_getClangVersion`, whose default `int` result would be a truncated pointer to the `CXString`,
+    different in every process; it is decoded through `clang_getCString` instead.
+    """
+    try:
+        get_clang_version = conf.lib.clang_getClangVersion
+        get_clang_version.argtypes = []
+        get_clang_version.restype = _CXString
+        return _CXString.from_result(get_clang_version())
+    except Exception:
+        return "unknown"
+
+
+def make_extraction_key(kind, source_paths, parse_args=()):
+    """
+    Build the cache key of an extraction result from the content of its sources, the libclang version and the
+    parse arguments, so that a change to any of them invalidates the cached result.
+    Args:
+        kind (str): Kind of result, e.g. `interfaces`.
+        source_paths (list): Files the result is extracted from.
+        parse_args (list): Arguments passed to libclang.
+    Returns:
+        str: The hex digest used as cache key.
+    """
+    sha256 = hashlib.sha256()
+    sha256.update(json.dumps({"kind": kind, "libclang": get_libclang_version(), "args": list(parse_args)},
+                             sort_keys=True).encode("utf-8"))
+    for source_path in source_paths:
+        with open(source_path, "rb") as file:
+            sha256.update(hashlib.sha256(file.read()).digest())
+    return sha256.hexdigest()
+
+
+def cached_extraction(kind, source_paths, parse_args, compute, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Return a JSON-serializable extraction result from the on-disk cache, computing and storing it on a miss.
+    Results are stored in `<cache_dir>/<kind>/<key[:2]>/<key>.json`.
+    Args:
+        kind (str): Kind of result, e.g. `interfaces`.
+        source_paths (list): Files the result is extracted from.
+        parse_args (list): Arguments passed to libclang.
+        compute (callable): Called without arguments on a miss, returns the result.
+        cache_dir (str): Root directory of the cache.
+    Returns:
+        The cached or freshly computed result.
+    """
+    key = make_extraction_key(kind, source_paths, parse_args)
+    cache_path = os.path.join(cache_dir, kind, key[:2], key + ".json")
+    if os.path.exists(cache_path):
+        with open(cache_path, "r") as file:
+            return json.load(file)
+
+    result = compute()
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(result, file)
+    os.replace(tmp_path, cache_path)
+    return result
+
+
+def cached_extract_translation_unit_info(file_path, parse_args=()):
+    """
+    Cached version of `extract_translation_unit_info`. Repeated runs on an unchanged target skip the clang parse.
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"File not found: {file_path}")
+    return cached_extraction("translation_unit_info", [file_path], parse_args,
+                             lambda: extract_translation_unit_info(file_path, list(parse_args)))
+
+
+def cached_extract_interface_info(file_path, parse_args=()):
+    """
+    Cached version of `extract_interface_info`.
+    """
+    return cached_extract_translation_unit_info(file_path, parse_args)["interfaces"]
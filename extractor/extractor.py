@@ -1,15 +1,18 @@
 import os
 
 # may use `pip install libclang` to install the package
-from clang.cindex import Index, CursorKind
+from clang.cindex import Index, CursorKind, LinkageKind, TranslationUnit
+
+from tracing.tracer import traced
 
 context_lines = 0 # Number of context lines around the function call
 
-def extract_interface_info(file_path):
+def extract_interface_info(file_path, parse_args=None):
     """
     Extract function call information within the main function of a C file using Clang.
     Args:
         file_path (str): Path to the C file.
+        parse_args (list): Optional compiler arguments for libclang, e.g. include paths.
     Returns:
         list: A list of interface information, where each item is a dictionary:
             [
@@ -24,13 +27,30 @@ def extract_interface_info(file_path):
                 ...
             ]
     """
+    return extract_translation_unit_info(file_path, parse_args)["interfaces"]
+
+@traced()
+def extract_translation_unit_info(file_path, parse_args=None):
+    """
+    Extract everything the prompt generator needs from a C file in a single parse: the function calls within the
+    main function, and the names of the static and macro-defined functions of the file (see
+    `collect_static_or_macro_functions`).
+    Args:
+        file_path (str): Path to the C file.
+        parse_args (list): Optional compiler arguments for libclang, e.g. include paths.
+    Returns:
+        dict: `{"interfaces": [...], "static_or_macro_functions": [...]}`, where `interfaces` has the format
+        documented in `extract_interface_info`.
+    """
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"File not found: {file_path}")
 
     index = Index.create()
 
-    # build ast
-    translation_unit = index.parse(file_path)
+    # build ast, once: the translation unit is reused for every lookup below. The detailed preprocessing record
+    # keeps the macro definitions in the AST.
+    translation_unit = index.parse(file_path, args=parse_args,
+                                   options=TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD)
     if not translation_unit:
         raise RuntimeError("Failed to parse the file with Clang.")
 
@@ -38,26 +58,94 @@ def extract_interface_info(file_path):
     interface_info = []
 
     # find the main function
-    for node in translation_unit.cursor.get_children():
-        if node.kind == CursorKind.FUNCTION_DECL and node.spelling == "main":
-            # parse function calls within the main function
-            interface_info = parse_main_function(node,file_path)
-            break
+    main_node = find_function_definition(translation_unit, "main")
+    if main_node is not None:
+        # parse function calls within the main function
+        interface_info = parse_main_function(main_node, translation_unit)
 
     if not interface_info:
         raise ValueError("Main function or function calls not found.")
 
-    return interface_info
+    return {
+        "interfaces": interface_info,
+        "static_or_macro_functions": sorted(collect_static_or_macro_functions(translation_unit, file_path)),
+    }
 
-def parse_function_calls(node, function_calls, function_calls_signature):
+def collect_static_or_macro_functions(translation_unit, file_path):
+    """
+    Collect the names of the static or macro-defined functions of a file from its AST:
+    1. Functions with internal linkage (`static`).
+    2. Functions whose declaration carries an attribute macro such as `XXX_ATTR_YYY`.
+    3. Function-like macros defined in the file.
+    Args:
+        translation_unit (clang.cindex.TranslationUnit): The parsed translation unit.
+        file_path (str): Path to the C file, declarations from included headers are ignored.
+    Returns:
+        set: The function names.
+    """
+    functions = set()
+    main_file = os.path.abspath(file_path)
+    for node in translation_unit.cursor.get_children():
+        if node.location.file is None or os.path.abspath(node.location.file.name) != main_file:
+            continue
+        if node.kind == CursorKind.FUNCTION_DECL:
+            if node.linkage == LinkageKind.INTERNAL:
+                functions.add(node.spelling)
+                continue
+            # tokens before the function name: return type, storage class and attribute macros
+            for token in node.get_tokens():
+                if token.spelling == node.spelling:
+                    break
+                if "_ATTR_" in token.spelling:
+                    functions.add(node.spelling)
+                    break
+        elif node.kind == CursorKind.MACRO_DEFINITION and is_function_like_macro(node):
+            functions.add(node.spelling)
+    return functions
+
+def is_function_like_macro(node):
+    """
+    Whether a macro definition cursor is a function-like macro, i.e. its name is immediately followed by `(`.
+    """
+    if hasattr(node, "is_macro_function_like"):
+        return node.is_macro_function_like()
+    tokens = node.get_tokens()
+    name = next(tokens, None)
+    parenthesis = next(tokens, None)
+    return (name is not None and parenthesis is not None and parenthesis.spelling == "("
+            and parenthesis.extent.start.line == name.extent.end.line
+            and parenthesis.extent.start.column == name.extent.end.column)
+
+def find_function_definition(translation_unit, function_name):
+    """
+    Find a top-level function in the translation unit, preferring its definition over a prototype.
+    Args:
+        translation_unit (clang.cindex.TranslationUnit): The parsed translation unit.
+        function_name (str): Name of the function.
+    Returns:
+        clang.cindex.Cursor: The function cursor, or None if the function is not declared.
+    """
+    declaration = None
+    for node in translation_unit.cursor.get_children():
+        if node.kind == CursorKind.FUNCTION_DECL and node.spelling == function_name:
+            if node.is_definition():
+                return node
+            if declaration is None:
+                declaration = node
+    return declaration
+
+def parse_function_calls(node, function_calls, function_calls_index):
     """
-    Recursively parse function calls in the AST.
+    Parse function calls in the AST below `node`. The AST is walked in pre-order with an explicit stack, so deep
+    ASTs cannot hit Python's recursion limit.
     Args:
-        node (clang.cindex.Cursor): Current AST node
+        node (clang.cindex.Cursor): Root AST node
         function_calls (list): List to store function call information
-        function_calls_signature (set): Set to track unique function signatures
+        function_calls_index (dict): Function call information indexed by call signature, for merging duplicates
     """
-    for child in node.get_children():
+    stack = list(reversed(list(node.get_children())))
+    while stack:
+        child = stack.pop()
         if child.kind == CursorKind.CALL_EXPR:
             # Handle function pointer calls
             function_name = child.spelling
@@ -65,7 +153,6 @@ def parse_function_calls(node, function_calls, function_calls_signature):
                 function_name = '(Anonymous Function)'
 
             parameters = []
-            seen_line = [child.location.line]
 
             # parameter types and names
             for arg in child.get_arguments():
@@ -78,51 +165,48 @@ def parse_function_calls(node, function_calls, function_calls_signature):
                 tuple((_param["type"]) for _param in parameters)
             )
 
-            if call_signature not in function_calls_signature:
-                function_calls_signature.add(call_signature)
-                function_calls.append({
+            call = function_calls_index.get(call_signature)
+            if call is None:
+                call = {
                     "function_name": function_name,
                     "parameters": parameters,
-                    "seen_line": seen_line,
-                })
+                    "seen_line": [child.location.line],
+                }
+                function_calls_index[call_signature] = call
+                function_calls.append(call)
             else:
                 # append the line number to the existing function call
-                for call in function_calls:
-                    if call["function_name"] == function_name:
-                        call["seen_line"].append(child.location.line)
-                        break
+                call["seen_line"].append(child.location.line)
 
-        # recursively parse child nodes
-        parse_function_calls(child, function_calls, function_calls_signature)
+        # visit the child nodes next, in source order
+        stack.extend(reversed(list(child.get_children())))
 
-def parse_main_function(main_node,file_path):
+def parse_main_function(main_node, translation_unit):
     """
     Parse function call information within the main function. There are two main cases:
     1. The main function contains function calls directly.
     2. The main function contains a single function, and the function contains the actual function calls.
     Args:
         main_node (clang.cindex.Cursor): AST node of the main function.
+        translation_unit (clang.cindex.TranslationUnit): The translation unit `main_node` belongs to.
     Returns:
         list: A list of function call information.
     """
     function_calls = []
-    function_calls_signature = set()
+    function_calls_index = {}
 
     # parse the main function normally
-    parse_function_calls(main_node, function_calls, function_calls_signature)
+    parse_function_calls(main_node, function_calls, function_calls_index)
 
     # If the function_calls only contains a single function, that means the main function is actually in that function
     if len(function_calls) == 1:
         function_name = function_calls[0]["function_name"]
-        index = Index.create()
-        translation_unit = index.parse(file_path)
-        for node in translation_unit.cursor.get_children():
-            if node.kind == CursorKind.FUNCTION_DECL and node.spelling == function_name:
-                # parse function calls within the actual main function
-                function_calls = []
-                function_calls_signature = set()
-                parse_function_calls(node, function_calls, function_calls_signature)
-                break
+        node = find_function_definition(translation_unit, function_name)
+        if node is not None:
+            # parse function calls within the actual main function
+            function_calls = []
+            function_calls_index = {}
+            parse_function_calls(node, function_calls, function_calls_index)
     return function_calls
 
 
@@ -0,0 +1,193 @@
+import json
+import os
+import shlex
+from concurrent.futures import ProcessPoolExecutor
+
+# may use `pip install libclang` to install the package
+from clang.cindex import CursorKind, Index, LinkageKind
+
+from extractor.extract_cache import DEFAULT_CACHE_DIR, cached_extraction
+
+HEADER_SUFFIXES = (".h", ".hh", ".hpp")
+# Arguments that take a path value, made absolute so that libclang can be run from any directory
+PATH_FLAGS = ("-I", "-isystem", "-iquote", "-include")
+
+
+def load_compile_commands(compile_commands_path):
+    """
+    Load a compilation database (`compile_commands.json`, e.g. written by `bear -- make` or CMake).
+    Args:
+        compile_commands_path (str): Path to the compilation database.
+    Returns:
+        list: One dictionary per translation unit, `{"file": <absolute path>, "args": [...libclang arguments...]}`.
+    """
+    with open(compile_commands_path, "r") as file:
+        entries = json.load(file)
+
+    translation_units = []
+    seen = set()
+    for entry in entries:
+        directory = entry["directory"]
+        source_path = os.path.normpath(os.path.join(directory, entry["file"]))
+        if source_path in seen:
+            continue
+        seen.add(source_path)
+        arguments = entry.get("arguments") or shlex.split(entry["command"])
+        translation_units.append({"file": source_path, "args": get_parse_args(arguments[1:], directory, entry["file"])})
+    return translation_units
+
+
+def get_parse_args(arguments, directory, source_file):
+    """
+    Turn the arguments of a compile command into libclang parse arguments: the output, `-c` and the source file are
+    dropped, and include paths are made absolute.
+    """
+    parse_args = []
+    i = 0
+    while i < len(arguments):
+        arg = arguments[i]
+        if arg == "-o":
+            i += 2
+            continue
+        if arg == "-c" or arg == source_file or os.path.normpath(os.path.join(directory, arg)) == \
+                os.path.normpath(os.path.join(directory, source_file)):
+            i += 1
+            continue
+        if arg in PATH_FLAGS and i + 1 < len(arguments):
+            parse_args += [arg, os.path.normpath(os.path.join(directory, arguments[i + 1]))]
+            i += 2
+            continue
+        for flag in PATH_FLAGS:
+            if arg.startswith(flag) and arg != flag and not arg.startswith("-include-"):
+                arg = flag + os.path.normpath(os.path.join(directory, arg[len(flag):]))
+                break
+        parse_args.append(arg)
+        i += 1
+    return parse_args
+
+
+def find_parse_args(translation_units, file_path):
+    """
+    Return the parse arguments of `file_path` from a loaded compilation database, or an empty list.
+    """
+    file_path = os.path.abspath(file_path)
+    for translation_unit in translation_units:
+        if translation_unit["file"] == file_path:
+            return translation_unit["args"]
+    return []
+
+
+def get_function_signature(cursor):
+    """
+    Render the signature of a function declaration, e.g.
+    `png_uint_32 png_get_image_width(png_const_structrp png_ptr, png_const_inforp info_ptr)`.
+    """
+    parameters = ", ".join(f"{arg.type.spelling} {arg.spelling}".strip() for arg in cursor.get_arguments())
+    return f"{cursor.result_type.spelling} {cursor.spelling}({parameters})"
+
+
+def index_translation_unit(translation_unit, project_root):
+    """
+    Parse one translation unit and collect the exported functions and call sites that belong to the project.
+    It runs in a worker process.
+    Args:
+        translation_unit (dict): An entry of `load_compile_commands`.
+        project_root (str): Only declarations and calls located below this directory are indexed.
+    Returns:
+        dict: `{"functions": {name: {...}}, "call_sites": {name: ["file:line", ...]}}`.
+    """
+    index = Index.create()
+    tu = index.parse(translation_unit["file"], args=translation_unit["args"])
+    functions = {}
+    call_sites = {}
+
+    stack = list(tu.cursor.get_children())
+    while stack:
+        cursor = stack.pop()
+        location_file = cursor.location.file
+        if location_file is None:
+            continue
+        file_name = os.path.abspath(location_file.name)
+        if not file_name.startswith(project_root + os.sep):
+            continue
+
+        if cursor.kind == CursorKind.FUNCTION_DECL and cursor.linkage == LinkageKind.EXTERNAL:
+            function = functions.setdefault(cursor.spelling, {"signature": get_function_signature(cursor),
+                                                              "header": None, "definition": None})
+            if file_name.endswith(HEADER_SUFFIXES) and function["header"] is None:
+                function["header"] = file_name
+            if cursor.is_definition():
+                function["definition"] = f"{file_name}:{cursor.location.line}"
+        elif cursor.kind == CursorKind.CALL_EXPR and cursor.spelling:
+            call_sites.setdefault(cursor.spelling, []).append(f"{file_name}:{cursor.location.line}")
+
+        stack.extend(cursor.get_children())
+    return {"functions": functions, "call_sites": call_sites}
+
+
+def _index_translation_unit_worker(arguments):
+    return index_translation_unit(*arguments)
+
+
+def build_api_index(compile_commands_path, project_root=None, jobs=None):
+    """
+    Build the symbol index of a project from its compilation database. Every translation unit is parsed with its
+    own flags, in parallel across a process pool.
+    Args:
+        compile_commands_path (str): Path to `compile_commands.json`.
+        project_root (str): Root of the project (default: the directory of the compilation database).
+        jobs (int): Number of worker processes (default: the number of CPUs).
+    Returns:
+        dict: The index:
+            {
+                "functions": {
+                    "png_read_info": {
+                        "signature": "void png_read_info(png_structrp png_ptr, png_inforp info_ptr)",
+                        "header": "/abs/path/png.h",
+                        "definition": "/abs/path/pngread.c:92"
+                    },
+                    ...
+                },
+                "call_sites": {"png_read_info": ["/abs/path/pngtest.c:1012", ...], ...}
+            }
+        Only functions with external linkage that are declared in a project header are kept.
+    """
+    project_root = os.path.abspath(project_root or os.path.dirname(compile_commands_path))
+    translation_units = load_compile_commands(compile_commands_path)
+
+    functions = {}
+    call_sites = {}
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        work = [(translation_unit, project_root) for translation_unit in translation_units]
+        for result in executor.map(_index_translation_unit_worker, work):
+            for name, function in result["functions"].items():
+                merged = functions.setdefault(name, function)
+                merged["header"] = merged["header"] or function["header"]
+                merged["definition"] = merged["definition"] or function["definition"]
+            for name, sites in result["call_sites"].items():
+                call_sites.setdefault(name, []).extend(sites)
+
+    functions = {name: function for name, function in functions.items() if function["header"]}
+    return {"functions": functions, "call_sites": call_sites}
+
+
+def cached_build_api_index(compile_commands_path, project_root=None, jobs=None, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Cached version of `build_api_index`, keyed on the compilation database and the content of every translation
+    unit it lists. The cache is stored below `cache_dir`, see `cached_extraction`.
+    """
+    sources = [compile_commands_path] + [tu["file"] for tu in load_compile_commands(compile_commands_path)
+                                         if os.path.exists(tu["file"])]
+    return cached_extraction("api_index", sources, [os.path.abspath(project_root or "")],
+                             lambda: build_api_index(compile_commands_path, project_root, jobs), cache_dir)
+
+
+def get_include_name(header_path, include_dirs):
+    """
+    Return the name under which a header is included, e.g. `libxml/parser.h` for `<root>/include/libxml/parser.h`
+    with `-I<root>/include`. The shortest name relative to an include directory wins; the base name is the
+    fallback.
+    """
+    names = [os.path.relpath(header_path, include_dir) for include_dir in include_dirs
+             if os.path.abspath(header_path).startswith(os.path.abspath(include_dir) + os.sep)]
+    return min(names, key=len) if names else os.path.basename(header_path)
@@ -0,0 +1,122 @@
+import asyncio
+import json
+import os
+import threading
+
+from llm_model.llm_client import LLMClient, get_client
+
+DEFAULT_MODEL = "gpt-4"
+# Samples requested in one call by default, servers with continuous batching (vLLM, llama.cpp) serve them together
+DEFAULT_MAX_BATCH_SIZE = 8
+
+
+class OpenAIBackend:
+    """
+    Backend for OpenAI-compatible chat completion endpoints: the OpenAI API and other hosted models as well as local
+    servers such as llama.cpp or vLLM. Every backend has its own client, and therefore its own connection pool and
+    concurrency limit.
+    """
+
+    cacheable = True
+    streaming = True
+
+    def __init__(self, name, model, client, n_sampling=True, max_batch_size=DEFAULT_MAX_BATCH_SIZE, params=None):
+        """
+        Args:
+            name (str): Name of the backend in the configuration.
+            model (str): The model name sent to the server.
+            client (LLMClient): The client of the endpoint.
+            n_sampling (bool): Whether the server supports the `n` parameter. Without it, the samples of a batch are
+            requested concurrently, one request each.
+            max_batch_size (int): Maximum number of samples requested at once.
+            params (dict): Extra sampling parameters sent with every request, e.g. `{"temperature": 0.8}`.
+        """
+        self.name = name
+        self.model = model
+        self.client = client
+        self.n_sampling = n_sampling
+        self.max_batch_size = max(1, max_batch_size)
+        self.params = params or {}
+
+    async def agenerate(self, prompt, samples):
+        """
+        Sample one response per sample index.
+        Args:
+            prompt (str): The user prompt.
+            samples (list): The sample indices. Only their number matters for a live backend.
+        Returns:
+            list: The responses, in the order of `samples`.
+        """
+        responses = []
+        if self.n_sampling and len(samples) > 1:
+            responses = await self.client.acomplete_choices(prompt, len(samples), model=self.model, **self.params)
+        # servers that ignore `n` return a single choice, the rest is requested one by one
+        missing = len(samples) - len(responses)
+        if missing > 0:
+            responses += await asyncio.gather(*(self.client.acomplete(prompt, model=self.model, **self.params)
+                                                for _ in range(missing)))
+        return responses[:len(samples)]
+
+    async def astream(self, prompt, on_delta):
+        """Stream a single response, see `LLMClient.stream_complete`."""
+        return await self.client.astream_complete(prompt, on_delta, model=self.model, **self.params)
+
+
+def create_backend(name, spec):
+    """
+    Create a backend from its configuration.
+    Args:
+        name (str): Name of the backend.
+        spec (dict): `{"type": "openai", "model": ..., "base_url": ..., "api_key_env": ..., "max_concurrency": ...,
+        "timeout": ..., "max_retries": ..., "n_sampling": ..., "max_batch_size": ..., "params": {...}}` or
+        `{"type": "replay", "recording": ...}`. Unset client settings fall back to the environment variables of
+        `get_client`. The API key is read from the variable named by `api_key_env`; without a `base_url` it
+        defaults to `OPENAI_API_KEY`, so the key of the hosted API is not sent to a local server.
+    Returns:
+        The backend.
+    """
+    backend_type = spec.get("type", "openai")
+    if backend_type == "replay":
+        from llm_model.replay import get_replay
+        return get_replay(spec["recording"])
+    if backend_type != "openai":
+        raise RuntimeError(f"Unknown type {backend_type!r} of the LLM backend {name!r}")
+    api_key_env = spec.get("api_key_env", None if spec.get("base_url") else "OPENAI_API_KEY")
+    client = LLMClient(
+        base_url=spec.get("base_url") or os.getenv("OPENAI_BASE_URL"),
+        api_key=os.getenv(api_key_env) if api_key_env else None,
+        max_concurrency=spec.get("max_concurrency", int(os.getenv("LLM_MAX_CONCURRENCY", "4"))),
+        timeout=spec.get("timeout", float(os.getenv("LLM_TIMEOUT", "120"))),
+        max_retries=spec.get("max_retries", int(os.getenv("LLM_MAX_RETRIES", "5"))),
+    )
+    return OpenAIBackend(name, spec.get("model", DEFAULT_MODEL), client, spec.get("n_sampling", True),
+                         spec.get("max_batch_size", DEFAULT_MAX_BATCH_SIZE), spec.get("params"))
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(name, spec):
+    """
+    Return the backend of a configuration, shared by every target of the process that configures the same backend,
+    so that their requests share its concurrency limit.
+    """
+    key = (name, json.dumps(spec, sort_keys=True))
+    with _backends_lock:
+        if key not in _backends:
+            _backends[key] = create_backend(name, spec)
+        return _backends[key]
+
+
+def get_default_backend():
+    """
+    Return the backend used without an `llm` configuration: the recording at `LLM_REPLAY_PATH` if set, otherwise
+    `gpt-4` through the process-wide client of `get_client`.
+    """
+    if os.getenv("LLM_REPLAY_PATH"):
+        return get_backend("replay", {"type": "replay", "recording": os.getenv("LLM_REPLAY_PATH")})
+    with _backends_lock:
+        if "default" not in _backends:
+            _backends["default"] = OpenAIBackend("default", DEFAULT_MODEL, get_client())
+        return _backends["default"]
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+current_file_path = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_PATH = current_file_path + "/../outputs/cache/llm/responses.sqlite3"
+
+
+def make_cache_key(prompt, model, params):
+    """
+    Build the content address of a request: a SHA-256 hash of the prompt, the model name and the sampling parameters.
+    Args:
+        prompt (str): The user prompt.
+        model (str): The model name.
+        params (dict): Sampling parameters. They must be JSON serializable.
+    Returns:
+        str: The hex digest used as cache key.
+    """
+    payload = json.dumps({"prompt": prompt, "model": model, "params": params}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Persistent LLM response cache stored in SQLite. The total size of the cached responses is capped, and the least
+    recently used entries are evicted when the cap is exceeded.
+    """
+
+    def __init__(self, db_path=DEFAULT_CACHE_PATH, max_bytes=512 * 1024 * 1024):
+        """
+        Args:
+            db_path (str): Path to the SQLite database file. The parent directory is created if necessary.
+            max_bytes (int): Maximum total size of the cached responses in bytes.
+        """
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " response TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._conn.commit()
+
+    def get(self, key):
+        """Return the cached response for `key` and mark it as recently used, or None on a miss."""
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key, response):
+        """Store a response and evict the least recently used entries if the size cap is exceeded."""
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, response, size, time.time()),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self):
+        """Remove every cached response."""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    Return the process-wide response cache configured from the environment: `LLM_CACHE_PATH` sets the database
+    file and `LLM_CACHE_MAX_MB` the size cap.
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache(
+                db_path=os.getenv("LLM_CACHE_PATH", DEFAULT_CACHE_PATH),
+                max_bytes=int(float(os.getenv("LLM_CACHE_MAX_MB", "512")) * 1024 * 1024),
+            )
+        return _default_cache
+
+
+def cache_bypassed():
+    """Whether cache lookups are disabled for this run (`LLM_CACHE_BYPASS=1`). Fresh responses are still stored."""
+    return os.getenv("LLM_CACHE_BYPASS", "0").lower() in ("1", "true", "yes")
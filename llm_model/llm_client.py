@@ -0,0 +1,272 @@
+import asyncio
+import json
+import os
+import random
+import threading
+
+# `httpx` is installed together with the `openai` package
+import httpx
+
+# Status codes that are worth retrying: rate limiting and transient server errors
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMClient:
+    """
+    Chat completion client for OpenAI-compatible endpoints.
+
+    A single `httpx.AsyncClient` (and therefore a single connection pool) is kept for the lifetime of the client. It
+    lives on a private event loop running in a daemon thread, so the synchronous `complete` and the asynchronous
+    `acomplete` can both be used from any thread or event loop while sharing the same connections and the same
+    concurrency limit.
+    """
+
+    def __init__(self, base_url=None, api_key=None, max_concurrency=4, timeout=120.0, max_retries=5,
+                 backoff_base=1.0, backoff_max=30.0):
+        """
+        Args:
+            base_url (str): Base URL of the API, e.g. `https://api.openai.com/v1` or a local stub server.
+            api_key (str): API key sent as bearer token.
+            max_concurrency (int): Maximum number of in-flight requests.
+            timeout (float): Timeout of a single request in seconds.
+            max_retries (int): Number of retries for retryable failures.
+            backoff_base (float): Base delay of the exponential backoff in seconds.
+            backoff_max (float): Upper bound of a single backoff delay in seconds.
+        """
+        self.base_url = (base_url or "https://api.openai.com/v1").rstrip("/")
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._http_client = None
+        self._semaphore = None
+
+    def _ensure_started(self):
+        """Start the background event loop and create the pooled HTTP client on first use."""
+        with self._lock:
+            if self._loop is not None:
+                return self._loop
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="llm-client-loop", daemon=True)
+            thread.start()
+            asyncio.run_coroutine_threadsafe(self._setup(), loop).result()
+            self._loop = loop
+            self._thread = thread
+            return loop
+
+    async def _setup(self):
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        self._http_client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=headers,
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=self.max_concurrency,
+                                max_keepalive_connections=self.max_concurrency),
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    def _backoff_delay(self, attempt, retry_after=None):
+        """Exponential backoff with full jitter. A `Retry-After` header from the server takes precedence."""
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def _chat(self, payload):
+        """Send a chat completion request on the client loop, retrying 429/5xx responses and transport errors."""
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            async with self._semaphore:
+                try:
+                    response = await self._http_client.post("/chat/completions", json=payload)
+                except httpx.TransportError as e:
+                    last_error = f"{type(e).__name__}: {e}"
+                else:
+                    if response.status_code == 200:
+                        try:
+                            return response.json()
+                        except ValueError as e:
+                            raise RuntimeError(f"LLM response is not valid JSON: {e}") from e
+                    last_error = f"HTTP {response.status_code}: {response.text[:500]}"
+                    if response.status_code not in RETRY_STATUS_CODES:
+                        break
+                    retry_after = response.headers.get("Retry-After")
+            if attempt < self.max_retries:
+                await asyncio.sleep(self._backoff_delay(attempt, retry_after))
+        raise RuntimeError(f"LLM request failed after {attempt + 1} attempt(s): {last_error}")
+
+    async def _chat_stream(self, payload, on_delta):
+        """
+        Streaming version of `_chat`. Content deltas of the first choice are passed to `on_delta` as they arrive;
+        when it returns True the response is closed, which makes the server stop generating. Failures are only
+        retried before the first delta, so `on_delta` never sees a response twice.
+        """
+        last_error = None
+        received = False
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            async with self._semaphore:
+                try:
+                    async with self._http_client.stream("POST", "/chat/completions",
+                                                        json={**payload, "stream": True}) as response:
+                        if response.status_code == 200:
+                            content = []
+                            # Closed explicitly, an abandoned generator is only finalized after the loop moved on
+                            lines = response.aiter_lines()
+                            try:
+                                async for line in lines:
+                                    if not line.startswith("data:"):
+                                        continue
+                                    data = line[len("data:"):].strip()
+                                    if data == "[DONE]":
+                                        break
+                                    delta = _stream_delta(data)
+                                    if not delta:
+                                        continue
+                                    received = True
+                                    content.append(delta)
+                                    if on_delta(delta):
+                                        break
+                            finally:
+                                await lines.aclose()
+                            return "".join(content)
+                        await response.aread()
+                        last_error = f"HTTP {response.status_code}: {response.text[:500]}"
+                        if response.status_code not in RETRY_STATUS_CODES:
+                            break
+                        retry_after = response.headers.get("Retry-After")
+                except httpx.TransportError as e:
+                    last_error = f"{type(e).__name__}: {e}"
+                    if received:
+                        break
+            if attempt < self.max_retries:
+                await asyncio.sleep(self._backoff_delay(attempt, retry_after))
+        raise RuntimeError(f"LLM request failed after {attempt + 1} attempt(s): {last_error}")
+
+    def _submit(self, prompt, model, params):
+        loop = self._ensure_started()
+        payload = {"model": model, "messages": [{"role": "user", "content": prompt}], **params}
+        return asyncio.run_coroutine_threadsafe(self._chat(payload), loop)
+
+    def _submit_stream(self, prompt, model, on_delta, params):
+        loop = self._ensure_started()
+        payload = {"model": model, "messages": [{"role": "user", "content": prompt}], **params}
+        return asyncio.run_coroutine_threadsafe(self._chat_stream(payload, on_delta), loop)
+
+    def complete(self, prompt, model="gpt-4", **params):
+        """
+        Send a prompt and block until the completion is available.
+        Args:
+            prompt (str): The user prompt.
+            model (str): The model name.
+            **params: Extra sampling parameters, e.g. `temperature`.
+        Returns:
+            str: Content of the first choice.
+        """
+        return _choice_contents(self._submit(prompt, model, params).result())[0]
+
+    async def acomplete(self, prompt, model="gpt-4", **params):
+        """Asynchronous version of `complete`, usable from any event loop."""
+        return _choice_contents(await asyncio.wrap_future(self._submit(prompt, model, params)))[0]
+
+    def complete_choices(self, prompt, n=1, model="gpt-4", **params):
+        """
+        Sample several completions of a prompt in a single request (the `n` parameter of the API).
+        Args:
+            prompt (str): The user prompt.
+            n (int): Number of completions.
+            model (str): The model name.
+            **params: Extra sampling parameters, e.g. `temperature`.
+        Returns:
+            list: Content of every choice, in the order of their `index`.
+        """
+        return _choice_contents(self._submit(prompt, model, dict(params, n=n)).result())
+
+    async def acomplete_choices(self, prompt, n=1, model="gpt-4", **params):
+        """Asynchronous version of `complete_choices`, usable from any event loop."""
+        return _choice_contents(await asyncio.wrap_future(self._submit(prompt, model, dict(params, n=n))))
+
+    def stream_complete(self, prompt, on_delta, model="gpt-4", **params):
+        """
+        Stream a completion and block until it is finished or aborted.
+        Args:
+            prompt (str): The user prompt.
+            on_delta (callable): Called with every content delta, on the client's event loop thread. Returning
+            True aborts the request.
+            model (str): The model name.
+            **params: Extra sampling parameters, e.g. `temperature`.
+        Returns:
+            str: The content received until the end of the stream or the abort.
+        """
+        return self._submit_stream(prompt, model, on_delta, params).result()
+
+    async def astream_complete(self, prompt, on_delta, model="gpt-4", **params):
+        """Asynchronous version of `stream_complete`, usable from any event loop."""
+        return await asyncio.wrap_future(self._submit_stream(prompt, model, on_delta, params))
+
+    def close(self):
+        """Close the pooled HTTP client and stop the background loop."""
+        with self._lock:
+            if self._loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self._http_client.aclose(), self._loop).result()
+            # Finalize the async generators httpx left behind, their cleanup tasks would be destroyed with the loop
+            asyncio.run_coroutine_threadsafe(self._loop.shutdown_asyncgens(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+            self._thread = None
+
+
+def _choice_contents(response):
+    """Content of every choice of a chat completion, raising RuntimeError on a malformed response."""
+    try:
+        choices = sorted(response["choices"], key=lambda choice: choice.get("index", 0))
+        contents = [choice["message"]["content"] for choice in choices]
+    except (KeyError, TypeError, AttributeError) as e:
+        raise RuntimeError(f"Malformed LLM response: {type(e).__name__}: {e}") from e
+    if not contents:
+        raise RuntimeError("Malformed LLM response: no choices")
+    return contents
+
+
+def _stream_delta(data):
+    """Content delta of the first choice of a streamed chunk, raising RuntimeError on a malformed chunk."""
+    try:
+        choices = json.loads(data).get("choices") or []
+        return choices[0].get("delta", {}).get("content") if choices else None
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        raise RuntimeError(f"Malformed LLM stream chunk: {type(e).__name__}: {e}") from e
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Return the process-wide client configured from the environment:
+    `OPENAI_BASE_URL`, `OPENAI_API_KEY`, `LLM_MAX_CONCURRENCY`, `LLM_TIMEOUT` and `LLM_MAX_RETRIES`.
+    """
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = LLMClient(
+                base_url=os.getenv("OPENAI_BASE_URL"),
+                api_key=os.getenv("OPENAI_API_KEY"),
+                max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "4")),
+                timeout=float(os.getenv("LLM_TIMEOUT", "120")),
+                max_retries=int(os.getenv("LLM_MAX_RETRIES", "5")),
+            )
+        return _default_client
@@ -1,28 +1,119 @@
 from dotenv import load_dotenv
-from openai import OpenAI
 import os
 
 load_dotenv()
 
+import asyncio
+import threading
+
+from candidate_generator.candidate_gen import StreamingCodeExtractor
+from llm_model.backends import get_default_backend
+from llm_model.llm_cache import cache_bypassed, get_cache, make_cache_key
+from llm_model.replay import record_response
+from prompt_generator.tokenizer import count_tokens
+from tracing.tracer import annotate, traced
+
 api_key = os.getenv("OPENAI_API_KEY")
 http_proxy = os.getenv("HTTP_PROXY")
 https_proxy = os.getenv("HTTPS_PROXY")
 
-def generate_fuzz_driver_llm(prompt):
-    client = OpenAI()
+# Number of times every (backend, prompt, sample) was requested in this process, see `_cache_key`
+_attempts = {}
+_attempts_lock = threading.Lock()
+
+def _next_attempt(prompt, sample, backend):
+    key = (backend.name, backend.model, prompt, sample)
+    with _attempts_lock:
+        attempt = _attempts.get(key, 0)
+        _attempts[key] = attempt + 1
+        return attempt
+
+def _cache_key(prompt, sample, backend, attempt=0):
+    """
+    Cache key of a response. `sample` is part of the key, so concurrent candidates for the same prompt get
+    distinct (but reproducible) responses. So is `attempt`, the number of earlier requests for the same prompt and
+    sample in this run: a prompt repeated by a later iteration (e.g. the same error digest, or the initial prompt
+    again after a response without code) gets a new response instead of the one that just failed, while a rerun
+    replays the same sequence.
+    """
+    params = dict(backend.params, sample=sample)
+    if attempt:
+        params["attempt"] = attempt
+    return make_cache_key(prompt, backend.model, params)
+
+def _record(prompt, sample, response, model):
+    """Append a live response to the recording at `LLM_RECORD_PATH`, if set."""
+    if os.getenv("LLM_RECORD_PATH"):
+        record_response(os.getenv("LLM_RECORD_PATH"), prompt, model, sample, response)
+
+def streaming_enabled():
+    """
+    Whether responses are streamed (`LLM_STREAM=1`). A streamed request is aborted as soon as the first code block
+    of the response is complete, and only the response up to that block is returned and cached. Streamed samples
+    are requested one by one, without `n`-sampling.
+    """
+    return os.getenv("LLM_STREAM", "0") == "1"
+
+def batch_samples(num_samples, backend=None):
+    """
+    Split the sample indices of a candidate pool into the batches requested together from a backend.
+    Returns:
+        list: Lists of sample indices, at most `max_batch_size` each.
+    """
+    backend = backend or get_default_backend()
+    batch_size = 1 if streaming_enabled() and backend.streaming else backend.max_batch_size
+    return [list(range(start, min(start + batch_size, num_samples))) for start in range(0, num_samples, batch_size)]
+
+async def _astream(prompt, backend):
+    extractor = StreamingCodeExtractor()
+    await backend.astream(prompt, extractor.feed)
+    return extractor.response
+
+@traced(category="llm")
+async def generate_fuzz_drivers_llm_async(prompt, samples, backend=None):
+    """
+    Get the responses of several samples of a prompt. Cached samples are answered from the response cache, the
+    others are requested from the backend in a single batch (one request with `n` set, where the backend supports
+    it).
+    Args:
+        prompt (str): The prompt.
+        samples (list): The sample indices, see `batch_samples`.
+        backend: The backend, see `llm_model/backends.py` (default: `get_default_backend()`).
+    Returns:
+        list: The responses, in the order of `samples`.
+    """
+    backend = backend or get_default_backend()
+    annotate(backend=backend.name, model=backend.model, samples=len(samples), prompt_tokens=count_tokens(prompt))
+    keys = {sample: _cache_key(prompt, sample, backend, _next_attempt(prompt, sample, backend)) for sample in samples}
+    responses = {}
+    if backend.cacheable and not cache_bypassed():
+        for sample in samples:
+            response = get_cache().get(keys[sample])
+            if response is not None:
+                responses[sample] = response
+    annotate(cached=len(responses))
 
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[
-            {"role": "user", "content": prompt}
-        ]
-    )
+    missing = [sample for sample in samples if sample not in responses]
+    if missing:
+        if streaming_enabled() and backend.streaming:
+            fetched = await asyncio.gather(*(_astream(prompt, backend) for _ in missing))
+        else:
+            fetched = await backend.agenerate(prompt, missing)
+        for sample, response in zip(missing, fetched):
+            responses[sample] = response
+            if backend.cacheable:
+                get_cache().put(keys[sample], response)
+                _record(prompt, sample, response, backend.model)
+    annotate(completion_tokens=sum(count_tokens(responses[sample]) for sample in missing))
+    return [responses[sample] for sample in samples]
 
-    return response.choices[0].message.content
+def generate_fuzz_driver_llm(prompt, sample=0, backend=None):
+    """Synchronous version of `generate_fuzz_drivers_llm_async` for a single sample."""
+    return asyncio.run(generate_fuzz_drivers_llm_async(prompt, [sample], backend))[0]
 
 if __name__ == "__main__":
     with open("../prompt_generator/gpt_prompt.txt", "r") as f:
         fread = f.read
         prompt = fread()
     response = generate_fuzz_driver_llm(prompt)
-    print(response)
\ No newline at end of file
+    print(response)
@@ -0,0 +1,103 @@
+import json
+import os
+import threading
+
+from llm_model.llm_cache import make_cache_key
+
+
+class ReplayBackend:
+    """
+    Offline stand-in for the LLM that serves recorded responses, for benchmarks and reproducible runs.
+
+    A recording is a JSON file `{"model": ..., "responses": [{"key": ..., "sample": 0, "response": ...}, ...]}`, as
+    written by `record_response`. A request is answered with the next unused response recorded for the same prompt
+    (`key`, see `make_cache_key`), and the last one once they are all used. Prompts that were not recorded, e.g.
+    because a pipeline change altered them, get the next unused response of the same sample in file order, and the
+    last one once the recording is exhausted, so a replay always follows the same path. A recording with responses
+    that have no key was not made by a run and is rejected.
+
+    It is also an LLM backend (see `llm_model/backends.py`). Its responses are not cached, and every sample is
+    requested on its own, so candidates are validated in the same order as in a live run.
+    """
+
+    cacheable = False
+    streaming = False
+    max_batch_size = 1
+    params = {}
+
+    def __init__(self, recording_path):
+        """
+        Args:
+            recording_path (str): Path to the recording.
+        """
+        with open(recording_path, "r") as file:
+            recording = json.load(file)
+        self.name = "replay"
+        self.model = recording.get("model", "gpt-4")
+        self.responses = recording["responses"]
+        if not self.responses:
+            raise RuntimeError(f"Recording {recording_path} contains no responses")
+        unkeyed = sum(1 for entry in self.responses if not entry.get("key"))
+        if unkeyed:
+            raise RuntimeError(f"Recording {recording_path} has {unkeyed} response(s) without a prompt key, record it "
+                               f"again with LLM_RECORD_PATH")
+        self._used = set()
+        self._lock = threading.Lock()
+
+    def rewind(self):
+        """Start the replay over, e.g. before the next repetition of a benchmark."""
+        with self._lock:
+            self._used.clear()
+
+    def complete(self, prompt, sample=0):
+        """Return the recorded response for a prompt and sample index."""
+        key = make_cache_key(prompt, self.model, {"sample": sample})
+        with self._lock:
+            # a prompt repeated in the recorded run has one entry per request, served in turn
+            matches = [index for index, entry in enumerate(self.responses) if entry.get("key") == key]
+            if matches:
+                index = next((index for index in matches if index not in self._used), matches[-1])
+                self._used.add(index)
+                return self.responses[index]["response"]
+            same_sample = [index for index, entry in enumerate(self.responses) if entry.get("sample", 0) == sample]
+            candidates = same_sample or list(range(len(self.responses)))
+            for index in candidates:
+                if index not in self._used:
+                    self._used.add(index)
+                    return self.responses[index]["response"]
+            return self.responses[candidates[-1]]["response"]
+
+    async def agenerate(self, prompt, samples):
+        """Return the recorded response of every sample index, in the order of `samples`."""
+        return [self.complete(prompt, sample) for sample in samples]
+
+
+_recording_lock = threading.Lock()
+
+
+def record_response(recording_path, prompt, model, sample, response):
+    """
+    Append a live response to a recording, so that the run can be replayed by `ReplayBackend` later.
+    """
+    with _recording_lock:
+        recording = {"model": model, "responses": []}
+        if os.path.exists(recording_path):
+            with open(recording_path, "r") as file:
+                recording = json.load(file)
+        recording["responses"].append({"key": make_cache_key(prompt, model, {"sample": sample}), "sample": sample,
+                                       "response": response})
+        os.makedirs(os.path.dirname(os.path.abspath(recording_path)), exist_ok=True)
+        with open(recording_path, "w") as file:
+            json.dump(recording, file, indent=2)
+
+
+_replays = {}
+_replays_lock = threading.Lock()
+
+
+def get_replay(recording_path):
+    """Return the replay backend of a recording, shared by every request of the process."""
+    with _replays_lock:
+        if recording_path not in _replays:
+            _replays[recording_path] = ReplayBackend(recording_path)
+        return _replays[recording_path]
@@ -0,0 +1,71 @@
+import os
+
+from llm_model.backends import get_backend, get_default_backend
+
+
+class BackendRouter:
+    """
+    Routing policy over a list of backends ordered from the cheapest to the strongest, e.g. a local model followed
+    by a hosted one. Every target starts on the first backend and moves to the next one after `escalate_after`
+    consecutive failed iterations, so only the hard cases reach the expensive model. It does not move back.
+    """
+
+    def __init__(self, backends, escalate_after=2, level=0, failures=0):
+        """
+        Args:
+            backends (list): The backends, in the order of escalation.
+            escalate_after (int): Number of consecutive failed iterations after which the next backend is used.
+            level (int): Index of the current backend, e.g. restored from a checkpoint.
+            failures (int): Consecutive failed iterations on the current backend.
+        """
+        self.backends = backends
+        self.escalate_after = escalate_after
+        self.level = min(level, len(backends) - 1)
+        self.failures = failures
+
+    @property
+    def backend(self):
+        """The backend of the next iteration."""
+        return self.backends[self.level]
+
+    def record(self, success):
+        """Record the outcome of an iteration, escalating after too many failures in a row."""
+        if success:
+            self.failures = 0
+            return
+        self.failures += 1
+        if self.failures >= self.escalate_after and self.level < len(self.backends) - 1:
+            self.level += 1
+            self.failures = 0
+            print(f"Escalating to the LLM backend {self.backend.name!r} ({self.backend.model}) after "
+                  f"{self.escalate_after} failed iteration(s).")
+
+    def state(self):
+        """Return the state to save in a checkpoint, see `make_router`."""
+        return {"level": self.level, "failures": self.failures}
+
+
+def make_router(llm_config=None, state=None):
+    """
+    Create the router of a target.
+    Args:
+        llm_config (dict): The `llm` section of the configuration:
+        `{"backends": {name: spec, ...}, "route": [name, ...], "escalate_after": 2}`, see `create_backend` for the
+        specs. The route defaults to the backends in the order they are listed. Without it, the default backend is
+        used.
+        state (dict): The state of the router saved in a checkpoint, if any.
+    Returns:
+        BackendRouter: The router. With `LLM_REPLAY_PATH` set, every request is answered from the recording.
+    """
+    state = state or {}
+    if not llm_config or os.getenv("LLM_REPLAY_PATH"):
+        return BackendRouter([get_default_backend()])
+    specs = llm_config["backends"]
+    route = llm_config.get("route", list(specs))
+    if not route:
+        raise RuntimeError("The LLM configuration defines no backend")
+    unknown = [name for name in route if name not in specs]
+    if unknown:
+        raise RuntimeError(f"The LLM route {route} names undefined backends: {unknown}")
+    return BackendRouter([get_backend(name, specs[name]) for name in route], llm_config.get("escalate_after", 2),
+                         state.get("level", 0), state.get("failures", 0))
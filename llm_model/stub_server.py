@@ -0,0 +1,161 @@
+import argparse
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_RESPONSE = """```c
+#include <stddef.h>
+#include <stdint.h>
+
+int LLVMFuzzerTestOneInput(const uint8_t *data, size_t size) {
+    return 0;
+}
+```"""
+
+
+class StubState:
+    """Responses served by the stub server and counters of the requests it received."""
+
+    def __init__(self, responses, max_n=None, latency=0.0, failures=None):
+        """
+        Args:
+            responses (list): Responses served in turn, one per choice.
+            max_n (int): Maximum number of choices per request, to emulate servers that ignore `n` (e.g. 1).
+            latency (float): Delay of every response in seconds.
+            failures (list): `(status, retry_after)` errors returned to the first requests, in turn, to emulate rate
+            limiting and transient server errors. `retry_after` is the `Retry-After` header, or None. A status of 200
+            answers with a malformed body instead.
+        """
+        self.responses = itertools.cycle(responses)
+        self.max_n = max_n
+        self.latency = latency
+        self.failures = list(failures or [])
+        self.requests = 0
+        self.choices = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def begin(self):
+        """Count a request in flight, and return the error to answer it with, if any."""
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            return self.failures.pop(0) if self.failures else None
+
+    def end(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def take(self, n):
+        with self.lock:
+            if self.max_n:
+                n = min(n, self.max_n)
+            self.requests += 1
+            self.choices += n
+            return [next(self.responses) for _ in range(n)]
+
+
+def make_handler(state):
+    class StubHandler(BaseHTTPRequestHandler):
+        """Minimal OpenAI-compatible `/chat/completions` endpoint, with `n` and streaming."""
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self.send_error(404)
+                return
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            self.stream = payload.get("stream", False)
+            failure = state.begin()
+            try:
+                time.sleep(state.latency)
+                if failure:
+                    self.send_failure(*failure)
+                else:
+                    self.send_completion(payload, state.take(payload.get("n", 1)))
+            finally:
+                state.end()
+
+        def send_failure(self, status, retry_after):
+            body = json.dumps({"error": {"message": "stub failure", "code": status}}).encode("utf-8")
+            if status == 200:
+                body = b"data: {" if self.stream else body[:-1]
+            self.send_response(status)
+            if retry_after is not None:
+                self.send_header("Retry-After", str(retry_after))
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_completion(self, payload, contents):
+            model = payload.get("model", "stub")
+            if payload.get("stream"):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                content = contents[0]
+                for start in range(0, len(content), 32):
+                    chunk = {"model": model, "choices": [{"index": 0, "delta": {"content": content[start:start + 32]}}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.write(b"data: [DONE]\n\n")
+                return
+            body = json.dumps({
+                "object": "chat.completion",
+                "model": model,
+                "choices": [{"index": index, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"} for index, content in enumerate(contents)],
+            }).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+def start_stub_server(responses=None, port=0, max_n=None, latency=0.0, failures=None):
+    """
+    Start a stub LLM server in a background thread, to run the pipeline or an LLM backend without a model.
+    Args:
+        responses (list): Responses served in turn (default: an empty driver).
+        port (int): Port to listen on, 0 picks a free one.
+        max_n (int): Maximum number of choices per request.
+        latency (float): Delay of every response in seconds.
+        failures (list): `(status, retry_after)` errors returned to the first requests, see `StubState`.
+    Returns:
+        tuple: The server, its base URL (for `base_url` / `OPENAI_BASE_URL`) and its `StubState`.
+    """
+    state = StubState(responses or [DEFAULT_RESPONSE], max_n, latency, failures)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    threading.Thread(target=server.serve_forever, name="llm-stub-server", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1", state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve canned responses on an OpenAI-compatible endpoint.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--recording", default=None,
+                        help="serve the responses of a recording in turn, e.g. benchmarks/recordings/libpng.json")
+    parser.add_argument("--max-n", type=int, default=None,
+                        help="maximum choices per request, 1 emulates a server without `n` support")
+    parser.add_argument("--latency", type=float, default=0.0, help="delay of every response in seconds")
+    arguments = parser.parse_args()
+
+    responses = None
+    if arguments.recording:
+        with open(arguments.recording, "r") as file:
+            responses = [entry["response"] for entry in json.load(file)["responses"]]
+    server, base_url, state = start_stub_server(responses, arguments.port, arguments.max_n, arguments.latency)
+    print(f"Stub LLM server listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        print(f"Served {state.requests} request(s), {state.choices} choice(s).")
+        server.shutdown()
@@ -1,101 +1,387 @@
+import asyncio
 import json
 import os
+import shutil
 import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 from candidate_generator.candidate_gen import CandidateGenerator
-from extractor.extractor import extract_interface_info
-from llm_model.llm_model import generate_fuzz_driver_llm
+from candidate_generator.fingerprint import fingerprint_driver
+from extractor.extract_cache import cached_extract_translation_unit_info
+from indexer.api_index import cached_build_api_index, find_parse_args, get_include_name, load_compile_commands
+from llm_model.llm_model import batch_samples, generate_fuzz_drivers_llm_async
+from llm_model.router import make_router
+from prebuild.prebuild_cache import run_prebuild
 from prompt_generator.prompt_gen import filter_interfaces, generate_gpt_prompt, generate_compiler_error_prompt, \
     gen_cov_improve_prompt
-from validator.validator import validate_driver
+from refiner.cov_digest import summarize_uncovered
+from refiner.cov_extractor import extract_coverage_percentage
+from refiner.err_extractor import summarize_compiler_errors
+from scheduler.checkpoint import load_checkpoint, save_checkpoint
+from scheduler.stages import get_stage_limit, stage_slot
+from tracing import tracer
+from validator.corpus import seed_corpus
+from validator.incremental_build import hash_link_inputs, prepare_incremental_build, restore_driver_path, \
+    split_compile_command
+from validator.result_store import get_store, make_validation_key
+from validator.syntax_check import get_include_dirs
+from validator.validator import COVERAGE_EXPORT_NAME, COVERAGE_SUMMARY_NAME, ERROR_LOG_NAME, VALIDATION_ARTIFACTS, \
+    export_function_coverage, validate_driver
 
-if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("Usage: python main.py <config_file_path> <prebuild_shell_path>")
-        sys.exit(1)
+# Name of the driver in the work directory of a candidate
+DRIVER_NAME = "driver.c"
+
+
+def generate_and_validate_candidates(prompt, num_candidates, validate, backend=None):
+    """
+    Ask the LLM for `num_candidates` drivers at the same time, in batches of samples (see `batch_samples`), and
+    validate every driver as soon as its batch is complete. The syntax check and build of the first candidates thus
+    overlap with the requests still running.
+    Args:
+        prompt (str): The prompt sent to the LLM.
+        num_candidates (int): Number of candidates.
+        validate (callable): Validates a candidate in place, run in a worker thread.
+        backend: The LLM backend, see `llm_model/backends.py` (default: the default backend).
+    Returns:
+        list: The validated candidate pool, where each item is a dictionary with the key `code` and the keys set by
+        `validate`. Batches whose LLM request failed and responses from which no driver code can be generated are
+        dropped, and so are drivers with the same fingerprint as an earlier candidate of the pool.
+    """
+    # candidate_generator
+    api_info = {
+        "required_headers": [],  # TODO: customize required header files here
+    }
+    generator = CandidateGenerator()
+    fingerprints = set()
+
+    async def run_candidate(sample, llm_response, executor):
+        driver_code = generator.generate_driver(llm_response, api_info)
+        if not driver_code:
+            return None
+        # drivers that differ only in whitespace or comments are validated once
+        fingerprint = fingerprint_driver(driver_code)
+        if fingerprint in fingerprints:
+            print(f"Dropping candidate {sample}: same driver as an earlier candidate.")
+            return None
+        fingerprints.add(fingerprint)
+        candidate = {"code": driver_code, "fingerprint": fingerprint}
+        await asyncio.get_running_loop().run_in_executor(executor, validate, candidate)
+        return candidate
+
+    async def run_batch(samples, executor):
+        try:
+            llm_responses = await generate_fuzz_drivers_llm_async(prompt, samples, backend)
+        except RuntimeError as e:
+            # a failed request only loses its batch, the other batches of the pool are still validated
+            print(f"Error: the LLM backend failed for candidate(s) {samples}: {e}")
+            return []
+        return await asyncio.gather(*(run_candidate(sample, llm_response, executor)
+                                      for sample, llm_response in zip(samples, llm_responses)))
+
+    async def run_all():
+        # the work is done by the compiler and fuzzer subprocesses, threads are enough to run them in parallel
+        with ThreadPoolExecutor(max_workers=num_candidates) as executor:
+            batches = await asyncio.gather(*(run_batch(samples, executor)
+                                             for samples in batch_samples(num_candidates, backend)))
+        return [candidate for batch in batches for candidate in batch if candidate is not None]
+
+    return asyncio.run(run_all())
+
+
+def validate_candidate(candidate, target_file, compile_command, public_headers, fuzz_budget, workspace_root,
+                       corpus_dir=None, fuzz_jobs=1, build=None, libraries=None, concurrent_runs=1):
+    """
+    Validate a single candidate in its own work directory, so that candidates can be validated in parallel. A
+    driver with the same fingerprint that was already validated against this target, in this or an earlier run,
+    reuses the recorded result instead: the artifacts kept by the validation store are copied to its work directory.
+    Args:
+        candidate (dict): The candidate to validate. It is updated in place with the validation result and the
+        paths of its driver, error log and coverage summary.
+        target_file (str): Path to the target file, the compile command is run in its directory.
+        compile_command (list): The compile command from the configuration.
+        public_headers (list): The public headers of the target, precompiled for the syntax check.
+        fuzz_budget (dict): The adaptive fuzzing budget from the configuration, or None for the fixed default.
+        workspace_root (str): Directory in which the work directory of the candidate is created.
+        corpus_dir (str): The shared corpus of the target, or None to fuzz without a corpus.
+        fuzz_jobs: Number of libFuzzer processes per fuzzer run, or `auto`, see `get_fuzz_jobs`.
+        build (dict): Incremental build of the target, or None to run the compile command as configured.
+        libraries: State of the libraries the driver is linked with, part of the key, see `make_validation_key`.
+        concurrent_runs (int): Number of fuzzer runs expected at the same time, for `fuzz_jobs: auto`.
+    """
+    fingerprint = candidate.get("fingerprint") or fingerprint_driver(candidate["code"])
+    key = make_validation_key(fingerprint, target_file, compile_command, libraries, fuzz_budget, public_headers,
+                              fuzz_jobs)
+    recorded = get_store().get(key)
+    work_dir = tempfile.mkdtemp(prefix="candidate_", dir=workspace_root)
+    candidate["work_dir"] = work_dir
+    candidate["driver_path"] = os.path.abspath(os.path.join(work_dir, DRIVER_NAME))
+    candidate["error_log_path"] = os.path.join(work_dir, ERROR_LOG_NAME)
+    candidate["coverage_summary_path"] = os.path.join(work_dir, COVERAGE_SUMMARY_NAME)
+    candidate["reused"] = recorded is not None
+    with open(candidate["driver_path"], "w") as file:
+        file.write(candidate["code"])
+    if recorded:
+        print(f"Reusing the validation of an identical driver in {recorded['work_dir']}: {recorded['result']}")
+        for name in VALIDATION_ARTIFACTS:
+            artifact_path = os.path.join(recorded["artifacts_dir"], name)
+            if not os.path.exists(artifact_path):
+                continue
+            shutil.copy(artifact_path, work_dir)
+            if name.endswith(".json"):
+                # the coverage exports name the driver at the path it was validated at
+                restore_driver_path(os.path.join(work_dir, name), candidate["driver_path"],
+                                    os.path.abspath(os.path.join(recorded["work_dir"], DRIVER_NAME)))
+        candidate["result"] = recorded["result"]
+        candidate["coverage"] = recorded["coverage"]
+        return
+
+    # validator
+    report = {}
+    result = validate_driver(candidate["driver_path"], compile_command, public_headers,
+                             target_directory=os.path.dirname(os.path.abspath(target_file)), work_dir=work_dir,
+                             fuzz_budget=fuzz_budget, report=report, corpus_dir=corpus_dir,
+                             fuzz_jobs=fuzz_jobs, build=build, concurrent_runs=concurrent_runs)
+
+    candidate["result"] = result
+    candidate["coverage"] = 0.0
+    # the coverage of the driver and the libraries ranks the candidates, the threshold only counts the driver
+    if result in ("Valid Driver", "Low Coverage"):
+        coverage = extract_coverage_percentage(candidate["coverage_summary_path"])
+        if not isinstance(coverage, str):
+            candidate["coverage"] = coverage
+    get_store().put(key, fingerprint, result, candidate["coverage"], work_dir, target_file, compile_command, report,
+                    [os.path.join(work_dir, name) for name in VALIDATION_ARTIFACTS])
+
+
+def remove_workspaces(candidates, keep=None):
+    """
+    Remove the work directories of candidates, except the one of `keep`: the best candidate of the iteration, whose
+    error log and coverage export the next prompt is built from. The validation store keeps its own copy of these
+    artifacts, so the recorded validations are still reused, see `ValidationStore.get`.
+    """
+    for candidate in candidates:
+        if candidate is not keep:
+            shutil.rmtree(candidate["work_dir"], ignore_errors=True)
+
+
+def format_percentage(coverage):
+    """Format a coverage percentage, or pass on the error message `extract_coverage_percentage` returned instead."""
+    return f"{coverage:.2f}%" if isinstance(coverage, (int, float)) else str(coverage)
+
+
+def candidate_rank(candidate):
+    """
+    Sort key of a validated candidate: valid drivers first, then compiling drivers, then the highest coverage.
+    """
+    return (
+        candidate["result"] == "Valid Driver",
+        candidate["result"] != "Compilation Error",
+        candidate["coverage"],
+    )
+
+
+@tracer.traced()
+def run_target(json_file_path, prebuild_shell_path, checkpoint_path=None, output_dir=None, concurrent_targets=1):
+    """
+    Generate a fuzz driver for one target: run the prebuild, then refine candidates until a valid driver is found
+    or `max_iterations` is reached.
+    Args:
+        json_file_path (str): Path to the json file containing the configuration.
+        prebuild_shell_path (str): Path to the prebuild shell script.
+        checkpoint_path (str): Optional checkpoint file. The progress is saved after every iteration, and a run with
+        an existing checkpoint resumes from it; a finished target is not run again.
+        output_dir (str): Directory of the work directories, the corpus and the valid driver (default: `./outputs`).
+        concurrent_targets (int): Number of targets processed at the same time by this process, e.g. by a batch, whose
+        fuzzer runs share the cores with `fuzz_jobs: auto`.
+    Returns:
+        bool: Whether a valid driver was generated.
+    """
+    checkpoint = load_checkpoint(checkpoint_path)
+    if checkpoint and checkpoint["done"]:
+        print(f"{json_file_path} already finished according to {checkpoint_path}, skipping.")
+        return checkpoint["state"] == "success"
 
     # run the prebuild shell commands
-    prebuild_shell_path = sys.argv[2]  # Path to the prebuild shell script
     if not os.path.exists(prebuild_shell_path):
         print(f"Error: Prebuild shell script not found at {prebuild_shell_path}")
-        sys.exit(1)
-    os.system(f"cd {os.path.dirname(prebuild_shell_path)}"
-              f"&& bash {os.path.basename(prebuild_shell_path)}")
+        return False
+    with stage_slot("prebuild"), tracer.span("prebuild"):
+        if not run_prebuild(prebuild_shell_path):
+            return False
 
     # predefined variables
-    json_file_path = sys.argv[1]  # Path to the json file containing the configuration
     if not os.path.exists(json_file_path):
         print(f"Error: Configuration file not found at {json_file_path}")
-        sys.exit(1)
+        return False
     with open(json_file_path, "r") as json_file:
         config = json.load(json_file)
     project_name = config["project_name"]
     target_name = config["target_name"]
+    tracer.annotate(target=f"{project_name}/{target_name}")
     target_function = config["target_function"]
     target_file = config["target_file"]
     test_driver_model_code_path = config["test_driver_model_code_path"]
     max_iterations = config["max_iterations"]
     compile_command = config["compile_command"]
-    current_file_path = os.path.dirname(os.path.abspath(__file__))
+    num_candidates = config.get("num_candidates", 1)
+    public_headers = config.get("public_headers", [])
+    fuzz_budget = config.get("fuzz_budget")
+    # with `auto`, the fuzzer runs at the same time (the candidates of an iteration in every target of a batch, at most
+    # the limit of the fuzz stage) share the cores, see `get_fuzz_jobs`
+    fuzz_jobs = config.get("fuzz_jobs", 1)
+    concurrent_runs = num_candidates * max(1, concurrent_targets)
+    concurrent_runs = min(concurrent_runs, get_stage_limit("fuzz") or concurrent_runs)
+    coverage_digest = config.get("coverage_digest", {})
+    prompt_token_budget = config.get("prompt_token_budget")
+    include_dirs = get_include_dirs(compile_command, os.path.dirname(os.path.abspath(target_file)))
+    output_dir = output_dir or os.path.dirname(os.path.abspath(__file__)) + "/outputs"
+    workspace_root = output_dir + "/temp/workspaces"
+    os.makedirs(workspace_root, exist_ok=True)
+
+    # shared corpus of the target, seeded from the sample inputs of its sources and grown by every fuzzer run
+    corpus_dir = output_dir + f"/corpus/{project_name}_{target_name}"
+    seeded = seed_corpus(corpus_dir, os.path.dirname(os.path.abspath(target_file)), config.get("corpus_seeds", []))
+    if seeded:
+        print(f"Seeded the corpus {corpus_dir} with {seeded} sample input(s).")
+
+    # project API index from the compilation database written by the prebuild, if any
+    api_index = None
+    parse_args = []
+    compile_commands_path = config.get("compile_commands_path")
+    if compile_commands_path and os.path.exists(compile_commands_path):
+        with tracer.span("build_api_index"):
+            api_index = cached_build_api_index(compile_commands_path)
+        for function in api_index["functions"].values():
+            function["include_name"] = get_include_name(function["header"], include_dirs)
+        parse_args = find_parse_args(load_compile_commands(compile_commands_path), target_file)
+    elif compile_commands_path:
+        print(f"Compilation database not found at {compile_commands_path}, building the prompt without API index.")
+
+    # extractor, cached on the content of the target file. The static/macro-defined functions are collected in the
+    # same parse, so filtering does not read the file again
+    with tracer.span("extract_interface_info"):
+        translation_unit_info = cached_extract_translation_unit_info(target_file, parse_args)
+    filtered_api_info = filter_interfaces(translation_unit_info["interfaces"],
+                                          static_or_macro_functions=translation_unit_info["static_or_macro_functions"])
 
-    # extractor
-    api_info = extract_interface_info(target_file)
-    filtered_api_info = filter_interfaces(api_info, target_file)
+    # the libraries are built once with the instrumentation of the compile command, every candidate then only
+    # compiles and links its driver
+    build = None
+    if config.get("incremental_build", True):
+        with stage_slot("prebuild"), tracer.span("prepare_incremental_build"):
+            build = prepare_incremental_build(compile_command, os.path.dirname(os.path.abspath(target_file)),
+                                              compile_commands_path)
+    # recorded validations are only reused with the same libraries, the key of an incremental build covers them
+    libraries = build["key"] if build else hash_link_inputs(split_compile_command(compile_command)[2],
+                                                            os.path.dirname(os.path.abspath(target_file)))
 
     state = "init"
+    best_candidate = None
+    first_iteration = 0
+    if checkpoint:
+        print(f"Resuming {project_name}/{target_name} after iteration {checkpoint['iteration']} ({checkpoint['state']}).")
+        first_iteration = checkpoint["iteration"]
+        state = checkpoint["state"]
+        best_candidate = checkpoint["best_candidate"]
+    # LLM backends, escalating from the first to the next after repeated failed iterations
+    router = make_router(config.get("llm"), checkpoint.get("router") if checkpoint else None)
 
-    for i in range(max_iterations):
+    for i in range(first_iteration, max_iterations):
         # prompt_generator
         prompt = ""
         if state == "init":
-            prompt = generate_gpt_prompt(filtered_api_info, project_name, target_name, test_driver_model_code_path)
+            prompt = generate_gpt_prompt(filtered_api_info, project_name, target_name, test_driver_model_code_path,
+                                         api_index, prompt_token_budget)
         elif state == "compile_err":
-            with open(current_file_path + "/outputs/temp/candidate_fuzz_drivers/raw.c", "r") as file:
+            with open(best_candidate["driver_path"], "r") as file:
                 invalid_driver_code = file.read()
-            prompt = generate_compiler_error_prompt(invalid_driver_code,project_name, target_name, current_file_path+"/outputs/temp/error_logs/raw_error_log.txt")
+            # deduplicated root causes instead of the raw (often cascading) compiler output
+            with open(best_candidate["error_log_path"], "r") as file, tracer.span("summarize_compiler_errors"):
+                error_summary = summarize_compiler_errors(file.read(), include_dirs)
+            error_summary_path = os.path.join(best_candidate["work_dir"], "error_summary.txt")
+            with open(error_summary_path, "w") as file:
+                file.write(error_summary)
+            prompt = generate_compiler_error_prompt(invalid_driver_code, project_name, target_name,
+                                                    error_summary_path, test_driver_model_code_path,
+                                                    prompt_token_budget)
         elif state == "low_cov":
-            with open(current_file_path + "/outputs/temp/candidate_fuzz_drivers/raw.c", "r") as file:
+            with open(best_candidate["driver_path"], "r") as file:
                 invalid_driver_code = file.read()
-            prompt = gen_cov_improve_prompt(invalid_driver_code,project_name, target_name,
-                                            current_file_path+"/outputs/temp/coverage/raw_coverage.txt")
+            # only the most relevant uncovered code goes into the prompt, not the whole coverage report
+            with tracer.span("summarize_uncovered"):
+                coverage_export_path = os.path.join(best_candidate["work_dir"], COVERAGE_EXPORT_NAME)
+                if not os.path.exists(coverage_export_path):
+                    export_function_coverage(best_candidate["work_dir"], best_candidate["driver_path"])
+                digest = summarize_uncovered(coverage_export_path, invalid_driver_code, best_candidate["driver_path"],
+                                             **coverage_digest)
+            coverage_digest_path = os.path.join(best_candidate["work_dir"], "coverage_digest.txt")
+            with open(coverage_digest_path, "w") as file:
+                file.write(digest)
+            prompt = gen_cov_improve_prompt(invalid_driver_code, project_name, target_name, coverage_digest_path,
+                                            test_driver_model_code_path, prompt_token_budget)
 
-        # llm_model
-        llm_response = generate_fuzz_driver_llm(prompt)
-
-        # candidate_generator
-        api_info = {
-            "required_headers": [],  # TODO: customize required header files here
-        }
-        generator = CandidateGenerator()
-        driver_code = generator.generate_driver(llm_response, api_info)
-        # write the driver code to file: /outputs/temp/candidate_fuzz_drivers/raw.c
-        output_path = current_file_path + '/outputs/temp/candidate_fuzz_drivers/raw.c'
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        with open(current_file_path + "/outputs/temp/candidate_fuzz_drivers/raw.c", "w") as file:
-            file.write(driver_code)
-
-        # validator
-        # copy the generated driver to the target directory and set the driver_file_path
-        target_directory = os.path.dirname(target_file)
-        driver_file_path = current_file_path + "/" + target_directory + "/driver.c"
-        os.system(f"cp {current_file_path}/outputs/temp/candidate_fuzz_drivers/raw.c {driver_file_path}")
-        result = validate_driver(driver_file_path, compile_command)
+        # llm_model & candidate_generator & validator
+        candidates = generate_and_validate_candidates(
+            prompt, num_candidates,
+            lambda candidate: validate_candidate(candidate, target_file, compile_command, public_headers,
+                                                 fuzz_budget, workspace_root, corpus_dir, fuzz_jobs, build,
+                                                 libraries, concurrent_runs),
+            router.backend)
+        if not candidates:
+            # counted as a failed iteration, so a backend that keeps failing escalates to the next one
+            print("No driver code could be generated, the LLM requests failed or returned no code. Trying again...")
+            router.record(False)
+            if checkpoint_path:
+                save_checkpoint(checkpoint_path, i + 1, state, best_candidate, router=router.state())
+            continue
+        if best_candidate:
+            # the previous best candidate is only needed for this iteration's prompt
+            remove_workspaces([best_candidate])
+        best_candidate = max(candidates, key=candidate_rank)
+        remove_workspaces(candidates, keep=best_candidate)
+        result = best_candidate["result"]
+        router.record(result == "Valid Driver")
 
         # check the result, perform refining if necessary
         if result == "Valid Driver":
-            print("Driver generated successfully.")
-            # move the generated driver to the valid drivers directory '/outputs/validated_fuzz_drivers'
-            os.makedirs(current_file_path + "/outputs/validated_fuzz_drivers", exist_ok=True)
-            with open(current_file_path + "/outputs/validated_fuzz_drivers/valid_driver.c", "w") as file:
-                file.write(driver_code)
+            print(f"Driver for {project_name}/{target_name} generated successfully.")
+            # move the generated driver to the valid drivers directory of the target
+            valid_driver_dir = output_dir + f"/validated_fuzz_drivers/{project_name}_{target_name}"
+            os.makedirs(valid_driver_dir, exist_ok=True)
+            with open(valid_driver_dir + "/valid_driver.c", "w") as file:
+                file.write(best_candidate["code"])
             state = "success"
+            if checkpoint_path:
+                save_checkpoint(checkpoint_path, i + 1, state, best_candidate, done=True, router=router.state())
             break
         elif result == "Compilation Error":
             print("Compilation error. Trying again...")
             state = "compile_err"
         elif result == "Low Coverage":
-            print("Low coverage. Trying again...")
+            driver_coverage = extract_coverage_percentage(best_candidate["coverage_summary_path"],
+                                                          [best_candidate["driver_path"]])
+            print(f"Low coverage of the driver ({format_percentage(driver_coverage)}, "
+                  f"{format_percentage(best_candidate['coverage'])} with the libraries). Trying again...")
             state = "low_cov"
+        if checkpoint_path:
+            save_checkpoint(checkpoint_path, i + 1, state, best_candidate, router=router.state())
 
     if state != "success":
-        print("Failed to generate a valid driver in the given number of iterations.")
+        print(f"Failed to generate a valid driver for {project_name}/{target_name} in the given number of "
+              f"iterations.")
+        if checkpoint_path:
+            save_checkpoint(checkpoint_path, max_iterations, state, best_candidate, done=True, router=router.state())
+    if best_candidate:
+        remove_workspaces([best_candidate])
+    return state == "success"
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python main.py <config_file_path> <prebuild_shell_path>")
+        sys.exit(1)
+    success = run_target(sys.argv[1], sys.argv[2])
+    print(f"Run report written to {tracer.write_report()}")
+    if not success:
+        sys.exit(1)
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import re
+import subprocess
+
+from tracing import tracer
+
+# Archives referenced by a prebuild script, e.g. `tar -zxvf libpng-1.6.29.tar.gz`
+TARBALL_PATTERN = re.compile(r'[\w.+-]+\.(?:tar\.gz|tgz|tar\.xz|tar\.bz2|zip)\b')
+# Directories the script changes into, which is where the libraries are built
+CD_PATTERN = re.compile(r'^\s*cd\s+([^\s;&|]+)', re.MULTILINE)
+
+CACHE_DIR_NAME = ".prebuild_cache"
+
+
+def hash_file(file_path):
+    """
+    Return the SHA-256 hex digest of a file, read in chunks.
+    """
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def get_prebuild_compiler():
+    """
+    Return the C compiler of the prebuild (`$CC`, default: `clang`). `run_prebuild` exports it to the script, so
+    that configure and CMake build with the compiler the cache is keyed on instead of picking `cc` or `gcc`.
+    """
+    return os.getenv("CC") or "clang"
+
+
+def get_compiler_version(compiler=None):
+    """
+    Return the `--version` output of the compiler used by the prebuild, see `get_prebuild_compiler`.
+    """
+    compiler = compiler or get_prebuild_compiler()
+    try:
+        return subprocess.run([compiler, "--version"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compute_prebuild_key(prebuild_shell_path):
+    """
+    Compute the build cache key of a prebuild script.
+    Args:
+        prebuild_shell_path (str): Path to the prebuild shell script.
+    Returns:
+        dict: The key, made of the hash of every tarball the script unpacks, the hash of the script itself and the
+        compiler version.
+    """
+    script_dir = os.path.dirname(os.path.abspath(prebuild_shell_path))
+    with open(prebuild_shell_path, "r") as file:
+        script = file.read()
+
+    tarballs = {}
+    for tarball in sorted(set(TARBALL_PATTERN.findall(script))):
+        tarball_path = os.path.join(script_dir, tarball)
+        if os.path.exists(tarball_path):
+            tarballs[tarball] = hash_file(tarball_path)
+
+    return {
+        "tarballs": tarballs,
+        "script": hashlib.sha256(script.encode("utf-8")).hexdigest(),
+        "compiler": get_compiler_version(),
+    }
+
+
+def find_build_artifacts(prebuild_shell_path):
+    """
+    Find the static libraries produced by a prebuild script, i.e. every `*.a` below the directories it changes into.
+    """
+    script_dir = os.path.dirname(os.path.abspath(prebuild_shell_path))
+    with open(prebuild_shell_path, "r") as file:
+        build_dirs = [os.path.join(script_dir, d) for d in CD_PATTERN.findall(file.read())]
+
+    artifacts = []
+    for build_dir in build_dirs or [script_dir]:
+        for root, dirs, files in os.walk(build_dir):
+            dirs[:] = [d for d in dirs if d != CACHE_DIR_NAME]
+            artifacts.extend(os.path.relpath(os.path.join(root, f), script_dir) for f in files if f.endswith(".a"))
+    return sorted(artifacts)
+
+
+def run_prebuild(prebuild_shell_path):
+    """
+    Run a prebuild script unless its cached build is still valid.
+
+    The cache marker is stored in `.prebuild_cache/<script>.json` next to the script. On a hit (same tarballs, same
+    script, same compiler and all recorded `.a` files present) the build is skipped. Otherwise the script is run
+    with `CC` set to the compiler of the key, and with `PREBUILD_CLEAN=1` if a tarball or the compiler changed, so
+    that it unpacks the sources again; if only the script changed it is run incrementally on the existing sources.
+    Args:
+        prebuild_shell_path (str): Path to the prebuild shell script.
+    Returns:
+        bool: True if the prebuilt libraries are available.
+    """
+    script_dir = os.path.dirname(os.path.abspath(prebuild_shell_path))
+    marker_path = os.path.join(script_dir, CACHE_DIR_NAME, os.path.basename(prebuild_shell_path) + ".json")
+    key = compute_prebuild_key(prebuild_shell_path)
+
+    marker = None
+    if os.path.exists(marker_path):
+        with open(marker_path, "r") as file:
+            marker = json.load(file)
+
+    if marker and marker["key"] == key and marker["artifacts"] and all(
+            os.path.exists(os.path.join(script_dir, artifact)) for artifact in marker["artifacts"]):
+        print(f"Prebuild cache hit for {prebuild_shell_path}, skipping the build.")
+        return True
+
+    env = os.environ.copy()
+    env["CC"] = get_prebuild_compiler()
+    # configure and CMake record the compiler, so a new compiler needs freshly unpacked sources as well
+    if not marker or marker["key"]["tarballs"] != key["tarballs"] or marker["key"]["compiler"] != key["compiler"]:
+        env["PREBUILD_CLEAN"] = "1"
+    result = tracer.run(["bash", os.path.basename(prebuild_shell_path)], cwd=script_dir, env=env)
+    if result.returncode != 0:
+        print(f"Error: Prebuild script {prebuild_shell_path} failed with exit code {result.returncode}")
+        return False
+
+    os.makedirs(os.path.dirname(marker_path), exist_ok=True)
+    with open(marker_path, "w") as file:
+        json.dump({"key": key, "artifacts": find_build_artifacts(prebuild_shell_path)}, file, indent=4)
+    return True
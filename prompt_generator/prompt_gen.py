@@ -1,52 +1,114 @@
+import os
 import re
+from functools import lru_cache
 
-from sympy.physics.units import degree
-
-from extractor.extractor import extract_interface_info
+from prompt_generator.tokenizer import count_tokens
+from tracing.tracer import traced
 
 # Define a list of excluded C library functions
 EXCLUDED_FUNCTIONS = {"strcmp", "fprintf", "malloc", "free", "memcpy", "strlen", "printf","endTimer","__errno_location","(Anonymous Function)","fwrite","fread","fmemopen"}
 
 
+# Tokens relevant to top-level declarations. Comments, string literals and preprocessor directives are matched as a
+# whole so that their content is skipped; everything else (numbers, operators) is skipped by `finditer`.
+TOKEN_PATTERN = re.compile(r"""
+    (?P<comment>/\*.*?\*/|//[^\n]*)
+    |(?P<directive>^[ \t]*\#(?:[^\n\\]|\\.)*)
+    |(?P<string>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+    |(?P<identifier>[A-Za-z_]\w*)
+    |(?P<punctuation>[{}();=])
+""", re.DOTALL | re.MULTILINE | re.VERBOSE)
+MACRO_FUNCTION_PATTERN = re.compile(r'^\s*#\s*define\s+(\w+)\(')
+
+
+def scan_static_or_macro_functions(content):
+    """
+    Find the static or macro-defined functions of C source code with a single linear pass over its tokens.
+    A top-level declaration that contains `static` or an attribute macro (`XXX_ATTR_YYY`) contributes the first
+    identifier followed by `(`, i.e. the function name. Function-like `#define`s are included as well.
+    Args:
+        content (str): The C source code.
+    Returns:
+        set: A set of function names.
+    """
+    functions = set()
+    brace_depth = 0
+    paren_depth = 0
+    marked = False        # the current top-level declaration is static or carries an attribute macro
+    name_found = False    # the name of the current declaration has been seen
+    previous_identifier = None
+
+    for token in TOKEN_PATTERN.finditer(content):
+        kind = token.lastgroup
+        text = token.group()
+        if kind == "identifier":
+            if brace_depth == 0 and (text == "static" or "_ATTR_" in text):
+                marked = True
+            # the arguments of an attribute macro such as `LIBXML_ATTR_FORMAT(1,2)` do not start the function
+            previous_identifier = None if "_ATTR_" in text else text
+            continue
+        if kind == "directive":
+            macro = MACRO_FUNCTION_PATTERN.match(text)
+            if macro:
+                functions.add(macro.group(1))
+        elif kind == "punctuation":
+            if text == "(":
+                if brace_depth == 0 and paren_depth == 0 and marked and not name_found and previous_identifier:
+                    functions.add(previous_identifier)
+                    name_found = True
+                paren_depth += 1
+            elif text == ")":
+                paren_depth = max(paren_depth - 1, 0)
+            elif text == "{":
+                brace_depth += 1
+            elif text == "}":
+                brace_depth = max(brace_depth - 1, 0)
+                if brace_depth == 0:
+                    marked = name_found = False
+            elif text == "=" and brace_depth == 0 and paren_depth == 0:
+                # initializer of a variable, calls in it are not declarations
+                name_found = True
+            elif text == ";" and brace_depth == 0 and paren_depth == 0:
+                marked = name_found = False
+        previous_identifier = None
+    return functions
+
+
 def extract_static_or_macro_functions(file_path):
     """
-    Extract the names of all static or macro-defined functions in a C file.
+    Extract the names of all static or macro-defined functions in a C file. This is the lexer-based fallback of the
+    AST classification done by `extractor.extract_translation_unit_info`.
     Args:
         file_path (str): Path to the C source file.
     Returns:
         set: A set of function names defined as static or using macros.
     """
-    static_functions = set()
-    # Regex pattern to match static or macro-defined functions
-    function_pattern = re.compile(
-        r'\b(static|[\w_]+_ATTR_[\w_]+)\b[\s\S]*?\b(\w+)\s*\(', re.MULTILINE
-    )
-
     try:
-        with open(file_path, 'r') as file:
+        with open(file_path, 'r', errors='replace') as file:
             content = file.read()
-            matches = function_pattern.finditer(content)
-            for match in matches:
-                # The function name is captured in the second group
-                static_functions.add(match.group(2))
     except FileNotFoundError:
         raise FileNotFoundError(f"Source file '{file_path}' not found.")
     except Exception as e:
         raise Exception(f"Error reading the source file: {e}")
 
-    return static_functions
+    return scan_static_or_macro_functions(content)
 
 
-def filter_interfaces(interfaces, file_path):
+def filter_interfaces(interfaces, file_path=None, static_or_macro_functions=None):
     """
     Filter out standard C library functions and static/macro-defined functions from the interfaces.
     Args:
         interfaces (list): List of interface dictionaries.
-        file_path (str): Path to the C source file.
+        file_path (str): Path to the C source file, scanned for static/macro-defined functions when
+            `static_or_macro_functions` is not given.
+        static_or_macro_functions (list): Names of the static/macro-defined functions, as collected during
+            extraction. The source file is not read again when they are given.
     Returns:
         list: Filtered interfaces.
     """
-    static_or_macro_functions = extract_static_or_macro_functions(file_path)
+    if static_or_macro_functions is None:
+        static_or_macro_functions = extract_static_or_macro_functions(file_path)
+    static_or_macro_functions = set(static_or_macro_functions)
     return [
         interface for interface in interfaces
         if interface["function_name"] not in EXCLUDED_FUNCTIONS
@@ -55,86 +117,212 @@ def filter_interfaces(interfaces, file_path):
 
 
 
-def generate_gpt_prompt(interfaces, project_name, target, test_driver_model_code_path):
+@lru_cache(maxsize=None)
+def load_template(template_path):
     """
-    Generate a single GPT prompt based on the filtered interface information
-    and project-specific details using a provided code template.
-
+    Read a prompt template. Templates are read once per process.
     Args:
-        interfaces (list): List of filtered interface information.
-        project_name (str): Name of the project.
-        target (str): Target being tested.
-        test_driver_model_code_path (str): File path to the code template for the test driver.
-
+        template_path (str): Path to the template file.
     Returns:
-        str: A GPT-friendly prompt for generating a unified test driver.
+        str: The template content.
     """
-    # Read the code template from the file
     try:
-        with open(test_driver_model_code_path, "r") as file:
-            test_driver_model_code = file.read()
+        with open(template_path, "r") as file:
+            return file.read()
     except FileNotFoundError:
-        raise FileNotFoundError(f"Template file '{test_driver_model_code_path}' not found.")
+        raise FileNotFoundError(f"Template file '{template_path}' not found.")
     except Exception as e:
         raise Exception(f"Error reading the template file: {e}")
 
-    # Add general project context to the prompt
-    prompt = (
-        "You are a code assistant specializing in fuzz testing. Your task is to create a unified test driver program "
-        "using LibFuzzer to test functions in the project. Below are the project details:\n\n"
-    )
 
-    # Insert the project-specific information
-    prompt += f"project_name: {project_name}\n\n"
-    prompt += f"target: {target}\n\n"
-
-    # Explain the purpose of the test driver
-    prompt += (
+def format_interface(interface, api_index=None):
+    """
+    Render the prompt section of a single interface.
+    """
+    function_name = interface["function_name"]
+    section = f"### Function Name: {function_name}\n"
+    indexed_function = api_index["functions"].get(function_name) if api_index else None
+    if indexed_function:
+        section += f"Signature: {indexed_function['signature']}\n"
+        # `include_name` is resolved against the include directories of the target, see `get_include_name`
+        include_name = indexed_function.get("include_name") or os.path.basename(indexed_function["header"])
+        section += f"Declared in: #include <{include_name}>\n"
+    section += "Parameters:\n"
+    for param in interface["parameters"]:
+        section += f"- {param['type']} {param['name']}\n"
+    return section + "\n"
+
+
+def build_static_prefix(test_driver_model_code_path):
+    """
+    Build the prefix shared by every prompt: the general context, the requirements of the test driver, the code
+    template and the guidance. It does not depend on the target or the iteration, so provider-side prompt caching
+    can reuse it for the initial prompt as well as the refinement prompts.
+    Args:
+        test_driver_model_code_path (str): File path to the code template for the test driver.
+    Returns:
+        str: The prefix.
+    """
+    test_driver_model_code = load_template(test_driver_model_code_path)
+    return (
+        "You are a code assistant specializing in fuzz testing. Your task is to create a unified test driver program "
+        "using LibFuzzer to test functions in the project. The project details and the task are given at the "
+        "end.\n\n"
         "The test driver program should:\n"
         "1. Be compatible with LibFuzzer.\n"
-        "2. Test the following functions (excluding system call functions, standard input and output, etc. and well-tested library functions)\n\n"
-    )
-
-    # Add interface details
-    for interface in interfaces:
-        function_name = interface["function_name"]
-        parameters = interface["parameters"]
-
-        # Add function name and parameter details
-        prompt += f"### Function Name: {function_name}\n"
-        prompt += "Parameters:\n"
-        for param in parameters:
-            param_type = param["type"]
-            param_name = param["name"]
-            prompt += f"- {param_type} {param_name}\n"
-        prompt += "\n"
-
-    # Add code template guidance
-    prompt += (
+        "2. Test the listed functions (excluding system call functions, standard input and output, etc. and "
+        "well-tested library functions)\n\n"
         "Use the following code template as a guide for structuring the test driver:\n\n"
         f"{test_driver_model_code}\n\n"
-    )
-
-    # Provide additional guidance on generating the driver
-    prompt += (
-        "Based on the above information, generate a single test driver program that:\n"
-        "1. Implements a LibFuzzer-compatible entry point (LLVMFuzzerTestOneInput).\n"
-        "2. Fuzzes all the above functions by:\n"
+        "A test driver program must:\n"
+        "1. Implement a LibFuzzer-compatible entry point (LLVMFuzzerTestOneInput).\n"
+        "2. Fuzz all the functions to test by:\n"
         "   - Extracting parameter values from the fuzzed input.\n"
         "   - Calling each function with appropriate parameters.\n"
-        "3. Incorporates project-specific constraints and best practices.\n"
-        "4. Handles edge cases and invalid inputs gracefully.\n\n"
-        "Provide the complete C code for the test driver. Don't generate anything other than the C code."
+        "3. Incorporate project-specific constraints and best practices.\n"
+        "4. Handle edge cases and invalid inputs gracefully.\n\n"
+        "Provide the complete C code for the test driver. Don't generate anything other than the C code.\n\n"
+    )
+
+
+def check_prefix_budget(prefix, token_budget):
+    """
+    Warn when the static prefix alone does not fit the token budget. The prefix is not truncated, since its
+    instructions and code template are needed by every prompt; the budget should be raised or the template shortened.
+    Returns:
+        int: The tokens left after the prefix, or None without a budget.
+    """
+    if token_budget is None:
+        return None
+    remaining = token_budget - count_tokens(prefix)
+    if remaining < 0:
+        print(f"Warning: the static prompt prefix ({count_tokens(prefix)} tokens) exceeds the prompt token budget "
+              f"({token_budget} tokens).")
+    return remaining
+
+
+def format_project_details(project_name, target):
+    """
+    Render the project details, which follow the static prefix in every prompt.
+    """
+    return (
+        "Below are the project details:\n\n"
+        f"project_name: {project_name}\n\n"
+        f"target: {target}\n\n"
     )
 
-    return prompt
 
-def generate_compiler_error_prompt(driver_code,project_name, target, error_message_file_path):
+def truncate_to_budget(text, token_budget):
+    """
+    Keep the leading lines of a text that fit in a token budget. The error summaries and coverage digests sent in
+    the refinement prompts are ranked, so their first lines are the most useful ones.
+    Args:
+        text (str): The text to truncate.
+        token_budget (int): Maximum size of the result in tokens.
+    Returns:
+        str: The text, or its leading lines followed by a truncation note.
+    """
+    if count_tokens(text) <= token_budget:
+        return text
+    note = "... (truncated to fit the prompt token budget)"
+    remaining = token_budget - count_tokens(note)
+    kept = []
+    for line in text.splitlines():
+        line_tokens = count_tokens(line + "\n")
+        if line_tokens > remaining:
+            break
+        kept.append(line)
+        remaining -= line_tokens
+    return "\n".join(kept + [note])
+
+
+def build_refinement_prompt(prefix, project_name, target, task, driver_code, section_title, section, token_budget):
     """
-    Generate a GPT prompt to refine a fuzzing driver based on a compiler error.
+    Assemble a refinement prompt: the static prefix, the project details, the task, the driver and the section
+    describing its problem. With a token budget, only the section is truncated to make the prompt fit.
+    """
+    remaining = check_prefix_budget(prefix, token_budget)
+
+    def render(content):
+        return (
+            format_project_details(project_name, target)
+            + task
+            + "Here is the fuzzing driver code:\n"
+            f"```\n{driver_code}\n```\n\n"
+            f"Here is the {section_title}:\n"
+            f"```\n{content}\n```\n\n"
+            "**Ensure that your response only contains the corrected code.**\n"
+        )
+
+    if remaining is not None:
+        section = truncate_to_budget(section, remaining - count_tokens(render("")))
+    return prefix + render(section)
+
+
+@traced()
+def generate_gpt_prompt(interfaces, project_name, target, test_driver_model_code_path, api_index=None,
+                        token_budget=None):
+    """
+    Generate a single GPT prompt based on the filtered interface information
+    and project-specific details using a provided code template.
+
+    The prompt starts with the static prefix of `build_static_prefix`, shared with the refinement prompts. The
+    project details and the interfaces follow. When a token budget is given, the interfaces are ranked by how often
+    the target calls them and only the ones that fit are kept.
+
+    Args:
+        interfaces (list): List of filtered interface information.
+        project_name (str): Name of the project.
+        target (str): Target being tested.
+        test_driver_model_code_path (str): File path to the code template for the test driver.
+        api_index (dict): Optional project API index (see `indexer/api_index.py`), whose `functions` entries
+            provide the exact signature and the header (`include_name`, or the basename of `header`) of each
+            function.
+        token_budget (int): Optional maximum size of the prompt in tokens.
+
+    Returns:
+        str: A GPT-friendly prompt for generating a unified test driver.
+    """
+    prefix = build_static_prefix(test_driver_model_code_path)
+    remaining = check_prefix_budget(prefix, token_budget)
+
+    # Insert the project-specific information
+    project_details = (
+        format_project_details(project_name, target)
+        + "Generate a single test driver program for the functions below.\n\n"
+        "Functions to test:\n\n"
+    )
+
+    # Add interface details, the most frequently called first when they have to be trimmed
+    sections = [format_interface(interface, api_index) for interface in interfaces]
+    if remaining is not None:
+        ranking = sorted(range(len(interfaces)), key=lambda k: len(interfaces[k].get("seen_line", [])), reverse=True)
+        remaining -= count_tokens(project_details)
+        kept = set()
+        for k in ranking:
+            section_tokens = count_tokens(sections[k])
+            if section_tokens <= remaining:
+                kept.add(k)
+                remaining -= section_tokens
+        sections = [sections[k] for k in ranking if k in kept]
+        if len(kept) < len(interfaces):
+            print(f"Prompt token budget: kept {len(kept)} of {len(interfaces)} interfaces.")
+
+    return prefix + project_details + "".join(sections)
+
+@traced()
+def generate_compiler_error_prompt(driver_code, project_name, target, error_message_file_path,
+                                   test_driver_model_code_path, token_budget=None):
+    """
+    Generate a GPT prompt to refine a fuzzing driver based on a compiler error. It starts with the same static
+    prefix as the initial prompt, see `build_static_prefix`.
     Args:
         driver_code (str): The original fuzzing driver code.
+        project_name (str): Name of the project.
+        target (str): Target being tested.
         error_message_file_path (str): The file path containing the compiler error message.
+        test_driver_model_code_path (str): File path to the code template for the test driver.
+        token_budget (int): Optional maximum size of the prompt in tokens, the error message is truncated to fit.
     Returns:
         str: A GPT-friendly prompt for refining the driver.
     """
@@ -147,39 +335,25 @@ def generate_compiler_error_prompt(driver_code,project_name, target, error_messa
     except Exception as e:
         return f"Error: An unexpected error occurred while reading the file: {e}"
 
-    # Generate the GPT-friendly prompt
-    prompt = (
-        "You are a code refinement assistant specializing in fuzzing drivers. "
-        "The user has provided a piece of C code intended to act as a fuzzing driver by using libFuzzer, "
-        "along with a compiler error message encountered during compilation. "
-        "Your task is to analyze the error message, identify the issues, and provide "
-        "corrected code that compiles successfully.\n\n"
-        "Here is the fuzzing driver code:\n"
-        f"```\n{driver_code}\n```\n\n"
-        "Here is the compiler error message:\n"
-        f"```\n{error_message}\n```\n\n"
-        "Please provide the following:\n"
-        "1. The corrected C code for the fuzzing driver.\n"
-        "**Ensure that your response only contains the corrected code.**"
-    )
-
-    prompt += "\n\n"
-
-    prompt += (
-        "Here are the additional project details:\n\n"
-    )
-
-    # Insert the project-specific information
-    prompt += f"project_name: {project_name}\n"
-    prompt += f"target: {target}\n\n"
-    return prompt
+    # The per-iteration content follows the prefix and the project details
+    task = ("The following test driver fails to compile. Analyze the compiler error message, identify the issues, "
+            "and provide corrected code that compiles successfully.\n\n")
+    return build_refinement_prompt(build_static_prefix(test_driver_model_code_path), project_name, target, task,
+                                   driver_code, "compiler error message", error_message, token_budget)
 
-def gen_cov_improve_prompt(driver_code,project_name, target, coverage_report_path):
+@traced()
+def gen_cov_improve_prompt(driver_code, project_name, target, coverage_report_path, test_driver_model_code_path,
+                           token_budget=None):
     """
-    Generate a GPT prompt to refine a fuzzing driver based on low coverage.
+    Generate a GPT prompt to refine a fuzzing driver based on low coverage. It starts with the same static prefix
+    as the initial prompt, see `build_static_prefix`.
     Args:
         driver_code (str): The original fuzzing driver code.
+        project_name (str): Name of the project.
+        target (str): Target being tested.
         coverage_report_path (str): The path to the coverage report file.
+        test_driver_model_code_path (str): File path to the code template for the test driver.
+        token_budget (int): Optional maximum size of the prompt in tokens, the coverage report is truncated to fit.
     Returns:
         str: A GPT-friendly prompt for refining the driver.
     """
@@ -192,34 +366,15 @@ def gen_cov_improve_prompt(driver_code,project_name, target, coverage_report_pat
     except Exception as e:
         return f"Error: An unexpected error occurred while reading the file: {e}"
 
-    # Generate the GPT-friendly prompt
-    prompt = (
-        "You are a code refinement assistant specializing in fuzzing drivers. "
-        "The user has provided a piece of C code intended to act as a fuzzing driver, "
-        "along with a coverage report indicating low code coverage. "
-        "Your task is to analyze the coverage report, identify the areas of low coverage, "
-        "and provide corrected code that improves the coverage.\n\n"
-        "Here is the fuzzing driver code:\n"
-        f"```\n{driver_code}\n```\n\n"
-        "Here is the coverage report:\n"
-        f"```\n{coverage_report}\n```\n\n"
-        "Please provide the following:\n"
-        "1. The corrected C code for the fuzzing driver that improves the code coverage.\n"
-        "**Ensure that your explanation is clear and concise.**"
-    )
-
-    prompt += "\n\n"
-
-    prompt += (
-        "Here are the additional project details:\n\n"
-    )
-
-    # Insert the project-specific information
-    prompt += f"project_name: {project_name}\n"
-    prompt += f"target: {target}\n\n"
-    return prompt
+    # The per-iteration content follows the prefix and the project details
+    task = ("The following test driver reaches too little of the target's code. Analyze the coverage report, "
+            "identify the areas of low coverage, and provide corrected code that improves the coverage.\n\n")
+    return build_refinement_prompt(build_static_prefix(test_driver_model_code_path), project_name, target, task,
+                                   driver_code, "coverage report", coverage_report, token_budget)
 
 if __name__ == "__main__":
+    from extractor.extractor import extract_interface_info
+
     file_path = "../targets/libpng-1.6.29/contrib/libtests/readpng.c"
 
     # Extract the interfaces from the source file
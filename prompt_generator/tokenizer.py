@@ -0,0 +1,33 @@
+# may use `pip install tiktoken` for exact token counts, a character-based estimate is used otherwise
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+_encoding = None
+# set when the encoding cannot be loaded (its file is downloaded on first use), so it is only attempted once
+_encoding_failed = False
+
+
+def estimate_tokens(text):
+    """Estimate the tokens of a text at about four characters per token."""
+    return len(text) // 4 + 1
+
+
+def count_tokens(text):
+    """
+    Count the tokens of a text with the local `cl100k_base` tokenizer (the GPT-4 encoding) when `tiktoken` is
+    installed and its encoding can be loaded, or estimate them at about four characters per token.
+    """
+    global _encoding, _encoding_failed
+    if tiktoken is None or _encoding_failed:
+        return estimate_tokens(text)
+    if _encoding is None:
+        try:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            print(f"Warning: cannot load the cl100k_base tokenizer ({type(e).__name__}: {e}), "
+                  f"estimating token counts instead.")
+            _encoding_failed = True
+            return estimate_tokens(text)
+    return len(_encoding.encode(text, disallowed_special=()))
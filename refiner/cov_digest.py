@@ -0,0 +1,97 @@
+import os
+import re
+
+from prompt_generator.tokenizer import count_tokens
+from refiner.cov_model import parse_coverage_export
+
+# Identifiers followed by `(` in the driver: the APIs it calls
+CALL_PATTERN = re.compile(r'\b([A-Za-z_]\w*)\s*\(')
+MAX_REGION_LINES = 8  # Longest snippet shown for a single uncovered region
+
+
+def rank_uncovered_functions(functions, driver_code, driver_file_path=None):
+    """
+    Rank functions by how promising their uncovered code is for the next refinement.
+
+    The score is the number of uncovered regions, weighted by reachability from the driver: functions the driver
+    calls directly weigh the most, then functions that were executed at least once (they are provably reachable),
+    then functions defined in the same files as the called APIs.
+    Args:
+        functions (list): `FunctionCoverage` items of a full `llvm-cov export`.
+        driver_code (str): Source of the driver.
+        driver_file_path (str): Path to the driver, whose own functions are ignored.
+    Returns:
+        list: `(score, function)` pairs with uncovered regions, best first.
+    """
+    called = set(CALL_PATTERN.findall(driver_code))
+    api_files = {function.filename for function in functions if function.name in called}
+
+    ranked = []
+    for function in functions:
+        if not function.uncovered_regions:
+            continue
+        if driver_file_path and os.path.abspath(function.filename) == os.path.abspath(driver_file_path):
+            continue
+        weight = 1.0
+        if function.name in called:
+            weight += 2.0
+        if function.execution_count > 0:
+            weight += 1.0
+        if function.filename in api_files:
+            weight += 0.5
+        ranked.append((weight * len(function.uncovered_regions), function))
+    ranked.sort(key=lambda item: item[0], reverse=True)
+    return ranked
+
+
+def summarize_uncovered(coverage_export_path, driver_code, driver_file_path=None, top_k=10, token_budget=4000):
+    """
+    Build a compact digest of the uncovered code for a coverage refinement prompt: the overall coverage followed by
+    the uncovered snippets of the top-K ranked functions, cut off at the token budget.
+    Args:
+        coverage_export_path (str): Path to a full (not summary-only) `llvm-cov export` JSON.
+        driver_code (str): Source of the driver.
+        driver_file_path (str): Path to the driver, whose own functions are ignored.
+        top_k (int): Maximum number of functions in the digest.
+        token_budget (int): Maximum size of the digest in tokens.
+    Returns:
+        str: The digest.
+    """
+    coverage = parse_coverage_export(coverage_export_path)
+    totals = coverage.totals
+    digest = (
+        f"Overall coverage: lines {totals.lines.percent:.2f}% ({totals.lines.covered}/{totals.lines.count}), "
+        f"functions {totals.functions.percent:.2f}% ({totals.functions.covered}/{totals.functions.count}), "
+        f"regions {totals.regions.percent:.2f}% ({totals.regions.covered}/{totals.regions.count}), "
+        f"branches {totals.branches.percent:.2f}% ({totals.branches.covered}/{totals.branches.count})\n\n"
+        "Most relevant uncovered code (function, then the source lines that were never executed):\n\n"
+    )
+    used_tokens = count_tokens(digest)
+
+    source_cache = {}
+    for _, function in rank_uncovered_functions(coverage.functions, driver_code, driver_file_path)[:top_k]:
+        if function.filename not in source_cache:
+            try:
+                with open(function.filename, "r", errors="replace") as file:
+                    source_cache[function.filename] = file.readlines()
+            except OSError:
+                source_cache[function.filename] = []
+        lines = source_cache[function.filename]
+
+        section = (f"### {function.name} ({os.path.basename(function.filename)}, "
+                   f"{len(function.uncovered_regions)}/{function.regions.count} regions uncovered, "
+                   f"executed {function.execution_count} times)\n")
+        shown_lines = set()
+        for line_start, _, line_end, _ in function.uncovered_regions:
+            shown_lines.update(range(line_start, min(line_end, line_start + MAX_REGION_LINES - 1) + 1))
+        for line_number in sorted(shown_lines):
+            if line_number <= len(lines):
+                section += f"{line_number:>6}: {lines[line_number - 1].rstrip()}\n"
+        section += "\n"
+
+        section_tokens = count_tokens(section)
+        if used_tokens + section_tokens > token_budget:
+            continue
+        digest += section
+        used_tokens += section_tokens
+    return digest
@@ -2,25 +2,39 @@ import subprocess
 import logging
 import os
 
+from refiner.cov_model import parse_coverage_export
+
 # Ensure the directory exists
 os.makedirs('../outputs/temp/cov_log', exist_ok=True)
 
 # Configure logging
 logging.basicConfig(filename='../outputs/temp/cov_log/coverage.log', level=logging.INFO, format='%(asctime)s - %(message)s')
-def check_coverage(file_path: str) -> bool:
+def check_coverage(file_path: str, source_files: list = None) -> bool | str:
     """
     Check whether the given coverage data satisfies the required threshold.
     .profdata file is used to store the coverage data.
+    `source_files` restricts the check to these files, e.g. the driver: with instrumented libraries the totals
+    also count the library code, which a driver cannot be expected to cover to the threshold. The error message of
+    `extract_coverage_percentage` is returned as it is, e.g. when the driver is not in the report.
     """
-    coverage_percentage = extract_coverage_percentage(file_path)
+    coverage_percentage = extract_coverage_percentage(file_path, source_files)
+    if isinstance(coverage_percentage, str):
+        return coverage_percentage
     required_threshold = 80.0  # Example threshold
     return float(coverage_percentage) >= required_threshold
 
-def extract_coverage_percentage(file_path: str) -> float | str:
+def extract_coverage_percentage(file_path: str, source_files: list = None) -> float | str:
     """
-    Extract the coverage percentage from the given coverage report, and return it.
+    Extract the coverage percentage from the given coverage report, and return it. The report is either the JSON of
+    `llvm-cov export` (preferred) or the text of `llvm-cov report`. With `source_files`, only these files of a JSON
+    report are counted (see `CoverageSummary.overall_percentage`), otherwise the totals. Errors, e.g. a source file
+    missing from the report, are returned as a message starting with `Error`.
     """
     try:
+        # Structured summary written by `llvm-cov export`
+        if file_path.endswith(".json"):
+            return parse_coverage_export(file_path).overall_percentage(source_files)
+
         # Generate the coverage report using llvm-cov
         # llvm_cov_command = [
         #     'llvm-cov', 'report', 'fuzz_driver', '-instr-profile', file_path
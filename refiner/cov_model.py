@@ -0,0 +1,122 @@
+import json
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+# Region kinds in the `llvm-cov export` JSON, see llvm::coverage::CounterMappingRegion::RegionKind
+CODE_REGION = 0
+
+
+@dataclass
+class CoverageCounts:
+    """Covered / total counts of one metric (lines, functions, regions or branches)."""
+    count: int = 0
+    covered: int = 0
+    percent: float = 0.0
+
+    @classmethod
+    def from_json(cls, data: Optional[Dict]) -> "CoverageCounts":
+        if not data:
+            return cls()
+        return cls(count=data.get("count", 0), covered=data.get("covered", 0), percent=data.get("percent", 0.0))
+
+
+@dataclass
+class FileCoverage:
+    """Coverage summary of a source file, or of the whole binary for the totals."""
+    filename: str
+    lines: CoverageCounts
+    functions: CoverageCounts
+    regions: CoverageCounts
+    branches: CoverageCounts
+
+    @classmethod
+    def from_summary(cls, filename: str, summary: Dict) -> "FileCoverage":
+        return cls(
+            filename=filename,
+            lines=CoverageCounts.from_json(summary.get("lines")),
+            functions=CoverageCounts.from_json(summary.get("functions")),
+            regions=CoverageCounts.from_json(summary.get("regions")),
+            branches=CoverageCounts.from_json(summary.get("branches")),
+        )
+
+
+@dataclass
+class FunctionCoverage:
+    """
+    Coverage of a function. `uncovered_regions` holds the `(line_start, col_start, line_end, col_end)` spans of the
+    code regions in the function's own file that were never executed.
+    """
+    name: str
+    filename: str
+    execution_count: int
+    regions: CoverageCounts
+    uncovered_regions: List[Tuple[int, int, int, int]] = field(default_factory=list)
+
+    @classmethod
+    def from_json(cls, data: Dict) -> "FunctionCoverage":
+        code_regions = [region for region in data.get("regions", [])
+                        if region[5] == 0 and region[7] == CODE_REGION]
+        uncovered = [tuple(region[:4]) for region in code_regions if region[4] == 0]
+        total = len(code_regions)
+        covered = total - len(uncovered)
+        return cls(
+            name=data["name"],
+            filename=data["filenames"][0] if data.get("filenames") else "",
+            execution_count=data.get("count", 0),
+            regions=CoverageCounts(count=total, covered=covered, percent=100.0 * covered / total if total else 0.0),
+            uncovered_regions=uncovered,
+        )
+
+
+@dataclass
+class CoverageSummary:
+    """Coverage of a binary: the totals, every source file and, for a full export, every function."""
+    totals: FileCoverage
+    files: Dict[str, FileCoverage]
+    functions: List[FunctionCoverage]
+
+    def overall_percentage(self, filenames: Optional[List[str]] = None) -> float:
+        """
+        The average of the region, function, line and branch coverage, the same figure the validator has always
+        used as its coverage score.
+        Args:
+            filenames: Only count these source files, e.g. the driver without the libraries it is linked with
+            (default: every file, i.e. the totals). Files missing from the export are ignored.
+        Raises:
+            ValueError: If none of `filenames` is in the export.
+        """
+        if not filenames:
+            return (self.totals.regions.percent + self.totals.functions.percent
+                    + self.totals.lines.percent + self.totals.branches.percent) / 4
+        summaries = [self.files[name] for name in filenames if name in self.files]
+        if not summaries:
+            raise ValueError(f"{', '.join(filenames)} not in coverage export")
+        percentages = []
+        for metric in ("regions", "functions", "lines", "branches"):
+            counts = [getattr(summary, metric) for summary in summaries]
+            total = sum(count.count for count in counts)
+            covered = sum(count.covered for count in counts)
+            # llvm-cov reports a metric without any counted item (e.g. no branches) as 0%
+            percentages.append(100.0 * covered / total if total else 0.0)
+        return sum(percentages) / 4
+
+
+def parse_coverage_export(file_path: str) -> CoverageSummary:
+    """
+    Parse the JSON written by `llvm-cov export` (with or without `-summary-only`).
+    Args:
+        file_path (str): Path to the JSON file.
+    Returns:
+        CoverageSummary: The parsed coverage. `functions` is empty for a summary-only export.
+    """
+    with open(file_path, "r") as file:
+        export = json.load(file)
+    data = export["data"][0]
+    files = {f["filename"]: FileCoverage.from_summary(f["filename"], f.get("summary", {}))
+             for f in data.get("files", [])}
+    functions = [FunctionCoverage.from_json(f) for f in data.get("functions", [])]
+    return CoverageSummary(
+        totals=FileCoverage.from_summary("TOTAL", data.get("totals", {})),
+        files=files,
+        functions=functions,
+    )
@@ -1,4 +1,31 @@
 # Extract the error log file
+import os
+import re
+
+# clang diagnostics, e.g. `driver.c:12:5: error: use of undeclared identifier 'png_ptr' [-Wfoo]`
+DIAGNOSTIC_PATTERN = re.compile(
+    r"^(?P<file>[^:\s][^:]*):(?P<line>\d+):(?P<column>\d+): "
+    r"(?P<severity>fatal error|error|warning|note): (?P<message>.*?)(?: \[(?P<flag>[^\]]+)\])?$"
+)
+# Linker errors of GNU ld and lld
+LINKER_PATTERNS = [
+    re.compile(r"undefined reference to [`'](?P<symbol>[^'`]+)'"),
+    re.compile(r"undefined symbol: (?P<symbol>\S+)"),
+]
+ERROR_DETAILS_PREFIX = "Error details: "
+QUOTED_SYMBOL_PATTERN = re.compile(r"'([A-Za-z_]\w*)'")
+
+# Message fragments of errors caused by an unknown (undeclared or misspelled) symbol
+UNKNOWN_SYMBOL_MESSAGES = (
+    "use of undeclared identifier",
+    "unknown type name",
+    "call to undeclared function",
+    "implicit declaration of function",
+    "variable has incomplete type",
+    "incomplete definition of type",
+    "no member named",
+)
+
 
 def extract_error_log(file_path: str) -> str:
     """
@@ -9,4 +36,194 @@ def extract_error_log(file_path: str) -> str:
             error_log = file.read()
         return error_log
     except Exception as e:
-        return f"Error reading log file: {str(e)}"
\ No newline at end of file
+        return f"Error reading log file: {str(e)}"
+
+
+def parse_diagnostics(log_text: str) -> list:
+    """
+    Parse clang and linker output into structured diagnostics.
+    Args:
+        log_text (str): The compiler output.
+    Returns:
+        list: A list of diagnostics, where each item is a dictionary:
+            {
+                "file": "driver.c", "line": 12, "column": 5,
+                "severity": "error", "message": "use of undeclared identifier 'png_ptr'",
+                "snippet": ["   12 |     png_ptr = NULL;", "      |     ^"],
+                "notes": [ ...diagnostics with severity `note`... ]
+            }
+        Linker errors have `file` set to None.
+    """
+    diagnostics = []
+    current = None
+    for line in log_text.splitlines():
+        # the validator prefixes the compiler output with `Error details: `
+        if line.startswith(ERROR_DETAILS_PREFIX):
+            line = line[len(ERROR_DETAILS_PREFIX):]
+        match = DIAGNOSTIC_PATTERN.match(line)
+        if match:
+            diagnostic = {
+                "file": match.group("file"),
+                "line": int(match.group("line")),
+                "column": int(match.group("column")),
+                "severity": match.group("severity"),
+                "message": match.group("message"),
+                "snippet": [],
+                "notes": [],
+            }
+            if diagnostic["severity"] == "note" and diagnostics:
+                diagnostics[-1]["notes"].append(diagnostic)
+            else:
+                diagnostics.append(diagnostic)
+            current = diagnostic
+            continue
+
+        linker_symbol = None
+        for pattern in LINKER_PATTERNS:
+            linker_match = pattern.search(line)
+            if linker_match:
+                linker_symbol = linker_match.group("symbol")
+                break
+        if linker_symbol:
+            diagnostics.append({
+                "file": None, "line": 0, "column": 0, "severity": "error",
+                "message": f"undefined reference to '{linker_symbol}'", "snippet": [], "notes": [],
+            })
+            current = None
+            continue
+
+        # source line and caret printed below a diagnostic
+        if current is not None and len(current["snippet"]) < 2 and line.strip() and (
+                "|" in line or line.lstrip().startswith("^")):
+            current["snippet"].append(line.rstrip())
+        elif not line.startswith(" "):
+            current = None
+    return diagnostics
+
+
+def classify_diagnostic(diagnostic: dict) -> tuple:
+    """
+    Return the root cause of an error as `(kind, subject)`: `("missing header", "foo.h")`,
+    `("unknown symbol", "png_foo")` or `("error", <message>)`.
+    """
+    message = diagnostic["message"]
+    if "file not found" in message:
+        header = re.search(r"'([^']+)'", message)
+        return "missing header", header.group(1) if header else message
+    if message.startswith("undefined reference to") or any(m in message for m in UNKNOWN_SYMBOL_MESSAGES):
+        symbol = QUOTED_SYMBOL_PATTERN.search(message)
+        if symbol:
+            return "unknown symbol", symbol.group(1)
+    return "error", message
+
+
+def group_errors(diagnostics: list) -> list:
+    """
+    Drop warnings, duplicates and cascading errors, and group the remaining errors by root cause.
+
+    An error is considered a cascade when an earlier error was reported on the same line of the same file, or when
+    it follows a fatal error. Errors with the same root cause are merged into one group.
+    Args:
+        diagnostics (list): Diagnostics from `parse_diagnostics`.
+    Returns:
+        list: Groups in order of first appearance, each a dictionary with `kind`, `subject`, `first` (the first
+        diagnostic of the group) and `locations` (every `(file, line)` of the group).
+    """
+    groups = {}
+    seen_lines = set()
+    fatal_seen = False
+    for diagnostic in diagnostics:
+        if diagnostic["severity"] not in ("error", "fatal error") or fatal_seen:
+            continue
+        if diagnostic["message"].startswith("too many errors emitted"):
+            continue
+        location = (diagnostic["file"], diagnostic["line"])
+        key = classify_diagnostic(diagnostic)
+        if key not in groups and diagnostic["file"] is not None and location in seen_lines:
+            continue
+        seen_lines.add(location)
+        group = groups.setdefault(key, {"kind": key[0], "subject": key[1], "first": diagnostic, "locations": []})
+        group["locations"].append(location)
+        if diagnostic["severity"] == "fatal error":
+            fatal_seen = True
+    return list(groups.values())
+
+
+def find_header_declaration(symbol: str, include_dirs: list, header_cache: dict = None):
+    """
+    Find the declaration of a symbol in the headers below the include directories.
+    Args:
+        symbol (str): The symbol name.
+        include_dirs (list): Directories to search.
+        header_cache (dict): Optional cache of header lines, shared between lookups.
+    Returns:
+        str: `header:line: declaration`, or None if the symbol is not declared in any header.
+    """
+    if header_cache is None:
+        header_cache = {}
+    pattern = re.compile(r"\b" + re.escape(symbol) + r"\b")
+    fallback = None
+    for include_dir in include_dirs:
+        for root, _, files in os.walk(include_dir):
+            for name in sorted(files):
+                if not name.endswith(".h"):
+                    continue
+                header_path = os.path.join(root, name)
+                if header_path not in header_cache:
+                    with open(header_path, "r", errors="replace") as file:
+                        header_cache[header_path] = file.readlines()
+                for line_number, line in enumerate(header_cache[header_path], start=1):
+                    if not pattern.search(line):
+                        continue
+                    location = f"{os.path.relpath(header_path, include_dir)}:{line_number}: {line.strip()}"
+                    # prefer declarations over mere uses of the symbol
+                    if "(" in line or "typedef" in line or "struct" in line or "#define" in line:
+                        return location
+                    if fallback is None:
+                        fallback = location
+    return fallback
+
+
+def summarize_compiler_errors(log_text: str, include_dirs: list = None, max_groups: int = 20) -> str:
+    """
+    Turn a raw compiler error log into a short, deduplicated list of root causes for an error refinement prompt.
+    Unknown symbols are annotated with their declaration in the target headers, if any.
+    Args:
+        log_text (str): The raw error log.
+        include_dirs (list): Include directories of the target, searched for declarations.
+        max_groups (int): Maximum number of root causes listed.
+    Returns:
+        str: The summary, or the raw log if it contains no parseable diagnostics.
+    """
+    diagnostics = parse_diagnostics(log_text)
+    groups = group_errors(diagnostics)
+    if not groups:
+        return log_text.strip()
+
+    header_cache = {}
+    summary = f"{len(groups)} distinct root cause(s) from {len(diagnostics)} diagnostics:\n\n"
+    for number, group in enumerate(groups[:max_groups], start=1):
+        first = group["first"]
+        if group["kind"] == "missing header":
+            title = f"Missing header `{group['subject']}`"
+        elif group["kind"] == "unknown symbol":
+            title = f"Unknown symbol `{group['subject']}`"
+        else:
+            title = "Error"
+        where = f"{os.path.basename(first['file'])}:{first['line']}:{first['column']}" if first["file"] else "link"
+        summary += f"{number}. {title} ({len(group['locations'])} occurrence(s), first at {where})\n"
+        summary += f"   {first['severity']}: {first['message']}\n"
+        for snippet_line in first["snippet"]:
+            summary += f"   {snippet_line}\n"
+        for note in first["notes"][:2]:
+            summary += f"   note: {note['message']}\n"
+        if group["kind"] == "unknown symbol" and include_dirs:
+            declaration = find_header_declaration(group["subject"], include_dirs, header_cache)
+            if declaration:
+                summary += f"   Declared in {declaration}\n"
+            else:
+                summary += "   Not declared in any header of the target.\n"
+        summary += "\n"
+    if len(groups) > max_groups:
+        summary += f"... {len(groups) - max_groups} more root cause(s) omitted.\n"
+    return summary
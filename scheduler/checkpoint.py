@@ -0,0 +1,42 @@
+import json
+import os
+import threading
+
+
+def load_checkpoint(checkpoint_path):
+    """
+    Load the progress of a target.
+    Args:
+        checkpoint_path (str): Path to the checkpoint file.
+    Returns:
+        dict: The checkpoint, see `save_checkpoint`, or None if there is none or it cannot be read.
+    """
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return None
+    try:
+        with open(checkpoint_path, "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def save_checkpoint(checkpoint_path, iteration, state, best_candidate=None, done=False, router=None):
+    """
+    Record the progress of a target after an iteration. The file is replaced atomically, so a batch killed at any
+    time leaves either the previous or the new checkpoint behind.
+    Args:
+        checkpoint_path (str): Path to the checkpoint file.
+        iteration (int): Number of iterations completed.
+        state (str): State of the refinement loop: `init`, `compile_err`, `low_cov` or `success`.
+        best_candidate (dict): The best candidate of the last iteration, whose work directory the next prompt is
+        built from.
+        done (bool): Whether the target is finished, successfully or not.
+        router (dict): State of the LLM backend router, see `BackendRouter.state`.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(checkpoint_path)), exist_ok=True)
+    checkpoint = {"iteration": iteration, "state": state, "best_candidate": best_candidate, "done": done,
+                  "router": router}
+    tmp_path = f"{checkpoint_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(checkpoint, file, indent=2)
+    os.replace(tmp_path, checkpoint_path)
@@ -0,0 +1,48 @@
+import threading
+from contextlib import contextmanager
+
+# Stages whose concurrency can be limited. LLM requests are limited by the client itself, see `LLM_MAX_CONCURRENCY`
+STAGES = ("prebuild", "compile", "fuzz")
+
+_limits = {}
+_semaphores = {}
+_lock = threading.Lock()
+
+
+def configure_stage_limits(limits):
+    """
+    Set the maximum number of concurrent tasks per stage, for every target processed by this process.
+    Args:
+        limits (dict): `{stage: limit}` for stages in `STAGES`. A limit of None removes the limit of the stage.
+    """
+    with _lock:
+        for stage, limit in limits.items():
+            if stage not in STAGES:
+                raise RuntimeError(f"Unknown stage '{stage}', expected one of {', '.join(STAGES)}")
+            if limit is None:
+                _limits.pop(stage, None)
+                _semaphores.pop(stage, None)
+            else:
+                _limits[stage] = max(1, int(limit))
+                _semaphores[stage] = threading.BoundedSemaphore(_limits[stage])
+
+
+def get_stage_limit(stage):
+    """Return the concurrency limit of a stage, or None if it is unlimited."""
+    with _lock:
+        return _limits.get(stage)
+
+
+@contextmanager
+def stage_slot(stage):
+    """
+    Hold one slot of a stage for the duration of the block, waiting for a free slot if the stage is at its limit.
+    Stages without a limit do not wait.
+    """
+    with _lock:
+        semaphore = _semaphores.get(stage)
+    if semaphore is None:
+        yield
+        return
+    with semaphore:
+        yield
@@ -1,4 +1,13 @@
-tar -zxvf libjpeg-turbo-3.0.4.tar.gz
-cd llibjpeg-turbo-3.0.4
-cmake -G"Unix Makefiles"
-make
\ No newline at end of file
+set -e
+# build with the compiler the prebuild cache is keyed on, instead of the cc/gcc configure and cmake would pick
+export CC="${CC:-clang}"
+# PREBUILD_CLEAN=1 is set by the prebuild cache when the tarball changed
+if [ "$PREBUILD_CLEAN" = "1" ] || [ ! -d libjpeg-turbo-3.0.4 ]; then
+    rm -rf libjpeg-turbo-3.0.4
+    tar -zxvf libjpeg-turbo-3.0.4.tar.gz
+fi
+cd libjpeg-turbo-3.0.4
+if [ ! -f Makefile ]; then
+    cmake -G"Unix Makefiles" -DCMAKE_EXPORT_COMPILE_COMMANDS=ON
+fi
+make
@@ -1,6 +1,20 @@
-tar -zxvf libxml2-2.13.4.tar.gz
+set -e
+# build with the compiler the prebuild cache is keyed on, instead of the cc/gcc configure and cmake would pick
+export CC="${CC:-clang}"
+# PREBUILD_CLEAN=1 is set by the prebuild cache when the tarball changed
+if [ "$PREBUILD_CLEAN" = "1" ] || [ ! -d libxml2-2.13.4 ]; then
+    rm -rf libxml2-2.13.4
+    tar -zxvf libxml2-2.13.4.tar.gz
+fi
 cd libxml2-2.13.4
-./autogen.sh
-./configure --disable-shared
-make
-echo 'libxml2 build done'
\ No newline at end of file
+if [ ! -f Makefile ]; then
+    ./autogen.sh
+    ./configure --disable-shared
+fi
+# record the compilation database for the API index when bear is available
+if command -v bear >/dev/null 2>&1; then
+    bear --append -- make
+else
+    make
+fi
+echo 'libxml2 build done'
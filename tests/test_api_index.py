@@ -0,0 +1,47 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("clang")
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Builds the index through the cache and reports whether `build_api_index` had to run
+INDEX_SCRIPT = """
+import json, sys
+from indexer import api_index
+builds = []
+build_api_index = api_index.build_api_index
+api_index.build_api_index = lambda *args: builds.append(1) or build_api_index(*args)
+index = api_index.cached_build_api_index(sys.argv[1], jobs=1, cache_dir=sys.argv[2])
+print(json.dumps({"builds": len(builds), "functions": sorted(index["functions"])}))
+"""
+
+
+@pytest.fixture
+def project(tmp_path):
+    (tmp_path / "include").mkdir()
+    (tmp_path / "include" / "lib.h").write_text("int lib_add(int a, int b);\n")
+    (tmp_path / "lib.c").write_text('#include "lib.h"\nint lib_add(int a, int b) { return a + b; }\n')
+    (tmp_path / "compile_commands.json").write_text(json.dumps([
+        {"directory": str(tmp_path), "file": "lib.c", "arguments": ["cc", "-Iinclude", "-c", "lib.c"]},
+    ]))
+    return tmp_path
+
+
+def run_index(project, cache_dir):
+    output = subprocess.run([sys.executable, "-c", INDEX_SCRIPT, str(project / "compile_commands.json"), cache_dir],
+                            cwd=REPO_ROOT, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def test_index_is_cached_across_processes(project, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    assert run_index(project, cache_dir) == {"builds": 1, "functions": ["lib_add"]}
+    assert run_index(project, cache_dir) == {"builds": 0, "functions": ["lib_add"]}
+
+    (project / "lib.c").write_text('#include "lib.h"\nint lib_add(int a, int b) { return b + a; }\n')
+    assert run_index(project, cache_dir)["builds"] == 1
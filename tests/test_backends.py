@@ -0,0 +1,148 @@
+import asyncio
+
+import pytest
+
+from llm_model import llm_cache
+from llm_model.backends import OpenAIBackend
+from llm_model.llm_client import LLMClient
+from llm_model.llm_model import batch_samples, generate_fuzz_drivers_llm_async
+from llm_model.router import BackendRouter, make_router
+from llm_model.stub_server import start_stub_server
+from scheduler.checkpoint import load_checkpoint, save_checkpoint
+
+RESPONSES = [f"```c\nint driver_{index};\n```" for index in range(4)]
+
+
+@pytest.fixture(autouse=True)
+def response_cache(tmp_path, monkeypatch):
+    monkeypatch.delenv("LLM_STREAM", raising=False)
+    monkeypatch.delenv("LLM_CACHE_BYPASS", raising=False)
+    monkeypatch.delenv("LLM_RECORD_PATH", raising=False)
+    monkeypatch.delenv("LLM_REPLAY_PATH", raising=False)
+    cache = llm_cache.ResponseCache(str(tmp_path / "responses.sqlite3"))
+    monkeypatch.setattr(llm_cache, "_default_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def stub():
+    servers = []
+    clients = []
+
+    def start(name="stub", n_sampling=True, max_batch_size=8, **kwargs):
+        server, base_url, state = start_stub_server(**kwargs)
+        servers.append(server)
+        client = LLMClient(base_url=base_url, timeout=10, backoff_base=0.01)
+        clients.append(client)
+        return OpenAIBackend(name, "stub-model", client, n_sampling, max_batch_size), state
+
+    yield start
+    for client in clients:
+        client.close()
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_agenerate_uses_n_sampling(stub):
+    backend, state = stub(responses=RESPONSES)
+    responses = asyncio.run(backend.agenerate("prompt", [0, 1, 2]))
+    assert responses == RESPONSES[:3]
+    assert state.requests == 1
+    assert state.choices == 3
+
+
+def test_agenerate_tops_up_without_n_support(stub):
+    backend, state = stub(responses=RESPONSES, max_n=1)
+    responses = asyncio.run(backend.agenerate("prompt", [0, 1, 2]))
+    assert sorted(responses) == RESPONSES[:3]
+    assert state.requests == 3
+
+
+def test_agenerate_without_n_sampling(stub):
+    backend, state = stub(responses=RESPONSES, n_sampling=False)
+    assert len(asyncio.run(backend.agenerate("prompt", [0, 1]))) == 2
+    assert state.requests == 2
+
+
+def test_batch_samples(stub, monkeypatch):
+    backend, _ = stub(max_batch_size=2)
+    assert batch_samples(5, backend) == [[0, 1], [2, 3], [4]]
+    monkeypatch.setenv("LLM_STREAM", "1")
+    assert batch_samples(3, backend) == [[0], [1], [2]]
+
+
+def test_responses_are_cached(stub, response_cache):
+    backend, state = stub(responses=RESPONSES)
+    first = asyncio.run(generate_fuzz_drivers_llm_async("cached prompt", [0, 1], backend))
+    assert state.requests == 1
+    # a prompt repeated in the same run gets new responses, see `_cache_key`
+    second = asyncio.run(generate_fuzz_drivers_llm_async("cached prompt", [0, 1], backend))
+    assert state.requests == 2
+    assert first != second
+
+
+def test_streaming_stops_after_the_code_block(stub, monkeypatch):
+    text = "```c\n" + "int x;\n" * 20 + "```\n" + "Explanation. " * 50
+    backend, state = stub(responses=[text])
+    monkeypatch.setenv("LLM_STREAM", "1")
+    [response] = asyncio.run(generate_fuzz_drivers_llm_async("streamed prompt", [0], backend))
+    assert response == text[:text.index("```\n", 4) + 3]
+    assert state.requests == 1
+
+
+def test_router_escalates_after_failures(stub):
+    cheap, _ = stub("cheap")
+    strong, _ = stub("strong")
+    router = BackendRouter([cheap, strong], escalate_after=2)
+    router.record(False)
+    assert router.backend is cheap
+    router.record(True)
+    router.record(False)
+    assert router.backend is cheap
+    router.record(False)
+    assert router.backend is strong
+    router.record(False)
+    router.record(False)
+    assert router.backend is strong
+    assert router.state() == {"level": 1, "failures": 2}
+
+
+def test_router_state_survives_a_checkpoint(tmp_path):
+    server, base_url, _ = start_stub_server()
+    try:
+        llm_config = {
+            "backends": {
+                "local": {"base_url": base_url, "model": "local-model"},
+                "hosted": {"base_url": base_url, "model": "hosted-model"},
+            },
+            "route": ["local", "hosted"],
+            "escalate_after": 1,
+        }
+        router = make_router(llm_config)
+        assert router.backend.name == "local"
+        router.record(False)
+        checkpoint_path = str(tmp_path / "target.json")
+        save_checkpoint(checkpoint_path, 1, "compile_err", router=router.state())
+
+        restored = make_router(llm_config, load_checkpoint(checkpoint_path)["router"])
+        assert restored.backend.name == "hosted"
+        assert restored.state() == router.state()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_router_rejects_undefined_backends():
+    with pytest.raises(RuntimeError, match="undefined"):
+        make_router({"backends": {"local": {"base_url": "http://127.0.0.1:1/v1"}}, "route": ["local", "hosted"]})
+
+
+def test_backend_errors_drop_their_batch(stub):
+    pytest.importorskip("clang")
+    from main import generate_and_validate_candidates
+
+    backend, state = stub(responses=RESPONSES, max_batch_size=1, failures=[(400, None)])
+    candidates = generate_and_validate_candidates("failing prompt", 2, lambda candidate: None, backend)
+    assert len(candidates) == 1
+    assert state.requests == 1
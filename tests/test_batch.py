@@ -0,0 +1,27 @@
+import os
+
+import batch
+from batch import get_checkpoint_path, run_batch
+
+
+def test_configs_with_the_same_name_get_their_own_checkpoint(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    first, second = tmp_path / "a" / "libpng_config.json", tmp_path / "b" / "libpng_config.json"
+
+    assert get_checkpoint_path("checkpoints", str(first)) != get_checkpoint_path("checkpoints", str(second))
+    assert get_checkpoint_path("checkpoints", "a/libpng_config.json") == get_checkpoint_path("checkpoints", str(first))
+    assert os.path.basename(get_checkpoint_path("checkpoints", str(first))).startswith("libpng_config_")
+
+
+def test_run_batch_passes_one_checkpoint_per_config(tmp_path, monkeypatch):
+    checkpoints = {}
+
+    def run_target(json_file_path, prebuild_shell_path, checkpoint_path, concurrent_targets=1):
+        checkpoints[json_file_path] = checkpoint_path
+        return True
+
+    monkeypatch.setattr(batch, "run_target", run_target)
+    configs = [str(tmp_path / "a" / "libpng_config.json"), str(tmp_path / "b" / "libpng_config.json")]
+
+    assert run_batch(configs, str(tmp_path / "checkpoints")) == {config: True for config in configs}
+    assert len(set(checkpoints.values())) == 2
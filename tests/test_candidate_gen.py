@@ -0,0 +1,39 @@
+from candidate_generator.candidate_gen import CandidateGenerator, StreamingCodeExtractor
+
+RESPONSE = (
+    "Build it with:\n"
+    "```bash\nclang -fsanitize=fuzzer driver.c\n```\n"
+    "Here is the driver:\n"
+    "```c\nint LLVMFuzzerTestOneInput(const unsigned char *data, unsigned long size) { return 0; }\n```\n"
+    "It calls every function.\n"
+    "```c\nint unused;\n```\n"
+)
+
+
+def stream(text, chunk_size):
+    extractor = StreamingCodeExtractor()
+    for start in range(0, len(text), chunk_size):
+        if extractor.feed(text[start:start + chunk_size]):
+            break
+    return extractor
+
+
+def test_stops_after_the_first_c_block():
+    expected_end = RESPONSE.index("```\nIt calls") + 3
+    for chunk_size in (1, 2, 3, 5, 32, len(RESPONSE)):
+        extractor = stream(RESPONSE, chunk_size)
+        assert extractor.block_end == expected_end
+        assert extractor.response == RESPONSE[:expected_end]
+
+
+def test_streamed_response_yields_the_same_driver():
+    generator = CandidateGenerator()
+    assert generator._extract_code(stream(RESPONSE, 7).response) == generator._extract_code(RESPONSE)
+    assert generator._extract_code(RESPONSE).startswith("int LLVMFuzzerTestOneInput")
+
+
+def test_runs_to_the_end_without_a_c_block():
+    text = "```python\nprint(1)\n```\nno driver here"
+    extractor = stream(text, 4)
+    assert extractor.block_end is None
+    assert extractor.response == text
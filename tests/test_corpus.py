@@ -0,0 +1,83 @@
+import hashlib
+import os
+
+import pytest
+
+from validator import corpus
+from validator.corpus import merge_corpus, seed_corpus, snapshot_corpus
+
+
+def sha1(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+@pytest.fixture
+def target_directory(tmp_path):
+    samples = tmp_path / "target" / "tests"
+    (samples / "nested").mkdir(parents=True)
+    (samples / "a.png").write_bytes(b"first image")
+    (samples / "copy.png").write_bytes(b"first image")
+    (samples / "nested" / "b.png").write_bytes(b"second image")
+    (samples / "c.xml").write_bytes(b"<doc/>")
+    (samples / "huge.png").write_bytes(b"x" * 16)
+    return str(tmp_path / "target")
+
+
+@pytest.mark.parametrize("patterns, expected", [
+    # identical seeds are stored once, under the SHA-1 of their content, and oversized seeds are skipped
+    (["tests/*.png"], {b"first image"}),
+    (["tests/**/*.png"], {b"first image", b"second image"}),
+    (["tests/*.png", "tests/*.xml"], {b"first image", b"<doc/>"}),
+    (["tests/*.gif"], set()),
+])
+def test_seed_corpus(tmp_path, target_directory, monkeypatch, patterns, expected):
+    monkeypatch.setattr(corpus, "MAX_SEED_BYTES", 15)
+    corpus_dir = tmp_path / "outputs" / "corpus"
+
+    assert seed_corpus(str(corpus_dir), target_directory, patterns) == len(expected)
+    assert sorted(os.listdir(corpus_dir)) == sorted(sha1(data) for data in expected)
+
+
+def test_seed_corpus_keeps_an_existing_corpus(tmp_path, target_directory):
+    corpus_dir = tmp_path / "corpus"
+    corpus_dir.mkdir()
+    (corpus_dir / "earned").write_bytes(b"input found by an earlier run")
+
+    assert seed_corpus(str(corpus_dir), target_directory, ["tests/*.png"]) == 0
+    assert os.listdir(corpus_dir) == ["earned"]
+
+
+def test_snapshot_corpus(tmp_path):
+    corpus_dir, run_corpus_dir = tmp_path / "corpus", tmp_path / "run" / "corpus"
+    corpus_dir.mkdir()
+    (corpus_dir / "shared").write_bytes(b"shared input")
+    (corpus_dir / "taken").write_bytes(b"shared version")
+    run_corpus_dir.mkdir(parents=True)
+    (run_corpus_dir / "taken").write_bytes(b"input of the run")
+
+    snapshot_corpus(str(corpus_dir), str(run_corpus_dir))
+
+    assert sorted(os.listdir(run_corpus_dir)) == ["shared", "taken"]
+    assert os.path.samefile(run_corpus_dir / "shared", corpus_dir / "shared")
+    assert (run_corpus_dir / "taken").read_bytes() == b"input of the run"
+
+
+def test_snapshot_of_a_missing_corpus_is_empty(tmp_path):
+    snapshot_corpus(str(tmp_path / "missing"), str(tmp_path / "run"))
+
+    assert os.listdir(tmp_path / "run") == []
+
+
+@pytest.mark.parametrize("exit_code, merged", [(0, True), (1, False)])
+def test_merge_corpus(tmp_path, exit_code, merged):
+    # records its arguments and the profile file it would write
+    binary = tmp_path / "fuzzer"
+    binary.write_text(f'#!/bin/sh\necho "$@ $LLVM_PROFILE_FILE" > merge.log\nexit {exit_code}\n')
+    binary.chmod(0o755)
+
+    result = merge_corpus(str(binary), str(tmp_path / "corpus"), str(tmp_path / "run"), str(tmp_path),
+                          {"PATH": os.environ["PATH"], "LLVM_PROFILE_FILE": "driver.profraw"})
+
+    assert result is merged
+    assert (tmp_path / "merge.log").read_text() == \
+           f"-merge=1 {tmp_path / 'corpus'} {tmp_path / 'run'} {os.devnull}\n"
@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+from refiner import cov_digest
+from refiner.cov_digest import rank_uncovered_functions, summarize_uncovered
+from refiner.cov_model import CoverageCounts, FunctionCoverage
+
+DRIVER_CODE = """
+int LLVMFuzzerTestOneInput(const uint8_t *data, size_t size) {
+    png_read(data, size);
+    return 0;
+}
+"""
+
+
+def function(name, filename, execution_count, uncovered):
+    regions = [(line, 1, line, 10) for line in range(1, uncovered + 1)]
+    return FunctionCoverage(name=name, filename=filename, execution_count=execution_count,
+                            regions=CoverageCounts(count=uncovered + 1, covered=1), uncovered_regions=regions)
+
+
+FUNCTIONS = [
+    function("other_unreached", "/src/other.c", 0, 4),
+    function("png_helper", "/src/png.c", 3, 2),
+    function("png_read", "/src/png.c", 1, 2),
+    function("png_covered", "/src/png.c", 5, 0),
+    function("LLVMFuzzerTestOneInput", "/work/driver.c", 1, 1),
+]
+
+
+@pytest.mark.parametrize("driver_code, driver_file_path, expected", [
+    # called: +2, executed: +1, in the file of a called API: +0.5, times the uncovered regions
+    (DRIVER_CODE, "/work/driver.c", [(9.0, "png_read"), (5.0, "png_helper"), (4.0, "other_unreached")]),
+    # without the driver path, the functions of the driver are ranked as well
+    (DRIVER_CODE, None,
+     [(9.0, "png_read"), (5.0, "png_helper"), (4.5, "LLVMFuzzerTestOneInput"), (4.0, "other_unreached")]),
+    # nothing called: equal scores keep the order of the export
+    ("int main(void) { return 0; }", "/work/driver.c",
+     [(4.0, "other_unreached"), (4.0, "png_helper"), (4.0, "png_read")]),
+])
+def test_rank_uncovered_functions(driver_code, driver_file_path, expected):
+    ranked = rank_uncovered_functions(FUNCTIONS, driver_code, driver_file_path)
+
+    assert [(score, function.name) for score, function in ranked] == expected
+
+
+def region(line_start, line_end, count):
+    # line_start, col_start, line_end, col_end, count, file_id, expanded_file_id, kind
+    return [line_start, 1, line_end, 2, count, 0, 0, 0]
+
+
+@pytest.fixture
+def export_path(tmp_path):
+    source = tmp_path / "png.c"
+    source.write_text("".join(f"line {number}\n" for number in range(1, 41)))
+    counts = {"count": 10, "covered": 5, "percent": 50.0}
+    path = tmp_path / "coverage.json"
+    path.write_text(json.dumps({"data": [{
+        "files": [],
+        "functions": [
+            {"name": "png_read", "count": 1, "filenames": [str(source)],
+             "regions": [region(1, 3, 1), region(2, 2, 0), region(10, 30, 0)]},
+            {"name": "png_unreached", "count": 0, "filenames": [str(source)], "regions": [region(35, 36, 0)]},
+        ],
+        "totals": {"lines": counts, "functions": counts, "regions": counts, "branches": counts},
+    }]}))
+    return str(path)
+
+
+def test_summarize_uncovered(export_path):
+    digest = summarize_uncovered(export_path, DRIVER_CODE)
+
+    assert digest.startswith("Overall coverage: lines 50.00% (5/10), functions 50.00% (5/10)")
+    # long regions are cut after MAX_REGION_LINES lines
+    assert "### png_read (png.c, 2/3 regions uncovered, executed 1 times)\n" \
+           "     2: line 2\n    10: line 10\n" in digest
+    assert "    17: line 17\n" in digest and "    18: line 18\n" not in digest
+    assert digest.index("### png_read") < digest.index("### png_unreached")
+
+
+@pytest.mark.parametrize("top_k, token_budget, sections", [
+    (10, 4000, ["png_read", "png_unreached"]),
+    (1, 4000, ["png_read"]),
+    # 4 lines of overall coverage, 11 lines for png_read and 4 for png_unreached: a section over the budget is
+    # skipped, the smaller ones after it still fit
+    (10, 15, ["png_read"]),
+    (10, 10, ["png_unreached"]),
+    (10, 5, []),
+])
+def test_summarize_uncovered_limits(export_path, monkeypatch, top_k, token_budget, sections):
+    monkeypatch.setattr(cov_digest, "count_tokens", lambda text: text.count("\n"))
+    digest = cov_digest.summarize_uncovered(export_path, DRIVER_CODE, top_k=top_k, token_budget=token_budget)
+
+    assert [line.split()[1] for line in digest.splitlines() if line.startswith("### ")] == sections
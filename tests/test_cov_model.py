@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+from refiner.cov_extractor import check_coverage, extract_coverage_percentage
+from refiner.cov_model import parse_coverage_export
+
+
+def counts(count, covered):
+    return {"count": count, "covered": covered, "percent": 100.0 * covered / count if count else 0.0}
+
+
+def summary(lines, functions, regions, branches):
+    return {"lines": counts(*lines), "functions": counts(*functions), "regions": counts(*regions),
+            "branches": counts(*branches)}
+
+
+@pytest.fixture
+def export_path(tmp_path):
+    path = tmp_path / "coverage.json"
+    path.write_text(json.dumps({"data": [{
+        "files": [
+            {"filename": "/work/driver.c", "summary": summary((10, 9), (2, 2), (20, 18), (4, 3))},
+            {"filename": "/src/lib.c", "summary": summary((100, 10), (10, 1), (200, 20), (0, 0))},
+        ],
+        "totals": summary((110, 19), (12, 3), (220, 38), (4, 3)),
+    }]}))
+    return str(path)
+
+
+@pytest.mark.parametrize("filenames, expected", [
+    (None, (19 / 110 + 3 / 12 + 38 / 220 + 3 / 4) * 25),
+    (["/work/driver.c"], (0.9 + 1.0 + 0.9 + 0.75) * 25),
+    # no branches in the library: llvm-cov reports the metric as 0%
+    (["/src/lib.c"], (0.1 + 0.1 + 0.1 + 0.0) * 25),
+    (["/work/driver.c", "/src/other.c"], (0.9 + 1.0 + 0.9 + 0.75) * 25),
+])
+def test_overall_percentage(export_path, filenames, expected):
+    assert parse_coverage_export(export_path).overall_percentage(filenames) == pytest.approx(expected)
+
+
+def test_driver_missing_from_the_export(export_path):
+    with pytest.raises(ValueError, match="/work/other.c not in coverage export"):
+        parse_coverage_export(export_path).overall_percentage(["/work/other.c"])
+    coverage = extract_coverage_percentage(export_path, ["/work/other.c"])
+    assert coverage.startswith("Error") and "not in coverage export" in coverage
+    assert check_coverage(export_path, ["/work/other.c"]) == coverage
+    assert check_coverage(export_path, ["/work/driver.c"]) is True
+    assert check_coverage(export_path) is False
@@ -0,0 +1,115 @@
+import pytest
+
+from refiner.err_extractor import (classify_diagnostic, find_header_declaration, group_errors, parse_diagnostics,
+                                   summarize_compiler_errors)
+
+UNDECLARED_LOG = """Error details: driver.c:12:5: error: use of undeclared identifier 'png_ptr'
+   12 |     png_ptr = NULL;
+      |     ^
+driver.c:12:15: error: use of undeclared identifier 'png_ptr'
+driver.c:20:5: error: use of undeclared identifier 'png_ptr'
+driver.c:21:5: warning: unused variable 'x' [-Wunused-variable]
+"""
+
+LINKER_LOG = """/usr/bin/ld: driver.o: in function `LLVMFuzzerTestOneInput':
+driver.c:(.text+0x1a): undefined reference to `png_read_frob'
+ld.lld: error: undefined symbol: png_write_frob
+"""
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("'pngx.h' file not found", ("missing header", "pngx.h")),
+    ("use of undeclared identifier 'png_ptr'", ("unknown symbol", "png_ptr")),
+    ("unknown type name 'png_structp'", ("unknown symbol", "png_structp")),
+    ("call to undeclared function 'png_frob'; ISO C99 and later do not support implicit function declarations",
+     ("unknown symbol", "png_frob")),
+    ("no member named 'width' in 'struct png_info'", ("unknown symbol", "width")),
+    ("undefined reference to 'png_read_frob'", ("unknown symbol", "png_read_frob")),
+    ("expected ';' after expression", ("error", "expected ';' after expression")),
+])
+def test_classify_diagnostic(message, expected):
+    assert classify_diagnostic({"message": message}) == expected
+
+
+def test_parse_diagnostics_keeps_snippets_and_notes():
+    diagnostics = parse_diagnostics(UNDECLARED_LOG + "driver.c:12:5: note: did you mean 'png_ptr_t'?\n")
+
+    assert [(d["line"], d["column"], d["severity"]) for d in diagnostics] == [
+        (12, 5, "error"), (12, 15, "error"), (20, 5, "error"), (21, 5, "warning")]
+    assert diagnostics[0]["snippet"] == ["   12 |     png_ptr = NULL;", "      |     ^"]
+    assert diagnostics[-1]["notes"][0]["message"] == "did you mean 'png_ptr_t'?"
+
+
+def test_parse_diagnostics_reads_linker_errors():
+    diagnostics = parse_diagnostics(LINKER_LOG)
+
+    assert [(d["file"], d["message"]) for d in diagnostics] == [
+        (None, "undefined reference to 'png_read_frob'"), (None, "undefined reference to 'png_write_frob'")]
+
+
+@pytest.mark.parametrize("log, expected", [
+    # the same root cause is merged into one group, the warning is dropped
+    (UNDECLARED_LOG, [("unknown symbol", "png_ptr", [("driver.c", 12), ("driver.c", 12), ("driver.c", 20)])]),
+    # errors after a fatal error are cascades
+    ("driver.c:1:10: fatal error: 'pngx.h' file not found\n"
+     "driver.c:5:1: error: unknown type name 'png_structp'\n",
+     [("missing header", "pngx.h", [("driver.c", 1)])]),
+    # a new root cause on an already reported line is a cascade
+    ("driver.c:3:1: error: unknown type name 'png_structp'\n"
+     "driver.c:3:20: error: use of undeclared identifier 'png_ptr'\n"
+     "driver.c:4:1: error: too many errors emitted, stopping now\n",
+     [("unknown symbol", "png_structp", [("driver.c", 3)])]),
+    # linker errors have no line to be a cascade of
+    (LINKER_LOG + "ld.lld: error: undefined symbol: png_write_frob\n",
+     [("unknown symbol", "png_read_frob", [(None, 0)]),
+      ("unknown symbol", "png_write_frob", [(None, 0), (None, 0)])]),
+    ("driver.c:2:1: warning: unused variable 'x'\n", []),
+])
+def test_group_errors(log, expected):
+    groups = group_errors(parse_diagnostics(log))
+
+    assert [(g["kind"], g["subject"], g["locations"]) for g in groups] == expected
+
+
+@pytest.fixture
+def include_dir(tmp_path):
+    (tmp_path / "png.h").write_text("/* png_frob is documented below */\n"
+                                    "extern int png_frob(int value);\n"
+                                    "/* see png_comment_only */\n")
+    return str(tmp_path)
+
+
+@pytest.mark.parametrize("symbol, expected", [
+    ("png_frob", "png.h:2: extern int png_frob(int value);"),
+    ("png_comment_only", "png.h:3: /* see png_comment_only */"),
+    ("png_missing", None),
+])
+def test_find_header_declaration(include_dir, symbol, expected):
+    assert find_header_declaration(symbol, [include_dir]) == expected
+
+
+def test_summarize_compiler_errors(include_dir):
+    log = ("driver.c:12:5: error: call to undeclared function 'png_frob'\n"
+           "driver.c:14:5: error: use of undeclared identifier 'png_missing'\n"
+           "driver.c:15:5: error: use of undeclared identifier 'png_missing'\n")
+
+    summary = summarize_compiler_errors(log, [include_dir])
+
+    assert summary.startswith("2 distinct root cause(s) from 3 diagnostics:")
+    assert "1. Unknown symbol `png_frob` (1 occurrence(s), first at driver.c:12:5)" in summary
+    assert "Declared in png.h:2: extern int png_frob(int value);" in summary
+    assert "2. Unknown symbol `png_missing` (2 occurrence(s), first at driver.c:14:5)" in summary
+    assert "Not declared in any header of the target." in summary
+
+
+def test_summarize_compiler_errors_without_diagnostics_returns_the_log():
+    assert summarize_compiler_errors("  make: *** [all] Error 1\n") == "make: *** [all] Error 1"
+
+
+def test_summarize_compiler_errors_limits_the_groups():
+    log = "".join(f"driver.c:{line}:1: error: unknown type name 'type_{line}'\n" for line in range(1, 6))
+
+    summary = summarize_compiler_errors(log, max_groups=2)
+
+    assert "3. " not in summary
+    assert summary.endswith("... 3 more root cause(s) omitted.\n")
@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("clang")
+
+from extractor.extract_cache import cached_extraction, make_extraction_key
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_key_is_stable_across_processes(tmp_path):
+    source_path = tmp_path / "source.c"
+    source_path.write_text("int f(int x) { return x; }\n")
+    script = ("import sys; from extractor.extract_cache import make_extraction_key; "
+              "print(make_extraction_key('interfaces', [sys.argv[1]], ['-I.']))")
+    keys = [subprocess.run([sys.executable, "-c", script, str(source_path)], cwd=REPO_ROOT, check=True,
+                           capture_output=True, text=True).stdout.strip() for _ in range(2)]
+    assert keys[0] == keys[1] == make_extraction_key("interfaces", [str(source_path)], ["-I."])
+
+
+def test_cached_extraction_hits_until_the_source_changes(tmp_path):
+    source_path = tmp_path / "source.c"
+    source_path.write_text("int f(void);\n")
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"calls": len(calls)}
+
+    cache_dir = str(tmp_path / "cache")
+    assert cached_extraction("interfaces", [str(source_path)], [], compute, cache_dir) == {"calls": 1}
+    assert cached_extraction("interfaces", [str(source_path)], [], compute, cache_dir) == {"calls": 1}
+    assert cached_extraction("interfaces", [str(source_path)], ["-DX"], compute, cache_dir) == {"calls": 2}
+    source_path.write_text("int g(void);\n")
+    assert cached_extraction("interfaces", [str(source_path)], [], compute, cache_dir) == {"calls": 3}
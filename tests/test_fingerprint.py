@@ -0,0 +1,32 @@
+import pytest
+
+from candidate_generator import fingerprint
+from candidate_generator.fingerprint import fingerprint_driver, normalize_driver
+
+
+@pytest.fixture(params=["clang", "pattern"])
+def lexer(request, monkeypatch):
+    if request.param == "clang":
+        pytest.importorskip("clang")
+    else:
+        monkeypatch.setattr(fingerprint, "Index", None)
+    return request.param
+
+
+@pytest.mark.parametrize("first, second, same", [
+    ("int  x =1;", "int x = 1; // one", True),
+    ("/* header */\nint f(void)\n{\n  return 0;\n}\n", "int f(void) { return 0; }", True),
+    ("#define X(a) a\nint y;", "#  define   X(a)   a\nint y;", True),
+    ("#define X(a) a\nint y;", "#define X (a) a\nint y;", False),
+    ("#define X (a)\nint y;", "#define X  (a)\nint y;", True),
+    ("#define X Y\nint f(void);", "#define X Y\nint f (void);", True),
+    ("#include <a.h>\nint y;", "#include <a.h> int y;", False),
+    ("int x = 1;", "int x = 2;", False),
+])
+def test_fingerprint(lexer, first, second, same):
+    assert (fingerprint_driver(first) == fingerprint_driver(second)) is same
+
+
+def test_function_like_macro_keeps_its_parenthesis(lexer):
+    assert normalize_driver("#define X(a) a\nint y;") == "# define X( a ) a\nint y ;"
+    assert normalize_driver("#define X (a)\nint y;") == "# define X ( a )\nint y ;"
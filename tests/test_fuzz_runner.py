@@ -0,0 +1,113 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+from validator import fuzz_runner
+
+
+@pytest.mark.parametrize("fuzz_jobs, concurrent_runs, expected", [
+    (1, 4, 1),
+    ("4", 1, 4),
+    (None, 1, 1),
+    ("auto", 1, 16),
+    ("auto", 3, 5),
+    ("auto", 16, 1),
+    ("auto", 64, 1),
+    ("auto", 0, 16),
+])
+def test_get_fuzz_jobs(monkeypatch, fuzz_jobs, concurrent_runs, expected):
+    monkeypatch.setattr(fuzz_runner.os, "cpu_count", lambda: 16)
+    assert fuzz_runner.get_fuzz_jobs(fuzz_jobs, concurrent_runs) == expected
+
+
+# Prints libFuzzer-like status lines whose coverage never grows, and writes `<role>.profile` when stopped with SIGUSR1,
+# as libFuzzer writes its coverage profile. With `fork`, a child does the same; with `stubborn`, the child ignores
+# SIGUSR1 and has to be killed.
+FAKE_FUZZER = """
+import os, signal, sys, time
+
+def run(role, stop_signal):
+    def stop(signum, frame):
+        with open(role + ".profile", "w") as profile:
+            profile.write(str(os.getpid()))
+        sys.exit(0)
+    signal.signal(signal.SIGUSR1, stop if stop_signal else signal.SIG_IGN)
+    with open(role + ".pid", "w") as pid_file:
+        pid_file.write(str(os.getpid()))
+    execs = 0
+    while True:
+        execs += 1
+        sys.stderr.write(f"#{execs}\\tpulse  cov: 10 ft: 20 corp: 1/1b exec/s: 100 rss: 30Mb\\n")
+        sys.stderr.flush()
+        time.sleep(0.05)
+
+mode = sys.argv[1]
+if mode != "single" and os.fork() == 0:
+    run("child", mode == "fork")
+run("parent", True)
+"""
+
+QUICK_BUDGET = {"min_seconds": 0.5, "max_seconds": 30, "plateau_seconds": 0.5}
+
+
+def run_fake_fuzzer(tmp_path, mode):
+    script = tmp_path / "fake_fuzzer.py"
+    script.write_text(FAKE_FUZZER)
+    return fuzz_runner.run_fuzzer([sys.executable, str(script), mode], str(tmp_path), dict(os.environ),
+                                  fuzz_budget=QUICK_BUDGET)
+
+
+def is_running(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as stat:
+            return stat.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+@pytest.mark.parametrize("mode, profiles", [
+    ("single", ["parent"]),
+    ("fork", ["parent", "child"]),
+])
+def test_plateau_stop_lets_every_process_write_its_profile(tmp_path, mode, profiles):
+    stats = run_fake_fuzzer(tmp_path, mode)
+
+    assert stats["stopped_early"]
+    assert (stats["cov"], stats["ft"]) == (10, 20)
+    assert stats["elapsed"] < fuzz_runner.GRACE_SECONDS
+    for role in profiles:
+        assert (tmp_path / f"{role}.profile").read_text() == (tmp_path / f"{role}.pid").read_text()
+
+
+def test_processes_ignoring_sigusr1_are_killed_after_the_grace_period(tmp_path, monkeypatch):
+    monkeypatch.setattr(fuzz_runner, "GRACE_SECONDS", 1)
+
+    stats = run_fake_fuzzer(tmp_path, "stubborn")
+
+    assert stats["stopped_early"]
+    assert (tmp_path / "parent.profile").exists()
+    assert not (tmp_path / "child.profile").exists()
+    assert not is_running(int((tmp_path / "child.pid").read_text()))
+
+
+def test_kill_process_group_kills_the_children(tmp_path):
+    script = tmp_path / "fake_fuzzer.py"
+    script.write_text(FAKE_FUZZER)
+    process = subprocess.Popen([sys.executable, str(script), "stubborn"], cwd=tmp_path, start_new_session=True,
+                               stderr=subprocess.DEVNULL)
+    while not (tmp_path / "child.pid").exists() or not (tmp_path / "parent.pid").exists():
+        time.sleep(0.05)
+
+    fuzz_runner.kill_process_group(process)
+    process.wait()
+    deadline = time.monotonic() + 5
+    while is_running(int((tmp_path / "child.pid").read_text())) and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    assert process.returncode == -signal.SIGKILL
+    assert not is_running(int((tmp_path / "child.pid").read_text()))
+    fuzz_runner.kill_process_group(process)
@@ -0,0 +1,68 @@
+import json
+import stat
+import sys
+
+import pytest
+
+from validator.incremental_build import DRIVER_SOURCE_DIR, build_driver, restore_driver_path
+
+# Records its arguments and writes its `-o` output, standing in for clang
+FAKE_COMPILER = """#!{python}
+import json, sys
+with open({log!r}, "a") as log:
+    log.write(json.dumps(sys.argv[1:]) + "\\n")
+with open(sys.argv[sys.argv.index("-o") + 1], "w") as output:
+    output.write("object")
+"""
+
+
+@pytest.fixture
+def build(tmp_path, monkeypatch):
+    monkeypatch.setenv("OBJECT_CACHE_DIR", str(tmp_path / "objects"))
+    compiler_path = tmp_path / "cc"
+    compiler_path.write_text(FAKE_COMPILER.format(python=sys.executable, log=str(tmp_path / "cc.log")))
+    compiler_path.chmod(compiler_path.stat().st_mode | stat.S_IXUSR)
+    return {"key": "build", "compile_command": [str(compiler_path)], "link_command": [str(compiler_path)],
+            "link_inputs": []}
+
+
+def compiler_calls(tmp_path):
+    with open(tmp_path / "cc.log", "r") as log:
+        return [json.loads(line) for line in log]
+
+
+def write_driver(directory, code):
+    directory.mkdir()
+    driver_path = directory / "driver.c"
+    driver_path.write_text(code)
+    return str(driver_path)
+
+
+def test_identical_drivers_share_the_object(tmp_path, build):
+    first = write_driver(tmp_path / "candidate_a", "int x;\n")
+    second = write_driver(tmp_path / "candidate_b", "int x;\n")
+    other = write_driver(tmp_path / "candidate_c", "int y;\n")
+
+    assert build_driver(first, build, str(tmp_path), str(tmp_path / "a.bin")) is False
+    assert build_driver(second, build, str(tmp_path), str(tmp_path / "b.bin")) is True
+    assert build_driver(other, build, str(tmp_path), str(tmp_path / "c.bin")) is False
+
+    compiles = [args for args in compiler_calls(tmp_path) if "-c" in args]
+    assert len(compiles) == 2
+    assert f"-ffile-prefix-map={tmp_path / 'candidate_a'}={DRIVER_SOURCE_DIR}" in compiles[0]
+    assert f"-fcoverage-prefix-map={tmp_path / 'candidate_a'}={DRIVER_SOURCE_DIR}" in compiles[0]
+
+
+def test_restore_driver_path(tmp_path):
+    driver_path = str(tmp_path / "driver.c")
+    export_path = tmp_path / "coverage.json"
+    export_path.write_text(json.dumps({"data": [{
+        "files": [{"filename": DRIVER_SOURCE_DIR + "/driver.c"}, {"filename": "/src/lib.c"}],
+        "functions": [{"name": "LLVMFuzzerTestOneInput", "filenames": [DRIVER_SOURCE_DIR + "/driver.c"]},
+                      {"name": "lib_add", "filenames": ["/src/lib.c"]}],
+    }]}))
+
+    restore_driver_path(str(export_path), driver_path)
+    data = json.loads(export_path.read_text())["data"][0]
+    assert [f["filename"] for f in data["files"]] == [driver_path, "/src/lib.c"]
+    assert [f["filenames"] for f in data["functions"]] == [[driver_path], ["/src/lib.c"]]
@@ -0,0 +1,147 @@
+import gc
+import threading
+import time
+
+import pytest
+
+from llm_model.llm_client import LLMClient
+from llm_model.stub_server import DEFAULT_RESPONSE, start_stub_server
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(**kwargs):
+        server, base_url, state = start_stub_server(**kwargs)
+        servers.append(server)
+        return base_url, state
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def make_client(base_url, **kwargs):
+    kwargs.setdefault("backoff_base", 0.01)
+    return LLMClient(base_url=base_url, timeout=10, **kwargs)
+
+
+def test_complete(stub):
+    base_url, state = stub(responses=["first", "second"])
+    client = make_client(base_url)
+    try:
+        assert client.complete("prompt") == "first"
+        assert client.complete_choices("prompt", n=3) == ["second", "first", "second"]
+    finally:
+        client.close()
+    assert state.requests == 2
+    assert state.choices == 4
+
+
+def test_retries_transient_errors(stub):
+    base_url, state = stub(failures=[(503, None), (500, None), (429, None)])
+    client = make_client(base_url, max_retries=3)
+    try:
+        assert client.complete("prompt") == DEFAULT_RESPONSE
+    finally:
+        client.close()
+    assert state.requests == 1
+    assert state.failures == []
+
+
+def test_gives_up_after_max_retries(stub):
+    base_url, state = stub(failures=[(503, None)] * 3)
+    client = make_client(base_url, max_retries=1)
+    try:
+        with pytest.raises(RuntimeError, match="after 2 attempt"):
+            client.complete("prompt")
+    finally:
+        client.close()
+    assert state.requests == 0
+
+
+def test_does_not_retry_client_errors(stub):
+    base_url, state = stub(failures=[(400, None)])
+    client = make_client(base_url, max_retries=3)
+    try:
+        with pytest.raises(RuntimeError, match="HTTP 400"):
+            client.complete("prompt")
+    finally:
+        client.close()
+    assert state.requests == 0
+
+
+def test_honours_retry_after(stub):
+    # the jittered backoff of 0 to 0.01s would retry at once, Retry-After makes the client wait
+    base_url, state = stub(failures=[(429, "0.5")])
+    client = make_client(base_url, max_retries=1)
+    try:
+        start = time.monotonic()
+        assert client.complete("prompt") == DEFAULT_RESPONSE
+        assert time.monotonic() - start >= 0.5
+    finally:
+        client.close()
+
+
+def test_retry_after_is_capped(stub):
+    base_url, state = stub(failures=[(429, "60")])
+    client = make_client(base_url, max_retries=1, backoff_max=0.2)
+    try:
+        start = time.monotonic()
+        assert client.complete("prompt") == DEFAULT_RESPONSE
+        assert time.monotonic() - start < 5
+    finally:
+        client.close()
+
+
+def test_concurrency_limit(stub):
+    base_url, state = stub(latency=0.1)
+    client = make_client(base_url, max_concurrency=2)
+    try:
+        threads = [threading.Thread(target=client.complete, args=("prompt",)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        client.close()
+    assert state.requests == 8
+    assert state.max_in_flight == 2
+
+
+def test_stream_complete(stub):
+    base_url, state = stub()
+    client = make_client(base_url)
+    deltas = []
+    try:
+        assert client.stream_complete("prompt", lambda delta: deltas.append(delta)) == DEFAULT_RESPONSE
+    finally:
+        client.close()
+    assert len(deltas) > 1
+    assert "".join(deltas) == DEFAULT_RESPONSE
+
+
+def test_malformed_response_raises_runtime_error(stub):
+    base_url, state = stub(failures=[(200, None), (200, None)])
+    client = make_client(base_url)
+    try:
+        with pytest.raises(RuntimeError, match="not valid JSON"):
+            client.complete("prompt")
+        with pytest.raises(RuntimeError, match="Malformed LLM stream chunk"):
+            client.stream_complete("prompt", lambda delta: False)
+        assert client.complete("prompt") == DEFAULT_RESPONSE
+    finally:
+        client.close()
+
+
+def test_aborted_stream_is_closed(stub, caplog):
+    base_url, state = stub()
+    client = make_client(base_url)
+    try:
+        assert client.stream_complete("prompt", lambda delta: True) == DEFAULT_RESPONSE[:32]
+    finally:
+        client.close()
+    gc.collect()
+    assert "Task was destroyed" not in caplog.text
@@ -0,0 +1,93 @@
+import hashlib
+
+import pytest
+
+from prebuild.prebuild_cache import compute_prebuild_key, find_build_artifacts, hash_file, run_prebuild
+
+# Builds a library from the tarball and records the compiler and whether a clean build was asked for
+PREBUILD_SCRIPT = """tar -zxvf libfoo-1.0.tar.gz 2>/dev/null
+mkdir -p libfoo
+cd libfoo
+echo "CC=$CC CLEAN=$PREBUILD_CLEAN" >> ../prebuild.log
+touch libfoo.a
+"""
+
+
+def make_compiler(path, version):
+    path.write_text(f"#!/bin/sh\necho '{version}'\n")
+    path.chmod(0o755)
+    return str(path)
+
+
+@pytest.fixture
+def target(tmp_path, monkeypatch):
+    monkeypatch.setenv("CC", make_compiler(tmp_path / "cc", "clang version 18.1.1"))
+    (tmp_path / "libfoo-1.0.tar.gz").write_bytes(b"sources 1.0")
+    (tmp_path / "build.sh").write_text(PREBUILD_SCRIPT)
+    return tmp_path
+
+
+def test_hash_file(tmp_path):
+    path = tmp_path / "data"
+    path.write_bytes(b"x" * (3 << 20))
+
+    assert hash_file(str(path)) == hashlib.sha256(b"x" * (3 << 20)).hexdigest()
+
+
+@pytest.mark.parametrize("change, changed_parts", [
+    (lambda target: None, set()),
+    (lambda target: (target / "libfoo-1.0.tar.gz").write_bytes(b"sources 1.0.1"), {"tarballs"}),
+    (lambda target: (target / "build.sh").write_text(PREBUILD_SCRIPT + "ranlib libfoo.a\n"), {"script"}),
+    (lambda target: make_compiler(target / "cc", "clang version 19.1.0"), {"compiler"}),
+    # tarballs the script mentions but that are not there are not part of the key
+    (lambda target: (target / "build.sh").write_text(PREBUILD_SCRIPT + "# see libbar-2.0.tgz\n"), {"script"}),
+])
+def test_compute_prebuild_key(target, change, changed_parts):
+    script_path = str(target / "build.sh")
+    key = compute_prebuild_key(script_path)
+    change(target)
+    new_key = compute_prebuild_key(script_path)
+
+    assert key["tarballs"] == {"libfoo-1.0.tar.gz": hashlib.sha256(b"sources 1.0").hexdigest()}
+    assert key["compiler"] == "clang version 18.1.1"
+    assert {part for part in key if key[part] != new_key[part]} == changed_parts
+
+
+def test_find_build_artifacts(target):
+    (target / "libfoo" / "lib").mkdir(parents=True)
+    (target / "libfoo" / "lib" / "libfoo.a").touch()
+    (target / "libfoo" / ".prebuild_cache").mkdir()
+    (target / "libfoo" / ".prebuild_cache" / "stale.a").touch()
+    (target / "other.a").touch()
+
+    assert find_build_artifacts(str(target / "build.sh")) == ["libfoo/lib/libfoo.a"]
+
+
+@pytest.mark.parametrize("change, log", [
+    (lambda target: None, []),
+    # only the script changed: incremental build on the unpacked sources
+    (lambda target: (target / "build.sh").write_text(PREBUILD_SCRIPT + "# incremental\n"), ["CLEAN="]),
+    (lambda target: (target / "libfoo-1.0.tar.gz").write_bytes(b"sources 1.0.1"), ["CLEAN=1"]),
+    (lambda target: make_compiler(target / "cc", "clang version 19.1.0"), ["CLEAN=1"]),
+    # a missing library is rebuilt even if the key is the same
+    (lambda target: (target / "libfoo" / "libfoo.a").unlink(), ["CLEAN="]),
+])
+def test_run_prebuild(target, change, log):
+    script_path = str(target / "build.sh")
+    assert run_prebuild(script_path)
+    assert (target / "prebuild.log").read_text() == f"CC={target / 'cc'} CLEAN=1\n"
+    (target / "prebuild.log").unlink()
+    change(target)
+
+    assert run_prebuild(script_path)
+
+    runs = (target / "prebuild.log").read_text().splitlines() if (target / "prebuild.log").exists() else []
+    assert [run.split()[1] for run in runs] == log
+    assert (target / "libfoo" / "libfoo.a").exists()
+
+
+def test_failed_prebuild_is_not_cached(target):
+    (target / "build.sh").write_text("exit 3\n")
+
+    assert not run_prebuild(str(target / "build.sh"))
+    assert not (target / ".prebuild_cache").exists()
@@ -0,0 +1,82 @@
+import pytest
+
+from prompt_generator import tokenizer
+from prompt_generator.prompt_gen import build_static_prefix, format_interface, gen_cov_improve_prompt, \
+    generate_compiler_error_prompt, generate_gpt_prompt, scan_static_or_macro_functions, truncate_to_budget
+from prompt_generator.tokenizer import count_tokens
+
+MODEL_PATH = "prompt_generator/model.c"
+# called less often than `common` but more than `rare`, and too long to fit in the budget of `rare`
+MEDIUM = "medium_called_function_with_a_long_name"
+
+
+@pytest.fixture(autouse=True)
+def estimated_tokens(monkeypatch):
+    # deterministic counts, independent of tiktoken and its downloaded encoding
+    monkeypatch.setattr(tokenizer, "tiktoken", None)
+
+
+def make_interface(name, calls):
+    return {"function_name": name, "parameters": [{"type": "int", "name": "value"}], "seen_line": [0] * calls}
+
+
+@pytest.mark.parametrize("text, budget, expected", [
+    ("short", 100, "short"),
+    ("a" * 40 + "\n" + "b" * 40 + "\n" + "c" * 200, 35, "a" * 40 + "\n" + "b" * 40 + "\n"
+     "... (truncated to fit the prompt token budget)"),
+    ("a" * 400, 20, "... (truncated to fit the prompt token budget)"),
+])
+def test_truncate_to_budget(text, budget, expected):
+    assert truncate_to_budget(text, budget) == expected
+
+
+@pytest.mark.parametrize("budget_for, kept", [
+    (["rare", "common", MEDIUM], ["common", MEDIUM, "rare"]),
+    (["common", MEDIUM], ["common", MEDIUM]),
+    (["common", "rare"], ["common", "rare"]),
+    ([], []),
+])
+def test_initial_prompt_keeps_the_most_called_interfaces(budget_for, kept):
+    interfaces = [make_interface("rare", 1), make_interface("common", 9), make_interface(MEDIUM, 4)]
+    budget = count_tokens(generate_gpt_prompt([], "project", "target", MODEL_PATH))
+    budget += sum(count_tokens(format_interface(make_interface(name, 0))) for name in budget_for)
+
+    prompt = generate_gpt_prompt(interfaces, "project", "target", MODEL_PATH, token_budget=budget)
+    names = [line.split(": ", 1)[1] for line in prompt.splitlines() if line.startswith("### Function Name:")]
+    assert names == kept
+
+
+@pytest.mark.parametrize("generate, title", [
+    (generate_compiler_error_prompt, "compiler error message"),
+    (gen_cov_improve_prompt, "coverage report"),
+])
+def test_refinement_prompt_fits_the_budget(tmp_path, generate, title):
+    section_path = tmp_path / "section.txt"
+    section_path.write_text("\n".join(f"line {k}: " + "x" * 60 for k in range(200)))
+    budget = count_tokens(build_static_prefix(MODEL_PATH)) + 500
+
+    prompt = generate("int driver;", "project", "target", str(section_path), MODEL_PATH, budget)
+    assert count_tokens(prompt) <= budget
+    assert f"Here is the {title}:\n```\nline 0: " in prompt
+    assert "... (truncated to fit the prompt token budget)" in prompt
+    assert prompt.endswith("**Ensure that your response only contains the corrected code.**\n")
+
+    assert "line 199: " in generate("int driver;", "project", "target", str(section_path), MODEL_PATH)
+
+
+@pytest.mark.parametrize("content, expected", [
+    ("static int helper(int value) { return value; }\nint api(void) { return helper(1); }\n", {"helper"}),
+    ("static inline void\nhelper(void)\n{\n}\n", {"helper"}),
+    # attribute macros mark the declaration, their arguments are not the name
+    ("XMLPUBFUN void LIBXML_ATTR_FORMAT(2,3) xmlPrintf(void *ctx, const char *msg, ...);\n", {"xmlPrintf"}),
+    ("#define png_min(a, b) ((a) < (b) ? (a) : (b))\n#define PNG_MAX 10\n#define png_call (a)\n", {"png_min"}),
+    ("#define png_multi(a) \\\n    png_call(a)\n", {"png_multi"}),
+    # calls in initializers, bodies, comments and strings are not declarations
+    ("static int table = compute(3);\nstatic void run(void) { static int nested(void); }\n", {"run"}),
+    ("/* static int commented(void); */\nconst char *text = \"static int quoted(void);\";\n", set()),
+    ("int api(void);\nstruct png { int (*callback)(void); };\n", set()),
+    # a declaration ends at `;`, the next one is not static
+    ("static int counter;\nint api(void);\n", set()),
+])
+def test_scan_static_or_macro_functions(content, expected):
+    assert scan_static_or_macro_functions(content) == expected
@@ -0,0 +1,28 @@
+import json
+
+import pytest
+
+from llm_model.replay import ReplayBackend, record_response
+
+
+def test_replays_a_recorded_run(tmp_path):
+    recording_path = str(tmp_path / "recording.json")
+    for prompt, sample, response in [("first", 0, "a"), ("first", 1, "b"), ("second", 0, "c"), ("first", 0, "d")]:
+        record_response(recording_path, prompt, "gpt-4", sample, response)
+
+    replay = ReplayBackend(recording_path)
+    assert replay.complete("first", 1) == "b"
+    # a repeated prompt gets its responses in turn, then the last one
+    assert [replay.complete("first") for _ in range(3)] == ["a", "d", "d"]
+    # a prompt that was not recorded gets the next unused response of its sample
+    assert replay.complete("changed prompt") == "c"
+    replay.rewind()
+    assert replay.complete("second") == "c"
+
+
+def test_rejects_responses_without_a_key(tmp_path):
+    recording_path = tmp_path / "recording.json"
+    recording_path.write_text(json.dumps({"model": "gpt-4", "responses": [{"key": None, "sample": 0,
+                                                                           "response": "a"}]}))
+    with pytest.raises(RuntimeError, match="without a prompt key"):
+        ReplayBackend(str(recording_path))
@@ -0,0 +1,58 @@
+import os
+import shutil
+
+import pytest
+
+from validator import syntax_check
+from validator.syntax_check import build_pch, get_include_dirs, get_parse_flags
+
+
+@pytest.mark.parametrize("compile_command, flags", [
+    (["clang", "-g", "-fsanitize=fuzzer", "-o", "driver", "driver.c", "./.libs/libpng.a"], []),
+    (["clang", "-I", "include", "-Isrc", "-DX=1", "-std=c11", "-Wall", "-Wl,--gc-sections", "driver.c"],
+     ["-I", "include", "-Isrc", "-DX=1", "-std=c11", "-Wall"]),
+    (["clang", "-isystem", "/opt/include", "-include", "config.h", "-x", "c", "-lm"],
+     ["-isystem", "/opt/include", "-include", "config.h", "-x", "c"]),
+])
+def test_get_parse_flags(compile_command, flags):
+    assert get_parse_flags(compile_command) == flags
+
+
+def test_get_include_dirs():
+    assert get_include_dirs(["clang", "-I", "include", "-Isrc/../lib", "-isystem/opt/include"], "/target") == [
+        "/target/include", "/target/lib", "/opt/include"]
+
+
+@pytest.fixture
+def compiler_runs(monkeypatch):
+    runs = []
+    run = syntax_check.tracer.run
+
+    def counted_run(command, **kwargs):
+        runs.append(command)
+        return run(command, **kwargs)
+
+    monkeypatch.setattr(syntax_check.tracer, "run", counted_run)
+    return runs
+
+
+@pytest.mark.skipif(shutil.which("gcc") is None, reason="needs a C compiler")
+def test_pch_is_rebuilt_when_an_included_header_changes(tmp_path, compiler_runs):
+    (tmp_path / "include").mkdir()
+    (tmp_path / "include" / "lib.h").write_text('#include "lib_config.h"\nint lib_add(int a, int b);\n')
+    config_header = tmp_path / "include" / "lib_config.h"
+    config_header.write_text("#define LIB_VERSION 1\n")
+    compile_command = ["gcc", "-Iinclude", "driver.c"]
+
+    pch_path = build_pch(compile_command, ["lib.h"], str(tmp_path))
+    assert os.path.exists(pch_path) and len(compiler_runs) == 1
+    assert build_pch(compile_command, ["lib.h"], str(tmp_path)) == pch_path
+    assert len(compiler_runs) == 1
+
+    config_header.write_text("#define LIB_VERSION 2 /* changed */\n")
+    assert build_pch(compile_command, ["lib.h"], str(tmp_path)) == pch_path
+    assert len(compiler_runs) == 2
+
+    build_pch(compile_command + ["-DNDEBUG"], ["lib.h"], str(tmp_path))
+    build_pch(compile_command + ["-DNDEBUG"], ["lib.h"], str(tmp_path), rebuild=True)
+    assert len(compiler_runs) == 4
@@ -0,0 +1,29 @@
+import pytest
+
+from prompt_generator import tokenizer
+
+
+@pytest.fixture
+def unloaded_tokenizer(monkeypatch):
+    monkeypatch.setattr(tokenizer, "_encoding", None)
+    monkeypatch.setattr(tokenizer, "_encoding_failed", False)
+
+
+def test_estimate_without_tiktoken(unloaded_tokenizer, monkeypatch):
+    monkeypatch.setattr(tokenizer, "tiktoken", None)
+    assert tokenizer.count_tokens("x" * 40) == 11
+
+
+def test_falls_back_once_when_the_encoding_cannot_be_loaded(unloaded_tokenizer, monkeypatch):
+    calls = []
+
+    class OfflineTiktoken:
+        @staticmethod
+        def get_encoding(name):
+            calls.append(name)
+            raise ConnectionError("no network")
+
+    monkeypatch.setattr(tokenizer, "tiktoken", OfflineTiktoken)
+    assert tokenizer.count_tokens("x" * 40) == 11
+    assert tokenizer.count_tokens("x" * 8) == 3
+    assert calls == ["cl100k_base"]
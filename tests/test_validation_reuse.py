@@ -0,0 +1,68 @@
+import json
+import os
+
+import pytest
+
+pytest.importorskip("clang")
+
+import main
+from refiner.cov_extractor import extract_coverage_percentage
+from validator import result_store
+from validator.validator import COVERAGE_SUMMARY_NAME, ERROR_LOG_NAME
+
+
+def coverage_summary(driver_path):
+    counts = {"count": 10, "covered": 5, "percent": 50.0}
+    summary = {metric: counts for metric in ("lines", "functions", "regions", "branches")}
+    return {"data": [{"files": [{"filename": driver_path, "summary": summary}], "totals": summary}]}
+
+
+@pytest.fixture
+def validations(tmp_path, monkeypatch):
+    store = result_store.ValidationStore(str(tmp_path / "store" / "results.sqlite3"))
+    monkeypatch.setattr(result_store, "_default_store", store)
+    calls = []
+
+    def validate_driver(driver_file_path, compile_command, public_headers=None, work_dir=None, **kwargs):
+        calls.append(driver_file_path)
+        with open(os.path.join(work_dir, ERROR_LOG_NAME), "w") as file:
+            file.write("Coverage is too low\n")
+        with open(os.path.join(work_dir, COVERAGE_SUMMARY_NAME), "w") as file:
+            json.dump(coverage_summary(driver_file_path), file)
+        return "Low Coverage"
+
+    monkeypatch.setattr(main, "validate_driver", validate_driver)
+    target_file = tmp_path / "target.c"
+    target_file.write_text("int target(void);\n")
+    workspace_root = tmp_path / "workspaces"
+    workspace_root.mkdir()
+
+    def validate(code):
+        candidate = {"code": code, "fingerprint": code}
+        main.validate_candidate(candidate, str(target_file), ["clang", "target.c"], [], None, str(workspace_root))
+        return candidate
+
+    return validate, calls
+
+
+def test_repeated_driver_is_served_from_the_store(validations):
+    validate, calls = validations
+    first = validate("int driver;")
+    second = validate("int driver;")
+    assert len(calls) == 1
+    assert not first["reused"] and second["reused"]
+    assert second["work_dir"] != first["work_dir"]
+    assert (second["result"], second["coverage"]) == (first["result"], first["coverage"]) == ("Low Coverage", 50.0)
+
+    # the store keeps its own copy of the artifacts, the work directories can go
+    main.remove_workspaces([first, second])
+    assert not os.path.exists(first["work_dir"]) and not os.path.exists(second["work_dir"])
+    third = validate("int driver;")
+    assert len(calls) == 1 and third["reused"]
+    with open(third["error_log_path"], "r") as file:
+        assert file.read() == "Coverage is too low\n"
+    # the reused coverage summary names the driver of the new work directory
+    assert extract_coverage_percentage(third["coverage_summary_path"], [third["driver_path"]]) == 50.0
+
+    validate("int other_driver;")
+    assert len(calls) == 2
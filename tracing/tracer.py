@@ -0,0 +1,193 @@
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+current_file_path = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_TRACE_DIR = current_file_path + "/../outputs/traces"
+
+# Spans open in the current thread or asyncio task, innermost last
+_open_spans = contextvars.ContextVar("open_spans", default=())
+_spans = []
+_spans_lock = threading.Lock()
+_origin = time.perf_counter()
+
+
+@contextmanager
+def span(name, category="stage", **attributes):
+    """
+    Record a span around a block: its wall time, the CPU time of the current thread and the resources of the child
+    processes reaped inside it (CPU time and peak RSS, see `TracedPopen`). Spans nest: the resources of a child
+    process count for every open span of the thread or task.
+    Args:
+        name (str): Name of the span, e.g. `validate_driver`.
+        category (str): Category of the span, e.g. `stage`, `llm` or `subprocess`.
+        **attributes: Extra attributes of the span, more can be added with `annotate`.
+    Yields:
+        dict: The attributes of the span.
+    """
+    record = {
+        "name": name,
+        "category": category,
+        "start": time.perf_counter() - _origin,
+        "thread": threading.get_ident(),
+        "attributes": dict(attributes),
+        "child_cpu": 0.0,
+        "child_max_rss_kb": 0,
+        "children": 0,
+    }
+    # the thread CPU time is meaningless for a coroutine, other tasks run on the same thread in between
+    in_task = _in_asyncio_task()
+    cpu_start = None if in_task else time.thread_time()
+    token = _open_spans.set(_open_spans.get() + (record,))
+    try:
+        yield record["attributes"]
+    finally:
+        _open_spans.reset(token)
+        record["wall"] = time.perf_counter() - _origin - record["start"]
+        record["cpu"] = None if cpu_start is None else time.thread_time() - cpu_start
+        with _spans_lock:
+            _spans.append(record)
+
+
+def _in_asyncio_task():
+    try:
+        return asyncio.current_task() is not None
+    except RuntimeError:
+        return False
+
+
+def annotate(**attributes):
+    """Add attributes, e.g. token counts, to the innermost open span. Does nothing outside of a span."""
+    open_spans = _open_spans.get()
+    if open_spans:
+        open_spans[-1]["attributes"].update(attributes)
+
+
+def traced(name=None, category="stage"):
+    """
+    Decorator recording a span around every call of a function or coroutine function.
+    Args:
+        name (str): Name of the span (default: the name of the function).
+        category (str): Category of the span.
+    """
+    def decorate(function):
+        span_name = name or function.__name__
+        if asyncio.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name, category):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(span_name, category):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _record_child(rusage):
+    for record in _open_spans.get():
+        record["child_cpu"] += rusage.ru_utime + rusage.ru_stime
+        record["child_max_rss_kb"] = max(record["child_max_rss_kb"], rusage.ru_maxrss)
+        record["children"] += 1
+
+
+class TracedPopen(subprocess.Popen):
+    """
+    `subprocess.Popen` that reaps the child with `os.wait4`, so that its resource usage (including the usage of
+    the grandchildren it waited for) is added to the open spans of the thread that waits for it.
+    """
+
+    def _record_wait4(self, pid, flags):
+        pid, status, rusage = os.wait4(pid, flags)
+        if pid == self.pid:
+            _record_child(rusage)
+        return pid, status
+
+    def _try_wait(self, wait_flags):
+        try:
+            return self._record_wait4(self.pid, wait_flags)
+        except ChildProcessError:
+            # the same fallback as `subprocess.Popen`: the child is gone and its status is lost
+            return self.pid, 0
+
+    def _internal_poll(self, _deadstate=None, **kwargs):
+        return super()._internal_poll(_deadstate=_deadstate, _waitpid=self._record_wait4)
+
+
+def run(args, check=False, timeout=None, capture_output=False, **kwargs):
+    """
+    Traced replacement of `subprocess.run`: the child runs inside a `subprocess` span named after the program.
+    Takes the same arguments as `subprocess.run`, except `input`.
+    """
+    if capture_output:
+        kwargs["stdout"] = kwargs["stderr"] = subprocess.PIPE
+    with span(os.path.basename(str(args[0])), "subprocess"):
+        with TracedPopen(args, **kwargs) as process:
+            try:
+                stdout, stderr = process.communicate(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+                raise
+    if check and process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, args, stdout, stderr)
+    return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
+
+
+def summarize_spans(spans):
+    """
+    Aggregate spans by name.
+    Returns:
+        dict: `{name: {count, wall, cpu, child_cpu, child_max_rss_kb, ...}}`, with the summed numeric attributes
+        (e.g. token counts) of the spans, largest total wall time first.
+    """
+    summary = {}
+    for record in spans:
+        stats = summary.setdefault(record["name"], {"category": record["category"], "count": 0, "wall": 0.0,
+                                                    "cpu": 0.0, "child_cpu": 0.0, "child_max_rss_kb": 0})
+        stats["count"] += 1
+        stats["wall"] += record["wall"]
+        stats["cpu"] += record["cpu"] or 0.0
+        stats["child_cpu"] += record["child_cpu"]
+        stats["child_max_rss_kb"] = max(stats["child_max_rss_kb"], record["child_max_rss_kb"])
+        for attribute, value in record["attributes"].items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                stats[attribute] = stats.get(attribute, 0) + value
+    return dict(sorted(summary.items(), key=lambda item: item[1]["wall"], reverse=True))
+
+
+def write_report(trace_dir=None, label="run"):
+    """
+    Write the spans recorded so far as a JSON report (`<label>_<time>.json`, with per-name totals) and as a Chrome
+    trace (`<label>_<time>.trace.json`, for `chrome://tracing` or Perfetto). `TRACE_DIR` sets the default directory.
+    Returns:
+        str: Path to the JSON report.
+    """
+    trace_dir = trace_dir or os.getenv("TRACE_DIR", DEFAULT_TRACE_DIR)
+    os.makedirs(trace_dir, exist_ok=True)
+    with _spans_lock:
+        spans = sorted(_spans, key=lambda record: record["start"])
+    stem = os.path.join(trace_dir, f"{label}_{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}")
+
+    with open(stem + ".json", "w") as file:
+        json.dump({"summary": summarize_spans(spans), "spans": spans}, file, indent=2)
+
+    events = []
+    for record in spans:
+        args = dict(record["attributes"], cpu=record["cpu"], child_cpu=record["child_cpu"],
+                    child_max_rss_kb=record["child_max_rss_kb"])
+        events.append({"name": record["name"], "cat": record["category"], "ph": "X", "pid": os.getpid(),
+                       "tid": record["thread"], "ts": record["start"] * 1e6, "dur": record["wall"] * 1e6,
+                       "args": args})
+    with open(stem + ".trace.json", "w") as file:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+    return stem + ".json"
@@ -0,0 +1,113 @@
+import fcntl
+import glob
+import hashlib
+import os
+import shutil
+import subprocess
+import threading
+from contextlib import contextmanager
+
+from tracing import tracer
+
+# Seed files larger than this are skipped, libFuzzer's default `-max_len` is derived from the corpus
+MAX_SEED_BYTES = 1024 * 1024
+MERGE_TIMEOUT = 600
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+@contextmanager
+def corpus_lock(corpus_dir):
+    """
+    Hold the lock of a shared corpus. It excludes other threads of this process as well as other processes, so
+    several drivers of the same target can be validated at the same time.
+    """
+    corpus_dir = os.path.abspath(corpus_dir)
+    with _thread_locks_guard:
+        thread_lock = _thread_locks.setdefault(corpus_dir, threading.Lock())
+    with thread_lock:
+        with open(corpus_dir + ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def seed_corpus(corpus_dir, target_directory, seed_patterns):
+    """
+    Create the shared corpus of a target, seeded with sample inputs shipped with the target sources (test images,
+    test documents). An existing corpus is left as it is, so it keeps the coverage earned by earlier runs.
+    Args:
+        corpus_dir (str): Directory of the shared corpus.
+        target_directory (str): Directory the seed patterns are relative to.
+        seed_patterns (list): Glob patterns of the seed files, e.g. `["contrib/pngsuite/*.png"]`.
+    Returns:
+        int: Number of seed files added.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(corpus_dir)), exist_ok=True)
+    with corpus_lock(corpus_dir):
+        if os.path.isdir(corpus_dir) and os.listdir(corpus_dir):
+            return 0
+        os.makedirs(corpus_dir, exist_ok=True)
+        added = 0
+        for pattern in seed_patterns:
+            for seed_path in sorted(glob.glob(os.path.join(target_directory, pattern), recursive=True)):
+                if not os.path.isfile(seed_path) or os.path.getsize(seed_path) > MAX_SEED_BYTES:
+                    continue
+                with open(seed_path, "rb") as file:
+                    data = file.read()
+                # libFuzzer names corpus files by the SHA-1 of their content
+                unit_path = os.path.join(corpus_dir, hashlib.sha1(data).hexdigest())
+                if not os.path.exists(unit_path):
+                    with open(unit_path, "wb") as file:
+                        file.write(data)
+                    added += 1
+        return added
+
+
+def snapshot_corpus(corpus_dir, run_corpus_dir):
+    """
+    Populate the corpus directory of a single fuzzer run with the current shared corpus. Files are hard-linked where
+    possible; the run writes its new inputs into its own directory, never into the shared one.
+    """
+    os.makedirs(run_corpus_dir, exist_ok=True)
+    if not os.path.isdir(corpus_dir):
+        return
+    with corpus_lock(corpus_dir):
+        for name in os.listdir(corpus_dir):
+            source = os.path.join(corpus_dir, name)
+            destination = os.path.join(run_corpus_dir, name)
+            if os.path.exists(destination):
+                continue
+            try:
+                os.link(source, destination)
+            except OSError:
+                shutil.copyfile(source, destination)
+
+
+def merge_corpus(binary_path, corpus_dir, run_corpus_dir, work_dir, env):
+    """
+    Merge the inputs of a fuzzer run back into the shared corpus with libFuzzer's `-merge=1`. The merge is
+    additive: only the inputs of the run that add coverage over the shared corpus are copied into it, and no input of
+    the shared corpus (in particular no seed) is ever removed.
+    Args:
+        binary_path (str): The fuzzer binary of the run.
+        corpus_dir (str): Directory of the shared corpus.
+        run_corpus_dir (str): Corpus directory of the run.
+        work_dir (str): Working directory of the merge process.
+        env (dict): Environment of the fuzzer. The coverage profile of the merge is discarded, it would overwrite
+        the profile of the run.
+    Returns:
+        bool: Whether the merge succeeded. On failure the shared corpus keeps at least its previous inputs.
+    """
+    env = dict(env, LLVM_PROFILE_FILE=os.devnull)
+    with corpus_lock(corpus_dir):
+        os.makedirs(corpus_dir, exist_ok=True)
+        try:
+            tracer.run([binary_path, "-merge=1", corpus_dir, run_corpus_dir], cwd=work_dir, env=env,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=MERGE_TIMEOUT, check=True)
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
+            return False
+        return True
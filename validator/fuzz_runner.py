@@ -0,0 +1,164 @@
+import os
+import re
+import signal
+import subprocess
+import threading
+import time
+
+from tracing.tracer import TracedPopen
+
+# libFuzzer status lines, e.g. `#4096	pulse  cov: 215 ft: 389 corp: 31/2114b exec/s: 2048 rss: 31Mb`
+STATS_PATTERN = re.compile(r'^#(\d+)\s*:?\s+(?:\w+\s+)?cov: (\d+) ft: (\d+)')
+CRASH_MARKERS = ("==ERROR:", "deadly signal", "ERROR: libFuzzer")
+
+# The fixed budget used when the target configuration has no `fuzz_budget`
+DEFAULT_FUZZ_BUDGET = {"min_seconds": 60, "max_seconds": 60, "plateau_seconds": 60}
+
+# Time given to a fuzzer and its fork mode children to write their coverage profiles after SIGUSR1, before they are
+# killed
+GRACE_SECONDS = 10
+
+
+def signal_process_group(process, signal_number):
+    """
+    Send a signal to a fuzzer started in its own session and to its children.
+    Returns:
+        bool: Whether a process of the group was still there to receive it.
+    """
+    try:
+        os.killpg(process.pid, signal_number)
+        return True
+    except ProcessLookupError:
+        return False
+
+
+def kill_process_group(process):
+    """Kill a fuzzer started in its own session together with its children."""
+    signal_process_group(process, signal.SIGKILL)
+
+
+def stop_process_group(process):
+    """
+    Stop a fuzzer started in its own session together with its children: SIGUSR1 lets libFuzzer, and every fork
+    mode child, exit gracefully and write its coverage profile. The processes still running after `GRACE_SECONDS`
+    are killed.
+    """
+    deadline = time.monotonic() + GRACE_SECONDS
+    signal_process_group(process, signal.SIGUSR1)
+    # the fuzzer is reaped by poll(), otherwise it would stay in the group as a zombie
+    while process.poll() is None or signal_process_group(process, 0):
+        if time.monotonic() >= deadline:
+            kill_process_group(process)
+            return
+        time.sleep(0.1)
+
+
+def get_fuzz_jobs(fuzz_jobs, concurrent_runs=1):
+    """
+    Resolve the `fuzz_jobs` setting to the number of libFuzzer jobs of one run.
+    Args:
+        fuzz_jobs: A number of jobs, or `auto` to share the cores between the concurrent runs.
+        concurrent_runs (int): Number of fuzzer runs expected at the same time, e.g. the candidates of an iteration
+        times the targets of a batch, bounded by the limit of the fuzz stage.
+    Returns:
+        int: The number of jobs, at least 1.
+    """
+    if fuzz_jobs == "auto":
+        return max(1, (os.cpu_count() or 1) // max(1, concurrent_runs))
+    return max(1, int(fuzz_jobs or 1))
+
+
+def run_fuzzer(command, work_dir, env, fuzz_budget=None, log_file_path=None, jobs=1):
+    """
+    Run a libFuzzer binary with an adaptive time budget.
+
+    libFuzzer's status lines are read from stderr as they arrive. The run is stopped early, through libFuzzer's
+    graceful SIGUSR1 exit so that the coverage profiles are still written (see `stop_process_group`; a fuzzer that
+    does not exit within `GRACE_SECONDS` is killed), once at least `min_seconds` have passed
+    and neither `cov` nor `ft` grew during the last `plateau_seconds`. Drivers that keep finding new coverage run
+    until `max_seconds`. Crashes end the run immediately, as libFuzzer exits on the first crash.
+
+    With more than one job, libFuzzer runs in fork mode (`-fork=N`): the parent process spreads the work over N
+    child processes sharing the corpus, and reports their merged status lines. Every child writes its own coverage
+    profile, so `LLVM_PROFILE_FILE` should contain `%p`.
+    Args:
+        command (list): The fuzzer command, e.g. `['/path/to/driver']`. `-max_total_time` is appended.
+        work_dir (str): Working directory of the fuzzer, where crash inputs are written.
+        env (dict): Environment of the fuzzer process.
+        fuzz_budget (dict): `min_seconds`, `max_seconds` and `plateau_seconds` (default: a fixed 60 seconds).
+        log_file_path (str): Optional file to which the fuzzer output is written.
+        jobs (int): Number of fuzzing processes.
+    Returns:
+        dict: The run statistics: `returncode`, `crashed`, `stopped_early`, `elapsed`, `execs`, `cov`, `ft` and
+        `output_tail` (the last lines of the fuzzer output).
+    """
+    budget = dict(DEFAULT_FUZZ_BUDGET)
+    budget.update(fuzz_budget or {})
+    min_seconds = budget["min_seconds"]
+    max_seconds = max(budget["max_seconds"], min_seconds)
+    plateau_seconds = budget["plateau_seconds"]
+
+    stats = {"execs": 0, "cov": 0, "ft": 0, "crashed": False}
+    tail = []
+    start = time.monotonic()
+    last_growth = [start]
+    lock = threading.Lock()
+
+    options = [f'-max_total_time={max_seconds}']
+    if jobs > 1:
+        options.append(f'-fork={jobs}')
+    # own process group, so that the fork mode children are killed together with the parent
+    process = TracedPopen(command + options, cwd=work_dir, env=env, start_new_session=True,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, errors="replace")
+    log_file = open(log_file_path, "w") if log_file_path else None
+
+    def read_output():
+        for line in process.stderr:
+            if log_file:
+                log_file.write(line)
+            with lock:
+                tail.append(line)
+                del tail[:-50]
+                if any(marker in line for marker in CRASH_MARKERS):
+                    stats["crashed"] = True
+                match = STATS_PATTERN.match(line)
+                if match:
+                    execs, cov, ft = int(match.group(1)), int(match.group(2)), int(match.group(3))
+                    if cov > stats["cov"] or ft > stats["ft"]:
+                        last_growth[0] = time.monotonic()
+                    stats["execs"] = max(stats["execs"], execs)
+                    stats["cov"] = max(stats["cov"], cov)
+                    stats["ft"] = max(stats["ft"], ft)
+
+    reader = threading.Thread(target=read_output, daemon=True)
+    reader.start()
+
+    stopped_early = False
+    try:
+        while process.poll() is None:
+            now = time.monotonic()
+            with lock:
+                plateaued = now - last_growth[0] >= plateau_seconds
+            if not stopped_early and now - start >= min_seconds and plateaued and now - start < max_seconds:
+                # the whole group, so that the fork mode children write their profiles as well
+                stop_process_group(process)
+                stopped_early = True
+            elif now - start > max_seconds + 30:
+                # libFuzzer did not honour its own time limit
+                stop_process_group(process)
+            time.sleep(0.2)
+    finally:
+        # also stops the fork mode children left behind, which would keep stderr open
+        stop_process_group(process)
+        process.wait()
+        reader.join()
+        if log_file:
+            log_file.close()
+
+    stats.update({
+        "returncode": process.returncode,
+        "stopped_early": stopped_early,
+        "elapsed": time.monotonic() - start,
+        "output_tail": "".join(tail),
+    })
+    return stats
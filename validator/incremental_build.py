@@ -0,0 +1,394 @@
+import contextvars
+import fcntl
+import hashlib
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from prebuild.prebuild_cache import get_compiler_version, hash_file
+from tracing import tracer
+from validator.syntax_check import PARSE_FLAG_PREFIXES, PARSE_FLAGS_WITH_VALUE
+
+current_file_path = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OBJECT_CACHE_DIR = current_file_path + "/../outputs/cache/objects"
+LIBRARY_DIR_NAME = ".fuzz_objects"
+# Directory the driver's own directory is mapped to in its object (coverage mapping, debug info), so that the object
+# of a driver does not depend on the work directory it was validated in
+DRIVER_SOURCE_DIR = "/fuzz_driver"
+# Part of the key of the instrumented libraries, bumped when the way they are built changes
+LIBRARY_BUILD_VERSION = 2
+
+# Flags that instrument the code. They are applied to the library objects as well, with `-fsanitize=fuzzer`
+# turned into `fuzzer-no-link`: only the driver binary links libFuzzer's `main`
+INSTRUMENTATION_PREFIXES = ("-fsanitize", "-fno-sanitize", "-fprofile-", "-fno-profile-", "-fcoverage-",
+                            "-fno-coverage-", "-fno-omit-frame-pointer", "-g", "-O")
+# Instrumentation flags a library may have been built with, replaced by the ones of the compile command
+REPLACED_LIBRARY_PREFIXES = ("-fsanitize", "-fno-sanitize", "-fprofile-", "-fcoverage-")
+# Output and dependency file flags of a library command, the object is written to the build directory instead
+DROPPED_LIBRARY_FLAGS = {"-MD", "-MMD", "-MP"}
+DROPPED_LIBRARY_FLAGS_WITH_VALUE = {"-o", "-MF", "-MT", "-MQ"}
+LINK_FLAG_PREFIXES = ("-l", "-L", "-Wl,")
+LINK_FLAGS_WITH_VALUE = {"-l", "-L"}
+LINK_INPUT_SUFFIXES = (".a", ".so", ".o")
+
+
+def split_compile_command(compile_command):
+    """
+    Split the configured compile command into a compile step and a link step. The source file and `-o` are dropped.
+    Args:
+        compile_command (list): The compile command from the configuration.
+    Returns:
+        tuple: `(compile_flags, link_flags, link_inputs)`. The parse flags (`-I`, `-D`, `-std=`, ...) only go to the
+        compile step, the libraries and library paths only to the link step, and every other flag (sanitizers,
+        coverage, debug info) to both.
+    """
+    compile_flags = []
+    link_flags = []
+    link_inputs = []
+    args = compile_command[1:]
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg == "-o" and i + 1 < len(args):
+            i += 2
+            continue
+        if arg in LINK_FLAGS_WITH_VALUE and i + 1 < len(args):
+            link_inputs += [arg, args[i + 1]]
+            i += 2
+            continue
+        if arg in PARSE_FLAGS_WITH_VALUE and i + 1 < len(args):
+            compile_flags += [arg, args[i + 1]]
+            i += 2
+            continue
+        if not arg.startswith("-"):
+            if arg.endswith(LINK_INPUT_SUFFIXES):
+                link_inputs.append(arg)
+        elif arg.startswith(LINK_FLAG_PREFIXES):
+            link_inputs.append(arg)
+        elif arg.startswith(PARSE_FLAG_PREFIXES):
+            compile_flags.append(arg)
+        else:
+            compile_flags.append(arg)
+            link_flags.append(arg)
+        i += 1
+    return compile_flags, link_flags, link_inputs
+
+
+def hash_link_inputs(link_inputs, target_directory):
+    """
+    Hash the libraries and objects of a link, so that results depending on them are invalidated by a new prebuild.
+    Args:
+        link_inputs (list): The link inputs, see `split_compile_command`.
+        target_directory (str): The directory the compile command is run in.
+    Returns:
+        dict: `{input: SHA-256 hex digest}` of every input file that exists.
+    """
+    return {arg: hash_file(os.path.join(target_directory, arg)) for arg in link_inputs
+            if arg.endswith(LINK_INPUT_SUFFIXES) and os.path.isfile(os.path.join(target_directory, arg))}
+
+
+def get_library_flags(compile_command):
+    """
+    Return the instrumentation flags of the compile command, as they apply to the objects of a library.
+    """
+    flags = []
+    for arg in compile_command[1:]:
+        if arg.startswith("-fsanitize="):
+            sanitizers = ["fuzzer-no-link" if sanitizer == "fuzzer" else sanitizer
+                          for sanitizer in arg[len("-fsanitize="):].split(",")]
+            arg = "-fsanitize=" + ",".join(sanitizers)
+        if arg.startswith(INSTRUMENTATION_PREFIXES):
+            flags.append(arg)
+    return flags
+
+
+def load_object_commands(compile_commands_path):
+    """
+    Load the compile commands of the objects of a compilation database.
+    Args:
+        compile_commands_path (str): Path to the compilation database.
+    Returns:
+        dict: `{object name: [{"directory": ..., "arguments": [...], "output": ...}, ...]}`, keyed by the file name
+        of the object (the name of the member in a static library), with one command per object path: projects
+        that build the same sources several times (e.g. the 8/12/16-bit objects of libjpeg-turbo) have several
+        objects of the same name. The arguments do not include the compiler. When the same object was built several
+        times (e.g. by `bear --append`), the last command wins.
+    """
+    with open(compile_commands_path, "r") as file:
+        entries = json.load(file)
+
+    commands = {}
+    for entry in entries:
+        arguments = entry.get("arguments") or shlex.split(entry["command"])
+        if "-c" not in arguments:
+            continue
+        output = entry.get("output")
+        if "-o" in arguments[:-1]:
+            output = arguments[arguments.index("-o") + 1]
+        output = output or os.path.splitext(os.path.basename(entry["file"]))[0] + ".o"
+        output = os.path.normpath(os.path.join(entry["directory"], output))
+        commands.setdefault(os.path.basename(output), {})[output] = {
+            "directory": entry["directory"], "arguments": arguments[1:], "output": output}
+    return {name: list(by_output.values()) for name, by_output in commands.items()}
+
+
+def find_archiver(compiler):
+    """Return the archiver matching the compiler (`llvm-ar` next to it), another `llvm-ar`, or `ar`."""
+    llvm_ar = os.path.join(os.path.dirname(compiler), "llvm-ar")
+    if os.path.exists(llvm_ar):
+        return llvm_ar
+    return shutil.which("llvm-ar") or shutil.which("ar")
+
+
+def find_lld(compiler):
+    """Whether `ld.lld` is available to the compiler, for `-fuse-ld=lld`."""
+    return os.path.exists(os.path.join(os.path.dirname(compiler), "ld.lld")) or shutil.which("ld.lld") is not None
+
+
+@contextmanager
+def _build_lock(build_dir):
+    """Exclude other threads and processes from building the same libraries."""
+    os.makedirs(os.path.dirname(build_dir), exist_ok=True)
+    with open(build_dir + ".lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def build_instrumented_archive(archive_path, object_commands, compiler, library_flags, build_dir, archiver,
+                               jobs=None):
+    """
+    Rebuild a static library with the instrumentation of the compile command. Every member that has a command in
+    the compilation database is compiled again with the instrumentation flags; the other members (e.g. assembly
+    objects) are taken from the original archive unchanged. Members are matched by name, as an archive does not
+    record the paths of its objects, so a library with several members of the same name, or with a member whose
+    name belongs to several objects of the database, cannot be rebuilt.
+    Args:
+        archive_path (str): The original archive.
+        object_commands (dict): Compile commands by object name, see `load_object_commands`.
+        compiler (str): The compiler of the compile command.
+        library_flags (list): The instrumentation flags, see `get_library_flags`.
+        build_dir (str): Directory of the objects and the new archive.
+        archiver (str): The archiver, see `find_archiver`.
+        jobs (int): Number of objects compiled in parallel (default: the number of cores).
+    Returns:
+        tuple: Path to the new archive and the number of instrumented members.
+    Raises:
+        subprocess.CalledProcessError: If an object cannot be compiled or the archive cannot be written.
+        RuntimeError: If the members of the archive cannot be matched to the objects of the database unambiguously.
+    """
+    objects_dir = os.path.join(build_dir, os.path.basename(archive_path) + ".objects")
+    os.makedirs(objects_dir, exist_ok=True)
+    listing = tracer.run([archiver, "t", archive_path], capture_output=True, check=True).stdout.decode()
+    members = [line.strip() for line in listing.splitlines() if line.strip()]
+    duplicates = sorted(member for member, count in Counter(members).items() if count > 1)
+    if duplicates:
+        raise RuntimeError(f"{archive_path} has several members named {', '.join(duplicates[:5])}")
+    ambiguous = sorted(member for member in members if len(object_commands.get(member, [])) > 1)
+    if ambiguous:
+        raise RuntimeError(f"Several objects of the compilation database are named {', '.join(ambiguous[:5])}, "
+                           f"the members of {archive_path} cannot be matched to them")
+
+    def compile_member(member):
+        [command] = object_commands[member]
+        arguments = []
+        i = 0
+        while i < len(command["arguments"]):
+            arg = command["arguments"][i]
+            if arg in DROPPED_LIBRARY_FLAGS_WITH_VALUE:
+                i += 2
+                continue
+            if arg not in DROPPED_LIBRARY_FLAGS and not arg.startswith(REPLACED_LIBRARY_PREFIXES):
+                arguments.append(arg)
+            i += 1
+        tracer.run([compiler, *arguments, *library_flags, "-o", os.path.join(objects_dir, member)],
+                   cwd=command["directory"], capture_output=True, check=True)
+
+    instrumented = [member for member in members if member in object_commands]
+    copied = [member for member in members if member not in object_commands]
+    if copied:
+        tracer.run([archiver, "x", os.path.abspath(archive_path), *copied], cwd=objects_dir, capture_output=True,
+                   check=True)
+    # every object is compiled in a copy of the current context, so the compilers count for the open spans
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, compile_member, member) for member in instrumented]
+        for future in futures:
+            future.result()
+
+    instrumented_archive_path = os.path.join(build_dir, os.path.basename(archive_path))
+    if os.path.exists(instrumented_archive_path):
+        os.remove(instrumented_archive_path)
+    tracer.run([archiver, "rcs", instrumented_archive_path, *(os.path.join(objects_dir, member) for member in members)],
+               capture_output=True, check=True)
+    return instrumented_archive_path, len(instrumented)
+
+
+def prepare_incremental_build(compile_command, target_directory, compile_commands_path=None, jobs=None):
+    """
+    Prepare the per-candidate build of a target: the driver is compiled on its own (see `build_driver`) and linked
+    against static libraries built once with the sanitizer and coverage flags of the compile command, so that the
+    coverage of a driver includes the library code it reaches.
+
+    The instrumented libraries are stored in `.fuzz_objects/<key>/` in the target directory, where the key is made
+    of the compiler version, the instrumentation flags and the hashes of the original archives, so they are rebuilt
+    when the prebuild produced new archives or the flags changed. Archives whose objects are not in the compilation
+    database, or that fail to build, are linked as they are.
+    Args:
+        compile_command (list): The compile command from the configuration.
+        target_directory (str): The directory the compile command is run in.
+        compile_commands_path (str): The compilation database written by the prebuild, if any.
+        jobs (int): Number of library objects compiled in parallel (default: the number of cores).
+    Returns:
+        dict: The build, `{"key", "compile_command", "link_command", "link_inputs", "instrumented"}`, where
+        `instrumented` lists the archives that were replaced.
+    """
+    target_directory = os.path.abspath(target_directory)
+    compiler = compile_command[0]
+    compiler_version = get_compiler_version(compiler)
+    compile_flags, link_flags, link_inputs = split_compile_command(compile_command)
+    if find_lld(compiler):
+        link_flags = link_flags + ["-fuse-ld=lld"]
+
+    archives = [arg for arg in link_inputs
+                if arg.endswith(".a") and os.path.isfile(os.path.join(target_directory, arg))]
+    archiver = find_archiver(compiler)
+    replacements = {}
+    if archives and archiver and compile_commands_path and os.path.exists(compile_commands_path):
+        library_flags = get_library_flags(compile_command)
+        library_key = hashlib.sha256(json.dumps({
+            "version": LIBRARY_BUILD_VERSION,
+            "compiler": compiler_version,
+            "flags": library_flags,
+            "archives": {archive: hash_file(os.path.join(target_directory, archive)) for archive in archives},
+        }, sort_keys=True).encode("utf-8")).hexdigest()
+        build_dir = os.path.join(target_directory, LIBRARY_DIR_NAME, library_key[:16])
+        marker_path = os.path.join(build_dir, "build.json")
+        with _build_lock(build_dir):
+            if os.path.exists(marker_path):
+                with open(marker_path, "r") as file:
+                    marker = json.load(file)
+            else:
+                marker = {"archives": {}, "errors": {}}
+                object_commands = load_object_commands(compile_commands_path)
+                with tracer.span("instrument_libraries", archives=len(archives)):
+                    for archive in archives:
+                        try:
+                            instrumented_path, count = build_instrumented_archive(
+                                os.path.join(target_directory, archive), object_commands, compiler, library_flags,
+                                build_dir, archiver, jobs)
+                        except subprocess.CalledProcessError as e:
+                            output = e.stderr or e.stdout or b""
+                            marker["errors"][archive] = f"{e}\n{output.decode(errors='replace')[-2000:]}"
+                            continue
+                        except RuntimeError as e:
+                            marker["errors"][archive] = str(e)
+                            continue
+                        if count:
+                            marker["archives"][archive] = instrumented_path
+                            print(f"Instrumented {count} object(s) of {archive} with {' '.join(library_flags)}.")
+                os.makedirs(build_dir, exist_ok=True)
+                with open(marker_path + f".{os.getpid()}.{threading.get_ident()}", "w") as file:
+                    json.dump(marker, file, indent=4)
+                os.replace(marker_path + f".{os.getpid()}.{threading.get_ident()}", marker_path)
+        for archive, error in marker["errors"].items():
+            print(f"Failed to instrument {archive}, linking the prebuilt library instead:\n{error}")
+        replacements = marker["archives"]
+    elif archives:
+        print(f"No compilation database or archiver for {', '.join(archives)}, linking the prebuilt libraries.")
+
+    link_inputs = [replacements.get(arg, arg) for arg in link_inputs]
+    build = {
+        "compile_command": [compiler] + compile_flags,
+        "link_command": [compiler] + link_flags,
+        "link_inputs": link_inputs,
+        "instrumented": sorted(replacements),
+    }
+    inputs = hash_link_inputs(link_inputs, target_directory)
+    build["key"] = hashlib.sha256(json.dumps(dict(build, compiler=compiler_version, inputs=inputs,
+                                                  directory=target_directory),
+                                             sort_keys=True).encode("utf-8")).hexdigest()
+    return build
+
+
+def get_mapped_driver_path(driver_file_path):
+    """Return the path under which `build_driver` records a driver in its object, see `DRIVER_SOURCE_DIR`."""
+    return DRIVER_SOURCE_DIR + "/" + os.path.basename(driver_file_path)
+
+
+def restore_driver_path(coverage_export_path, driver_file_path, recorded_path=None):
+    """
+    Rename the driver in an `llvm-cov export` JSON from its mapped path (see `get_mapped_driver_path`) back to its
+    path, so that the coverage of the driver is found under the file that was validated.
+    Args:
+        coverage_export_path (str): Path to the export, rewritten in place.
+        driver_file_path (str): Path to the driver source file.
+        recorded_path (str): Path the driver is recorded under in the export (default: its mapped path), e.g. the
+        path of an identical driver whose validation is reused.
+    """
+    mapped_path = recorded_path or get_mapped_driver_path(driver_file_path)
+    driver_file_path = os.path.abspath(driver_file_path)
+    with open(coverage_export_path, "r") as file:
+        export = json.load(file)
+    renamed = False
+    for data in export.get("data", []):
+        for file_coverage in data.get("files", []):
+            if file_coverage.get("filename") == mapped_path:
+                file_coverage["filename"] = driver_file_path
+                renamed = True
+        for function in data.get("functions", []):
+            if mapped_path in function.get("filenames", []):
+                function["filenames"] = [driver_file_path if name == mapped_path else name
+                                         for name in function["filenames"]]
+                renamed = True
+    if renamed:
+        tmp_path = f"{coverage_export_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(export, file)
+        os.replace(tmp_path, coverage_export_path)
+
+
+def build_driver(driver_file_path, build, target_directory, binary_path):
+    """
+    Compile the driver into an object and link it, see `prepare_incremental_build`. Objects are cached in
+    `OBJECT_CACHE_DIR` (default: `./outputs/cache/objects`) by the build and the name and content of the driver.
+    The directory of the driver is mapped to `DRIVER_SOURCE_DIR` in the object, so identical drivers validated in
+    different work directories share it; `restore_driver_path` maps it back in the coverage export.
+    Args:
+        driver_file_path (str): Path to the driver source file.
+        build (dict): The build of the target.
+        target_directory (str): The directory the compile command is run in.
+        binary_path (str): Path to the driver binary.
+    Returns:
+        bool: Whether the object was taken from the cache.
+    Raises:
+        subprocess.CalledProcessError: If the driver does not compile or link, with the compiler output.
+    """
+    driver_directory, driver_name = os.path.split(os.path.abspath(driver_file_path))
+    with open(driver_file_path, "rb") as file:
+        source = file.read()
+    # the name of the driver is recorded in the object, unlike its directory
+    key = hashlib.sha256(build["key"].encode("utf-8") + b"\0" + driver_name.encode("utf-8") + b"\0"
+                         + source).hexdigest()
+    object_path = os.path.join(os.getenv("OBJECT_CACHE_DIR", DEFAULT_OBJECT_CACHE_DIR), key[:2], key + ".o")
+
+    cached = os.path.exists(object_path)
+    if not cached:
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        tmp_object_path = f"{object_path}.{os.getpid()}.{threading.get_ident()}"
+        prefix_map = f"{driver_directory}={DRIVER_SOURCE_DIR}"
+        tracer.run(build["compile_command"] + [f"-ffile-prefix-map={prefix_map}", f"-fcoverage-prefix-map={prefix_map}",
+                                               "-c", os.path.join(driver_directory, driver_name),
+                                               "-o", tmp_object_path],
+                   cwd=target_directory, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=True)
+        os.replace(tmp_object_path, object_path)
+    tracer.run(build["link_command"] + [object_path, *build["link_inputs"], "-o", binary_path], cwd=target_directory,
+               stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=True)
+    return cached
@@ -0,0 +1,224 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+current_file_path = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_STORE_PATH = current_file_path + "/../outputs/cache/validation/results.sqlite3"
+
+# Version of the table layout, a database with another version is a stale cache and is cleared when opened
+SCHEMA_VERSION = 2
+# Columns of the `validations` table after `key`, with their types
+COLUMNS = {
+    "fingerprint": "TEXT NOT NULL",
+    "target": "TEXT NOT NULL",
+    "compile_command": "TEXT NOT NULL",
+    "result": "TEXT NOT NULL",
+    "coverage": "REAL NOT NULL",
+    "work_dir": "TEXT NOT NULL",
+    "artifacts_dir": "TEXT NOT NULL",
+    "diagnostics": "TEXT NOT NULL",
+    "fuzz_stats": "TEXT NOT NULL",
+    "coverage_totals": "TEXT NOT NULL",
+    "timings": "TEXT NOT NULL",
+    "created": "REAL NOT NULL",
+}
+JSON_COLUMNS = ("compile_command", "fuzz_stats", "coverage_totals", "timings")
+
+
+def make_validation_key(fingerprint, target_file, compile_command, libraries=None, fuzz_budget=None,
+                        public_headers=None, fuzz_jobs=1):
+    """
+    Build the key of a validation result: the same driver validated against the same target with the same libraries
+    and settings gets the same result.
+    Args:
+        fingerprint (str): Fingerprint of the driver, see `candidate_generator/fingerprint.py`.
+        target_file (str): Path to the target file.
+        compile_command (list): The compile command from the configuration.
+        libraries: State of the libraries the driver is linked with: the key of the incremental build (see
+        `prepare_incremental_build`), or the hashes of the prebuilt libraries (see `hash_link_inputs`).
+        fuzz_budget (dict): The fuzzing budget from the configuration.
+        public_headers (list): The public headers from the configuration.
+        fuzz_jobs: The `fuzz_jobs` setting from the configuration.
+    Returns:
+        str: The hex digest used as key.
+    """
+    key = {"fingerprint": fingerprint, "target": os.path.abspath(target_file), "compile_command": compile_command,
+           "libraries": libraries, "fuzz_budget": fuzz_budget, "public_headers": public_headers or [],
+           "fuzz_jobs": fuzz_jobs}
+    payload = json.dumps(key, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ValidationStore:
+    """
+    Persistent store of validation results in SQLite. Besides the result, every validation records its
+    diagnostics, fuzzing statistics, coverage totals and stage timings, so a driver seen in this or an earlier run
+    is not validated again, and the history can be queried across targets. The files a refinement prompt is built
+    from (error log, coverage exports) are copied to an `artifacts` directory next to the database, so a validation
+    can be reused after its work directory was removed.
+    """
+
+    def __init__(self, db_path=DEFAULT_STORE_PATH):
+        """
+        Args:
+            db_path (str): Path to the SQLite database file. The parent directory is created if necessary.
+        """
+        self.db_path = db_path
+        self.artifacts_root = os.path.join(os.path.dirname(os.path.abspath(db_path)), "artifacts")
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self._conn.execute("DROP TABLE IF EXISTS validations")
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS validations (key TEXT PRIMARY KEY, "
+            + ", ".join(f"{name} {definition}" for name, definition in COLUMNS.items()) + ")"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS validations_target ON validations (target, created)")
+        self._conn.commit()
+
+    @staticmethod
+    def _to_dict(row):
+        record = dict(row)
+        for name in JSON_COLUMNS:
+            record[name] = json.loads(record[name] or "null")
+        return record
+
+    def get(self, key):
+        """
+        Return the recorded validation for `key` as a dictionary of the table columns, or None if the driver was
+        never validated or its artifacts were removed.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM validations WHERE key = ?", (key,)).fetchone()
+        # the artifacts are needed for the refinement prompts, the work directory may be gone
+        if row is None or not os.path.isdir(row["artifacts_dir"]):
+            return None
+        return self._to_dict(row)
+
+    def _keep_artifacts(self, key, artifacts):
+        """Copy the existing files of `artifacts` to the artifacts directory of `key`, replacing earlier copies."""
+        artifacts_dir = os.path.join(self.artifacts_root, key[:2], key)
+        tmp_dir = f"{artifacts_dir}.{os.getpid()}.{threading.get_ident()}.tmp"
+        os.makedirs(tmp_dir)
+        for path in artifacts:
+            if os.path.exists(path):
+                shutil.copy(path, tmp_dir)
+        shutil.rmtree(artifacts_dir, ignore_errors=True)
+        try:
+            os.replace(tmp_dir, artifacts_dir)
+        except OSError:
+            # another process stored the same validation in the meantime
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return artifacts_dir
+
+    def put(self, key, fingerprint, result, coverage, work_dir, target_file="", compile_command=None, report=None,
+            artifacts=None):
+        """
+        Record the validation of a driver.
+        Args:
+            key (str): Key from `make_validation_key`.
+            fingerprint (str): Fingerprint of the driver.
+            result (str): Result of `validate_driver`.
+            coverage (float): The coverage percentage, 0 if the driver was not fuzzed.
+            work_dir (str): Work directory of the validation.
+            target_file (str): Path to the target file.
+            compile_command (list): The compile command from the configuration.
+            report (dict): The report filled by `validate_driver`.
+            artifacts (list): Files of the work directory kept with the validation, see `get`; missing ones are
+            skipped.
+        """
+        report = report or {}
+        artifacts_dir = self._keep_artifacts(key, artifacts or [])
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO validations (key, fingerprint, target, compile_command, result, coverage,"
+                " work_dir, artifacts_dir, diagnostics, fuzz_stats, coverage_totals, timings, created)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, fingerprint, os.path.abspath(target_file) if target_file else "",
+                 json.dumps(compile_command or []), result, coverage, work_dir, artifacts_dir,
+                 report.get("diagnostics", ""), json.dumps(report.get("fuzz_stats", {})),
+                 json.dumps(report.get("coverage_totals", {})), json.dumps(report.get("timings", {})), time.time()),
+            )
+            self._conn.commit()
+
+    def history(self, target_file=None, limit=None):
+        """
+        Return the recorded validations, newest first.
+        Args:
+            target_file (str): Only return validations of this target (default: every target).
+            limit (int): Maximum number of validations returned.
+        Returns:
+            list: One dictionary of the table columns per validation.
+        """
+        query = "SELECT * FROM validations"
+        args = []
+        if target_file:
+            query += " WHERE target = ?"
+            args.append(os.path.abspath(target_file))
+        query += " ORDER BY created DESC"
+        if limit:
+            query += " LIMIT ?"
+            args.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, args).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def stage_timings(self, target_file=None):
+        """
+        Aggregate the stage timings of the recorded validations.
+        Args:
+            target_file (str): Only aggregate validations of this target (default: every target).
+        Returns:
+            dict: `{stage: {"count": n, "total": seconds, "mean": seconds, "max": seconds}}`, slowest total first.
+        """
+        stages = {}
+        for record in self.history(target_file):
+            for stage, seconds in (record["timings"] or {}).items():
+                stats = stages.setdefault(stage, {"count": 0, "total": 0.0, "max": 0.0})
+                stats["count"] += 1
+                stats["total"] += seconds
+                stats["max"] = max(stats["max"], seconds)
+        for stats in stages.values():
+            stats["mean"] = stats["total"] / stats["count"]
+        return dict(sorted(stages.items(), key=lambda item: item[1]["total"], reverse=True))
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_store():
+    """
+    Return the process-wide validation store. `VALIDATION_STORE_PATH` sets the database file.
+    """
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = ValidationStore(os.getenv("VALIDATION_STORE_PATH", DEFAULT_STORE_PATH))
+        return _default_store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the validation history and the time spent per stage.")
+    parser.add_argument("--target", help="only show validations of this target file")
+    parser.add_argument("--limit", type=int, default=20, help="number of validations listed")
+    arguments = parser.parse_args()
+
+    store = get_store()
+    print("Time per stage:")
+    for stage, stats in store.stage_timings(arguments.target).items():
+        print(f"  {stage:<14} {stats['count']:>5} runs, total {stats['total']:9.1f}s, "
+              f"mean {stats['mean']:7.2f}s, max {stats['max']:7.2f}s")
+    print("Latest validations:")
+    for record in store.history(arguments.target, arguments.limit):
+        print(f"  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record['created']))} "
+              f"{record['fingerprint'][:12]} {os.path.basename(record['target']) or '-':<20} "
+              f"{record['result']:<20} {record['coverage']:6.2f}%")
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import re
+import threading
+
+from tracing import tracer
+
+PCH_DIR_NAME = ".fuzz_pch"
+# Flags of the compile command that affect parsing. Everything else (sanitizers, profiling, output and link
+# inputs) is irrelevant to a syntax check.
+PARSE_FLAG_PREFIXES = ("-I", "-D", "-U", "-std=", "-isystem", "-include", "-W", "-x")
+PARSE_FLAGS_WITH_VALUE = {"-I", "-D", "-U", "-isystem", "-include", "-x"}
+
+
+def get_parse_flags(compile_command):
+    """
+    Extract the flags that affect parsing from a compile command.
+    Args:
+        compile_command (list): The compile command, starting with the compiler.
+    Returns:
+        list: The parse flags, in their original order.
+    """
+    flags = []
+    args = compile_command[1:]
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg in PARSE_FLAGS_WITH_VALUE and i + 1 < len(args):
+            flags.extend([arg, args[i + 1]])
+            i += 2
+            continue
+        if arg.startswith(PARSE_FLAG_PREFIXES) and not arg.startswith("-Wl,"):
+            flags.append(arg)
+        i += 1
+    return flags
+
+
+def get_include_dirs(compile_command, target_directory):
+    """
+    Return the absolute include directories (`-I` and `-isystem`) of a compile command run in `target_directory`.
+    """
+    include_dirs = []
+    parse_flags = get_parse_flags(compile_command)
+    for i, flag in enumerate(parse_flags):
+        if flag in ("-I", "-isystem") and i + 1 < len(parse_flags):
+            include_dir = parse_flags[i + 1]
+        elif flag.startswith("-I") and flag != "-I":
+            include_dir = flag[2:]
+        elif flag.startswith("-isystem") and flag != "-isystem":
+            include_dir = flag[len("-isystem"):]
+        else:
+            continue
+        include_dirs.append(os.path.normpath(os.path.join(target_directory, include_dir)))
+    return include_dirs
+
+
+def read_dependencies(deps_path, directory):
+    """
+    Read the dependency file written by the compiler with `-MD -MF`.
+    Args:
+        deps_path (str): Path to the dependency file.
+        directory (str): The directory the compiler was run in, relative paths are relative to it.
+    Returns:
+        list: The absolute paths of the files the output depends on.
+    """
+    with open(deps_path, "r") as file:
+        rules = file.read().replace("\\\n", " ")
+    _, _, dependencies = rules.partition(": ")
+    return [os.path.normpath(os.path.join(directory, path.replace("\\ ", " ")))
+            for path in re.split(r"(?<!\\)\s+", dependencies) if path]
+
+
+def stat_dependencies(dependencies):
+    """Return the modification time and size of every dependency of the PCH, None for a missing one."""
+    states = {}
+    for path in dependencies:
+        try:
+            stat = os.stat(path)
+            states[path] = [stat.st_mtime_ns, stat.st_size]
+        except OSError:
+            states[path] = None
+    return states
+
+
+def build_pch(compile_command, public_headers, target_directory, rebuild=False):
+    """
+    Build a precompiled header from the public headers of the target, once per set of flags.
+
+    The header and the PCH are stored in `.fuzz_pch/` in the target directory and rebuilt only when the compiler,
+    the parse flags or the header list change, or when one of the headers it includes (directly or not) was
+    modified, e.g. by the prebuild.
+    Args:
+        compile_command (list): The compile command from the configuration.
+        public_headers (list): The public headers of the target, e.g. `["png.h"]`.
+        target_directory (str): The directory the compile command is run in.
+        rebuild (bool): Rebuild the PCH even if it is up to date, e.g. after the compiler rejected it.
+    Returns:
+        str: Path to the PCH file, or None if there are no public headers or the PCH cannot be built.
+    """
+    if not public_headers:
+        return None
+
+    compiler = compile_command[0]
+    parse_flags = get_parse_flags(compile_command)
+    key = hashlib.sha256("\n".join([compiler] + parse_flags + list(public_headers)).encode("utf-8")).hexdigest()
+
+    pch_dir = os.path.join(os.path.abspath(target_directory), PCH_DIR_NAME)
+    header_path = os.path.join(pch_dir, "fuzz_pch.h")
+    pch_path = header_path + ".pch"
+    # the key and the state of the headers the PCH was built from
+    key_path = os.path.join(pch_dir, "key.json")
+    if not rebuild and os.path.exists(pch_path) and os.path.exists(key_path):
+        with open(key_path, "r") as file:
+            recorded = json.load(file)
+        if recorded["key"] == key and stat_dependencies(recorded["dependencies"]) == recorded["dependencies"]:
+            return pch_path
+
+    # concurrent validations of the same target may build the PCH at the same time: build under a unique name
+    # and move the result into place atomically
+    os.makedirs(pch_dir, exist_ok=True)
+    suffix = f".{os.getpid()}.{threading.get_ident()}"
+    with open(header_path + suffix, "w") as file:
+        for header in public_headers:
+            file.write(f"#include <{header}>\n")
+    os.replace(header_path + suffix, header_path)
+    tmp_pch_path = pch_path + suffix
+    deps_path = os.path.join(pch_dir, "deps" + suffix)
+    result = tracer.run([compiler] + parse_flags + ["-x", "c-header", header_path, "-o", tmp_pch_path,
+                                                    "-MD", "-MF", deps_path],
+                        cwd=target_directory, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"Failed to build the precompiled header, syntax checks run without it:\n{result.stderr}")
+        return None
+    dependencies = [path for path in read_dependencies(deps_path, os.path.abspath(target_directory))
+                    if path != header_path]
+    os.remove(deps_path)
+    os.replace(tmp_pch_path, pch_path)
+    with open(key_path + suffix, "w") as file:
+        json.dump({"key": key, "dependencies": stat_dependencies(dependencies)}, file)
+    os.replace(key_path + suffix, key_path)
+    return pch_path
+
+
+def syntax_check(driver_file_path, compile_command, target_directory, pch_path=None, public_headers=None):
+    """
+    Run a `-fsyntax-only` pass over the driver with the parse flags of the compile command.
+    Args:
+        driver_file_path (str): Path to the driver source file.
+        compile_command (list): The compile command from the configuration.
+        target_directory (str): The directory the compile command is run in.
+        pch_path (str): Optional precompiled header built by `build_pch`.
+        public_headers (list): The headers the PCH was built from, to rebuild it when the compiler rejects it.
+    Returns:
+        tuple: (passed, diagnostics), where `diagnostics` is the compiler output.
+    """
+    command = [compile_command[0], "-fsyntax-only"] + get_parse_flags(compile_command)
+    if pch_path:
+        command += ["-include-pch", pch_path]
+    result = tracer.run(command + [driver_file_path], cwd=target_directory, capture_output=True, text=True)
+    if result.returncode != 0 and pch_path and "precompiled header" in result.stderr:
+        # stale or incompatible PCH: rebuild it for the next checks, and fall back to a plain syntax check
+        if public_headers:
+            build_pch(compile_command, public_headers, target_directory, rebuild=True)
+        return syntax_check(driver_file_path, compile_command, target_directory)
+    return result.returncode == 0, result.stdout + result.stderr
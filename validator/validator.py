@@ -1,43 +1,158 @@
+import glob
 import os
 import subprocess
+import tempfile
+import time
 
 from refiner.cov_extractor import check_coverage
+from refiner.cov_model import parse_coverage_export
+from scheduler.stages import stage_slot
+from tracing import tracer
+from validator.corpus import merge_corpus, snapshot_corpus
+from validator.fuzz_runner import get_fuzz_jobs, run_fuzzer
+from validator.incremental_build import build_driver, restore_driver_path
+from validator.syntax_check import build_pch, syntax_check
 
-def validate_driver(driver_file_path: str, compile_command: list) -> str:
+# Artifact names inside a validation work directory
+ERROR_LOG_NAME = "error_log.txt"
+COVERAGE_SUMMARY_NAME = "coverage.json"
+COVERAGE_EXPORT_NAME = "coverage_functions.json"
+DRIVER_BINARY_NAME = "driver"
+FUZZ_LOG_NAME = "fuzz.log"
+RUN_CORPUS_NAME = "corpus"
+# Artifacts the refinement prompts are built from, kept by the validation store
+VALIDATION_ARTIFACTS = (ERROR_LOG_NAME, COVERAGE_SUMMARY_NAME, COVERAGE_EXPORT_NAME)
+
+SOURCE_SUFFIXES = (".c", ".cc", ".cpp", ".cxx")
+
+
+def prepare_compile_command(compile_command: list, driver_file_path: str, binary_path: str) -> list:
+    """
+    Rewrite the configured compile command so that it compiles `driver_file_path` into `binary_path`. The source
+    file and the `-o` output of the configured command are replaced; all other arguments (include paths, libraries)
+    keep their meaning because the command is still run in the target directory.
+    """
+    command = [compile_command[0]]
+    source_replaced = False
+    args = compile_command[1:]
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg == "-o" and i + 1 < len(args):
+            command += ["-o", binary_path]
+            i += 2
+            continue
+        if not arg.startswith("-") and arg.endswith(SOURCE_SUFFIXES):
+            if not source_replaced:
+                command.append(driver_file_path)
+                source_replaced = True
+        else:
+            command.append(arg)
+        i += 1
+    if not source_replaced:
+        command.append(driver_file_path)
+    if "-o" not in command:
+        command += ["-o", binary_path]
+    return command
+
+
+def export_function_coverage(work_dir: str, driver_file_path: str) -> str:
+    """
+    Write the full `llvm-cov export` of a validated driver, which includes the regions of every function. It is only
+    produced for drivers with low coverage, whose coverage refinement prompt needs it.
+    Args:
+        work_dir (str): Work directory of the validation.
+        driver_file_path (str): Path to the validated driver source file.
+    Returns:
+        str: Path to the export (`coverage_functions.json` in the work directory).
+    """
+    coverage_export_path = os.path.join(work_dir, COVERAGE_EXPORT_NAME)
+    with open(coverage_export_path, 'w') as export_file:
+        tracer.run([
+            'llvm-cov', 'export', os.path.join(work_dir, DRIVER_BINARY_NAME),
+            f'-instr-profile={os.path.join(work_dir, "default.profdata")}',
+        ], stdout=export_file, cwd=work_dir, check=True)
+    restore_driver_path(coverage_export_path, driver_file_path)
+    return coverage_export_path
+
+
+@tracer.traced()
+def validate_driver(driver_file_path: str, compile_command: list, public_headers: list = None,
+                    target_directory: str = None, work_dir: str = None, fuzz_budget: dict = None,
+                    report: dict = None, corpus_dir: str = None, fuzz_jobs=1, build: dict = None,
+                    concurrent_runs: int = 1) -> str:
     """
     Validate the input driver. Return `Valid Driver`, `Compilation Error`, or `Low Coverage` according to the
     validation result.
 
+    Every validation runs in its own work directory, and every subprocess gets an explicit working directory, so
+    several drivers (of the same or different targets) can be validated at the same time. The work directory holds
+    the error log (`error_log.txt`), the coverage summary (`coverage.json`), the driver binary, the profiles and any
+    crash inputs.
+
     The procedure includes:
         - Check if the driver file exists and is not empty
-        - Try to compile the driver code. If the compilation fails, write the error to the log file in
-        'outputs/temp/error_logs/raw_error_log.txt', and return `Compilation Error`
-        - Try to run the driver code.
-        - Generate the coverage report using `llvm-cov`. Write the coverage report to the file in
-        'outputs/temp/coverage/raw_coverage.txt'.
+        - Run a cheap `-fsyntax-only` pass, using a precompiled header of `public_headers` when given. If it fails,
+        write the diagnostics to the log file and return `Compilation Error` without the instrumented build.
+        - Try to compile the driver code in the target directory. With an incremental `build`, only the driver is
+        compiled (or taken from the object cache) and linked against the instrumented libraries, see
+        `validator/incremental_build.py`. If the compilation fails, write the error to the log file and return
+        `Compilation Error`
+        - Try to run the driver code in the work directory. The run stops early once libFuzzer's coverage stops
+        growing, see `validator/fuzz_runner.py`. With a shared corpus, the run starts from a snapshot of it, and
+        its new inputs are merged back with `-merge=1` afterwards, see `validator/corpus.py`.
+        - Generate the coverage summary using `llvm-cov export -summary-only`.
         - Check the coverage of the driver code. Use method in `refiner/cov_extractor.py` to check whether the coverage
         satisfies the required threshold. If the coverage is less than the threshold, return `Low Coverage`.
         - If the driver is valid, return `Valid Driver`.
+
+    Args:
+        driver_file_path (str): Path to the driver source file.
+        compile_command (list): The compile command from the configuration.
+        public_headers (list): Public headers of the target, precompiled for the syntax check.
+        target_directory (str): Directory the compile command is run in (default: the directory of the driver).
+        work_dir (str): Work directory of this validation (default: a temporary directory, removed afterwards).
+        fuzz_budget (dict): Adaptive fuzzing budget, `min_seconds`, `max_seconds` and `plateau_seconds`
+        (default: a fixed 60 seconds).
+        report (dict): Optional dictionary filled with the details of the validation: `timings` (seconds per stage),
+        `diagnostics` (compiler or fuzzer output of a failure), `fuzz_stats` (see `run_fuzzer`) and `coverage_totals`
+        (count, covered and percent of lines, functions, regions and branches).
+        corpus_dir (str): Shared corpus of the target (default: the fuzzer starts without a corpus).
+        fuzz_jobs: Number of libFuzzer processes of the run, see `run_fuzzer`, or `auto` to share the cores between
+        the fuzzer runs, resolved by `get_fuzz_jobs` when the run starts (default: 1).
+        build (dict): Incremental build of the target, see `prepare_incremental_build` (default: the compile
+        command is run as configured).
+        concurrent_runs (int): Number of fuzzer runs expected at the same time, for `fuzz_jobs: auto`.
     """
-    current_file_path = os.path.dirname(os.path.abspath(__file__))
-    log_file_path = current_file_path + '/../outputs/temp/error_logs/raw_error_log.txt'
-    dir_path = os.path.dirname(log_file_path)
+    driver_file_path = os.path.abspath(driver_file_path)
+    if target_directory is None:
+        target_directory = os.path.dirname(driver_file_path)
+    if work_dir is None:
+        # the caller cannot find the artifacts of a temporary work directory, so it is removed with the validation
+        with tempfile.TemporaryDirectory(prefix="validate_") as temporary_dir:
+            return _validate_in_work_dir(driver_file_path, compile_command, public_headers, target_directory,
+                                         temporary_dir, fuzz_budget, report, corpus_dir, fuzz_jobs, build,
+                                         concurrent_runs)
+    work_dir = os.path.abspath(work_dir)
+    os.makedirs(work_dir, exist_ok=True)
+    return _validate_in_work_dir(driver_file_path, compile_command, public_headers, target_directory, work_dir,
+                                 fuzz_budget, report, corpus_dir, fuzz_jobs, build, concurrent_runs)
 
-    # 创建并初始化普通日志文件
-    try:
-        if not os.path.exists(dir_path):
-            print(f"Directory {dir_path} does not exist. Creating...")
-            os.makedirs(dir_path, exist_ok=True)  # 确保安全创建
-        else:
-            print(f"Directory {dir_path} already exists.")
 
-        # 确保能够创建文件
-        with open(log_file_path, 'w') as file:
-            file.write("")
-            print(f"File {log_file_path} created and initialized.")
+def _validate_in_work_dir(driver_file_path, compile_command, public_headers, target_directory, work_dir,
+                          fuzz_budget, report, corpus_dir, fuzz_jobs, build, concurrent_runs):
 
-    except Exception as e:
-        print(f"An error occurred: {e}")
+    log_file_path = os.path.join(work_dir, ERROR_LOG_NAME)
+    coverage_summary_path = os.path.join(work_dir, COVERAGE_SUMMARY_NAME)
+    binary_path = os.path.join(work_dir, DRIVER_BINARY_NAME)
+    # one profile per process, libFuzzer's fork mode runs several
+    profraw_pattern = os.path.join(work_dir, "default-%p.profraw")
+    profdata_path = os.path.join(work_dir, "default.profdata")
+    with open(log_file_path, 'w'):
+        pass
+    if report is None:
+        report = {}
+    timings = report.setdefault("timings", {})
 
     # Step 1: Check if the driver file exists and is not empty
     if not os.path.exists(driver_file_path):
@@ -50,76 +165,127 @@ def validate_driver(driver_file_path: str, compile_command: list) -> str:
             log_file.write(f"Driver file {driver_file_path} is empty.\n")
         return "Compilation Error"
 
-    # Step 2: Try to compile the driver code
-    try:
-        os.chdir(os.path.dirname(driver_file_path))
-        subprocess.check_output(compile_command, stderr=subprocess.STDOUT)  # 将stderr合并到stdout中
-    except subprocess.CalledProcessError as e:
-        error_message = e.output.decode() if e.output else "No output captured"
+    # Step 2: Syntax check first, most candidates fail here and the full instrumented build is expensive
+    with stage_slot("compile"), tracer.span("syntax_check"):
+        start = time.monotonic()
+        pch_path = build_pch(compile_command, public_headers, target_directory)
+        passed, diagnostics = syntax_check(driver_file_path, compile_command, target_directory, pch_path,
+                                           public_headers)
+        timings["syntax_check"] = time.monotonic() - start
+    if not passed:
+        report["diagnostics"] = diagnostics
         with open(log_file_path, 'a') as log_file:
-            log_file.write(f"Compilation error for {driver_file_path}: {e}\n")
-            log_file.write(f"Error details: {error_message}\n")
+            log_file.write(f"Compilation error for {driver_file_path}: syntax check failed\n")
+            log_file.write(f"Error details: {diagnostics}\n")
         return "Compilation Error"
 
-    # Step 3: Try to run the driver code
-    try:
-        env = os.environ.copy()
-        env["LLVM_PROFILE_FILE"] = "default.profraw"
-        # 运行命令
-        subprocess.check_call(['./driver', '-max_total_time=60'], env=env)
-    except subprocess.CalledProcessError as e:
+    # Step 3: Try to compile the driver code
+    with stage_slot("compile"), tracer.span("compile", incremental=build is not None) as compile_span:
+        start = time.monotonic()
+        try:
+            if build:
+                compile_span["object_cached"] = build_driver(driver_file_path, build, target_directory, binary_path)
+            else:
+                tracer.run(prepare_compile_command(compile_command, driver_file_path, binary_path),
+                           cwd=target_directory, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                           check=True)  # 将stderr合并到stdout中
+        except subprocess.CalledProcessError as e:
+            timings["compile"] = time.monotonic() - start
+            error_message = e.output.decode() if e.output else "No output captured"
+            report["diagnostics"] = error_message
+            with open(log_file_path, 'a') as log_file:
+                log_file.write(f"Compilation error for {driver_file_path}: {e}\n")
+                log_file.write(f"Error details: {error_message}\n")
+            return "Compilation Error"
+        timings["compile"] = time.monotonic() - start
+
+    # Step 4: Try to run the driver code, stopping early once the coverage plateaus
+    env = os.environ.copy()
+    env["LLVM_PROFILE_FILE"] = profraw_pattern
+    fuzz_command = [binary_path]
+    run_corpus_dir = os.path.join(work_dir, RUN_CORPUS_NAME)
+    if corpus_dir:
+        snapshot_corpus(corpus_dir, run_corpus_dir)
+        fuzz_command.append(run_corpus_dir)
+    with stage_slot("fuzz"):
+        # resolved once the slot is held, so that `auto` counts the fuzzer runs active at that moment
+        fuzz_jobs = get_fuzz_jobs(fuzz_jobs, concurrent_runs)
+        with tracer.span("fuzz", jobs=fuzz_jobs) as fuzz_span:
+            fuzz_stats = run_fuzzer(fuzz_command, work_dir, env, fuzz_budget, os.path.join(work_dir, FUZZ_LOG_NAME),
+                                    fuzz_jobs)
+            fuzz_span.update(execs=fuzz_stats["execs"], cov=fuzz_stats["cov"], ft=fuzz_stats["ft"])
+    timings["fuzz"] = fuzz_stats["elapsed"]
+    report["fuzz_stats"] = {name: value for name, value in fuzz_stats.items() if name != "output_tail"}
+    report["fuzz_stats"]["jobs"] = fuzz_jobs
+    print(f"Fuzzed {driver_file_path} for {fuzz_stats['elapsed']:.1f}s with {fuzz_jobs} job(s): "
+          f"{fuzz_stats['execs']} execs, cov: {fuzz_stats['cov']}, ft: {fuzz_stats['ft']}"
+          + (" (stopped on coverage plateau)" if fuzz_stats["stopped_early"] else ""))
+    if fuzz_stats["returncode"] != 0:
+        report["diagnostics"] = fuzz_stats["output_tail"]
         with open(log_file_path, 'a') as log_file:
-            log_file.write(f"Runtime error for {driver_file_path}: {e}\n")
+            log_file.write(f"Runtime error for {driver_file_path}: fuzzer exited with status "
+                           f"{fuzz_stats['returncode']}\n")
+            log_file.write(f"Error details: {fuzz_stats['output_tail']}\n")
         return "Runtime Error"
+    if corpus_dir:
+        start = time.monotonic()
+        with tracer.span("corpus_merge"):
+            merged = merge_corpus(binary_path, corpus_dir, run_corpus_dir, work_dir, env)
+        if not merged:
+            print(f"Merging the corpus of {driver_file_path} into {corpus_dir} failed, the shared corpus keeps its "
+                  f"previous inputs.")
+        timings["corpus_merge"] = time.monotonic() - start
 
-    # Step 4: Generate the coverage report using llvm-cov
-    coverage_report_dir_path = current_file_path + '/../outputs/temp/coverage/'
-    # 创建并初始化普通日志文件
-    if not os.path.exists(coverage_report_dir_path):
-        print(f"Directory {coverage_report_dir_path} does not exist. Creating...")
-        os.makedirs(coverage_report_dir_path, exist_ok=True)  # 确保安全创建
-    else:
-        print(f"Directory {coverage_report_dir_path} already exists.")
-    coverage_report_path = current_file_path + '/../outputs/temp/coverage/raw_coverage.txt'
-    if not os.path.exists(coverage_report_path):
-        with open(coverage_report_path, 'w'):  # 创建一个空文件
-            pass
-
+    # Step 5: Generate the coverage summary using llvm-cov. The per-function export is only produced on demand by
+    # `export_function_coverage`
+    start = time.monotonic()
+    profraw_paths = sorted(glob.glob(os.path.join(work_dir, "default-*.profraw")))
+    if not profraw_paths:
+        with open(log_file_path, 'a') as log_file:
+            log_file.write(f"Coverage report generation failed for {driver_file_path}: no profile was written\n")
+        return "Coverage Generation Failed"
     try:
-        with open(coverage_report_path, 'w') as report_file:
-            subprocess.check_call([
-                'llvm-profdata', 'merge', '-sparse', 'default.profraw', '-o', 'default.profdata'
-            ], stdout=report_file)
-            subprocess.check_call([
-                'echo', '"Detailed report:\n"'
-            ], stdout=report_file)
-            subprocess.check_call([
-                'llvm-cov','show', './driver',
-                '-instr-profile=default.profdata',
-            ], stdout=report_file)
-            subprocess.check_call([
-                'echo', '"Summary report:\n"'
-            ], stdout=report_file)
-            subprocess.check_call([
-                'llvm-cov', 'report', './driver',
-                '-instr-profile=default.profdata',
-            ], stdout=report_file)
+        with tracer.span("coverage"):
+            tracer.run([
+                'llvm-profdata', 'merge', '-sparse', *profraw_paths, '-o', profdata_path
+            ], cwd=work_dir, check=True)
+            with open(coverage_summary_path, 'w') as summary_file:
+                tracer.run([
+                    'llvm-cov', 'export', binary_path,
+                    f'-instr-profile={profdata_path}',
+                    '-summary-only',
+                ], stdout=summary_file, cwd=work_dir, check=True)
+            restore_driver_path(coverage_summary_path, driver_file_path)
     except subprocess.CalledProcessError as e:
         with open(log_file_path, 'a') as log_file:
             log_file.write(f"Coverage report generation failed for {driver_file_path}: {e}\n")
         return "Coverage Generation Failed"
+    finally:
+        timings["coverage"] = time.monotonic() - start
 
-    # Step 5: Check if the coverage meets the required threshold
+    # Step 6: Check if the coverage meets the required threshold
     try:
-        coverage = check_coverage(coverage_report_path)
+        # the threshold applies to the driver's own code, the instrumented libraries of an incremental build only
+        # count for the ranking of the candidates and the uncovered-code digest
+        coverage = check_coverage(coverage_summary_path, [driver_file_path])
         if isinstance(coverage, str) and "Error" in coverage:
             with open(log_file_path, 'a') as log_file:
                 log_file.write(f"Error extracting coverage for {driver_file_path}: {coverage}\n")
             return "Coverage Extraction Failed"
+        totals = parse_coverage_export(coverage_summary_path).totals
+        report["coverage_totals"] = {metric: dict(vars(getattr(totals, metric)))
+                                     for metric in ("lines", "functions", "regions", "branches")}
 
         if not coverage:
             with open(log_file_path, 'a') as log_file:
                 log_file.write(f"Coverage is too low for {driver_file_path}: {coverage}%\n")
+            # kept with the validation, the coverage refinement prompt is built from it
+            try:
+                with tracer.span("coverage_export"):
+                    export_function_coverage(work_dir, driver_file_path)
+            except subprocess.CalledProcessError as e:
+                with open(log_file_path, 'a') as log_file:
+                    log_file.write(f"Full coverage export failed for {driver_file_path}: {e}\n")
             return "Low Coverage"
 
     except Exception as e:
@@ -127,4 +293,4 @@ def validate_driver(driver_file_path: str, compile_command: list) -> str:
             log_file.write(f"Error while checking coverage for {driver_file_path}: {e}\n")
         return "Coverage Check Failed"
 
-    return "Valid Driver"
\ No newline at end of file
+    return "Valid Driver"